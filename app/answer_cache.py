@@ -0,0 +1,278 @@
+import io
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+import numpy as np
+
+from config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIMILARITY_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES
+from config import ANSWER_CACHE_TTL, ANSWER_CACHE_PATH, ENCODER_ID, GROUND_TRUTH_PATH
+from caches import normalize_query
+from search_cache import GenerationWatcher
+
+logger = logging.getLogger(__name__)
+
+# Version of the saved cache file format, a file with another version is ignored
+ANSWER_CACHE_VERSION = 2
+
+
+# Cached answers of one playlist and search type. Normalized question vectors are rows of a float32 matrix,
+# so a semantic lookup is one matrix-vector product. Entries which were cached without a vector
+# (no encoder was loaded) are found only by the exact match. The arrays grow up to max_entries rows,
+# then rows of expired entries are reused first and the least recently used entry is evicted.
+class AnswerGroup:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        capacity = min(16, max_entries)
+        # The matrix is allocated when the first vector is put, its size is the size of the vector
+        self.vectors = None
+        self.has_vector = np.zeros(capacity, dtype=bool)
+        self.expires_at = np.zeros(capacity)
+        self.last_used = np.zeros(capacity)
+        self.questions = []
+        self.values = []
+        # Row of every normalized question, for the exact match lookup
+        self.rows = {}
+
+    # Row for a new entry of the question
+    def allocate_row(self, question, now):
+        row = self.rows.get(question)
+        if row is not None:
+            return row
+        size = len(self.questions)
+        expired = np.flatnonzero(self.expires_at[:size] < now)
+        if len(expired):
+            row = int(expired[0])
+        elif size < self.max_entries:
+            if size == len(self.expires_at):
+                capacity = min(2 * size, self.max_entries)
+                if self.vectors is not None:
+                    self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+                self.has_vector = np.resize(self.has_vector, capacity)
+                self.expires_at = np.resize(self.expires_at, capacity)
+                self.last_used = np.resize(self.last_used, capacity)
+            self.questions.append(None)
+            self.values.append(None)
+            return size
+        else:
+            row = int(np.argmin(self.last_used[:size]))
+        del self.rows[self.questions[row]]
+        return row
+
+    def put(self, question, vector, value, ttl, now):
+        row = self.allocate_row(question, now)
+        if vector is not None:
+            if self.vectors is None:
+                self.vectors = np.zeros((len(self.expires_at), len(vector)), dtype=np.float32)
+            self.vectors[row] = vector
+        self.has_vector[row] = vector is not None
+        self.expires_at[row] = now + ttl
+        self.last_used[row] = now
+        self.questions[row] = question
+        self.values[row] = value
+        self.rows[question] = row
+
+    # Exact match of the normalized question, returns (row, similarity) or None
+    def exact_match(self, question, now):
+        row = self.rows.get(question)
+        if row is None or self.expires_at[row] < now:
+            return None
+        return row, 1.0
+
+    # The most similar question above the threshold, returns (row, similarity) or None
+    def nearest(self, vector, threshold, now):
+        size = len(self.questions)
+        if self.vectors is None or size == 0:
+            return None
+        scores = self.vectors[:size] @ vector
+        scores[~self.has_vector[:size] | (self.expires_at[:size] < now)] = -np.inf
+        row = int(np.argmax(scores))
+        if scores[row] < threshold:
+            return None
+        return row, float(scores[row])
+
+    def __len__(self):
+        return len(self.questions)
+
+
+# Semantic cache of answers in front of the RAG pipeline: a question which is the same (after normalization)
+# or similar enough to an answered question of the same playlist and search type gets the cached answer
+# without search and LLM calls. The cache is cleared when the index generation changes (after a reindex).
+# Questions are encoded only when can_encode_fn() is true (e.g. the encoder is already loaded for the search),
+# otherwise only the exact match is used, so the cache never loads the encoder by itself.
+class SemanticAnswerCache:
+    def __init__(self, encode_fn, generation_fn, can_encode_fn=lambda: True,
+                 threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL):
+        self.encode_fn = encode_fn
+        self.can_encode_fn = can_encode_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.watcher = GenerationWatcher(generation_fn, self.invalidate)
+        self.groups = {}
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def invalidate(self, generation):
+        logger.info(f"Index generation was changed to {generation}, the answer cache is cleared.")
+        self.clear()
+
+    # Normalized vector of the question (vectors of repeated questions come from the query embedding cache),
+    # None if the question can't be encoded now
+    def encode(self, query):
+        if not self.can_encode_fn():
+            return None
+        vector = np.asarray(self.encode_fn(query), dtype=np.float32)
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+    # Get the cached answer of the question, returns (value, similarity, cached question) or None.
+    # The exact match is checked first, the question is encoded only if the group has entries with vectors.
+    def get(self, query, playlist, search_type):
+        self.watcher.generation()
+        question, now = normalize_query(query), time.time()
+        with self.lock:
+            group = self.groups.get((playlist, search_type))
+            match = group.exact_match(question, now) if group else None
+            if match is None and (group is None or group.vectors is None):
+                self.misses += 1
+                return None
+        if match is None:
+            vector = self.encode(query)
+            if vector is not None:
+                with self.lock:
+                    match = group.nearest(vector, self.threshold, now)
+
+        with self.lock:
+            if match is None:
+                self.misses += 1
+                return None
+            row, similarity = match
+            if similarity == 1.0 and group.questions[row] == question:
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            group.last_used[row] = now
+            return group.values[row], similarity, group.questions[row]
+
+    def put(self, query, playlist, search_type, value):
+        self.watcher.generation()
+        vector = self.encode(query)
+        with self.lock:
+            group = self.groups.get((playlist, search_type))
+            if group is None:
+                group = self.groups[(playlist, search_type)] = AnswerGroup(self.max_entries)
+            group.put(normalize_query(query), vector, value, self.ttl, time.time())
+
+    def clear(self):
+        with self.lock:
+            self.groups.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "size": sum(len(group.rows) for group in self.groups.values()),
+                "generation": self.watcher.current_generation,
+            }
+
+    # Save the cache into one npz file: question vectors of every group and a JSON blob with the entries
+    def save(self, path=ANSWER_CACHE_PATH):
+        arrays = {}
+        groups = []
+        with self.lock:
+            for i, ((playlist, search_type), group) in enumerate(self.groups.items()):
+                rows = sorted(group.rows.values())
+                arrays[f"{i}.vectors"] = group.vectors[rows] if group.vectors is not None else np.zeros((len(rows), 0))
+                groups.append({
+                    "playlist": playlist,
+                    "search_type": search_type,
+                    "questions": [group.questions[row] for row in rows],
+                    "has_vector": group.has_vector[rows].tolist(),
+                    "values": [group.values[row] for row in rows],
+                    "expires_at": group.expires_at[rows].tolist(),
+                })
+        meta = {"version": ANSWER_CACHE_VERSION, "model": ENCODER_ID,
+                "generation": self.watcher.current_generation, "groups": groups}
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        with open(temp_path, 'wb') as file:
+            file.write(buffer.getvalue())
+        os.replace(temp_path, path)
+        logger.info(f"Answer cache was saved to {path} ({sum(len(group['questions']) for group in groups)} entries).")
+
+    # Load the entries saved by save(), entries of another encoder or file version are ignored.
+    # The saved generation is checked on the next lookup, so the entries are dropped if the index was rebuilt.
+    def load(self, path=ANSWER_CACHE_PATH):
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes())
+            if meta.get("version") != ANSWER_CACHE_VERSION or meta.get("model") != ENCODER_ID:
+                logger.warning(f"Answer cache {path} was saved with another encoder or format, it is ignored.")
+                return
+            vectors = [data[f"{i}.vectors"] for i in range(len(meta["groups"]))]
+
+        now = time.time()
+        with self.lock:
+            for group_meta, group_vectors in zip(meta["groups"], vectors):
+                key = (group_meta["playlist"], group_meta["search_type"])
+                group = self.groups.get(key) or AnswerGroup(self.max_entries)
+                self.groups[key] = group
+                for question, vector, has_vector, value, expires_at in zip(
+                        group_meta["questions"], group_vectors, group_meta["has_vector"],
+                        group_meta["values"], group_meta["expires_at"]):
+                    if expires_at >= now:
+                        group.put(question, vector if has_vector else None, value, expires_at - now, now)
+        self.watcher.current_generation = meta["generation"]
+        logger.info(f"Answer cache was loaded from {path}: {self.stats()['size']} entries.")
+
+
+# Create the answer cache (None if it is disabled), the entries saved by the warm-up are loaded if the file exists
+def create_answer_cache(encode_fn, generation_fn, can_encode_fn=lambda: True, enabled=ANSWER_CACHE_ENABLED,
+                        path=ANSWER_CACHE_PATH):
+    if not enabled:
+        return None
+    cache = SemanticAnswerCache(encode_fn, generation_fn, can_encode_fn)
+    if path and os.path.exists(path):
+        try:
+            cache.load(path)
+        except Exception as e:
+            logger.error(f"Failed to load the answer cache from {path}: {str(e)}")
+    return cache
+
+# Warm up the answer cache with the ground truth questions (every question which is not cached yet
+# is answered by the LLM once) and save it, so that app processes load the answers on start
+def warm_up_answer_cache(search_type="Text", limit=None, path=ANSWER_CACHE_PATH):
+    import rag
+
+    if rag.answer_cache is None:
+        raise ValueError("Answer cache is disabled (ANSWER_CACHE_ENABLED=false).")
+    with open(GROUND_TRUTH_PATH, 'r') as file:
+        ground_truth = json.load(file)
+    ground_truth = ground_truth[:limit] if limit else ground_truth
+
+    start_time = time.perf_counter()
+    for i, item in enumerate(ground_truth):
+        try:
+            rag.get_answer(item["questions"], item["playlist"], search_type)
+        except Exception as e:
+            logger.error(f"Failed to answer the ground truth question {item['questions']}: {str(e)}")
+        if (i + 1) % 100 == 0:
+            rag.answer_cache.save(path)
+            logger.info(f"{i + 1} of {len(ground_truth)} ground truth questions were processed.")
+    rag.answer_cache.save(path)
+    logger.info(f"Answer cache was warmed up in {time.perf_counter() - start_time:.0f} s: {rag.answer_cache.stats()}")
+
+
+if __name__ == "__main__":
+    # Usage: python answer_cache.py [search type] [number of ground truth questions]
+    warm_up_answer_cache(sys.argv[1] if len(sys.argv) > 1 else "Text",
+                         int(sys.argv[2]) if len(sys.argv) > 2 else None)
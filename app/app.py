@@ -4,11 +4,24 @@ import uuid
 
 from config import APP_LOGS_PATH
 from config import setup_logging
-from rag import get_answer
+from rag import get_answer_stream, warm_up
 from db import save_conversation, save_feedback, get_recent_conversations, get_feedback_stats
+from evaluation_queue import submit_evaluation
 
 logger = setup_logging(APP_LOGS_PATH)
 
+# Warm up the search once per app process, Streamlit reruns of the script reuse the result
+@st.cache_resource
+def warm_up_app():
+    try:
+        app_readiness = warm_up()
+    except Exception as e:
+        # The components are loaded by the first question then
+        logger.error(f"App warm-up failed: {str(e)}")
+        return None
+    logger.info(f"App readiness: {app_readiness}")
+    return app_readiness
+
 def main():
     
     logger.info("Starting YouTube Browser streamlit app .....")
@@ -16,6 +29,8 @@ def main():
     # Set the page configuration
     st.set_page_config(page_title="YouTube Browser", page_icon="🔍", layout="centered")
     
+    warm_up_app()
+    
     # Session state initialization
     if "conversation_id" not in st.session_state:
         st.session_state.conversation_id = str(uuid.uuid4())
@@ -80,7 +95,7 @@ def main():
         )
         logger.info(f"The following playlist has been selected: {playlist}")
         
-        # search_type = st.radio("Choose the method of search:", ["Text", "Vector"])
+        # search_type = st.radio("Choose the method of search:", ["Text", "Vector", "Hybrid"])
         search_type = "Text"
         # openai_key = st.text_input(label="Your OpenAI API key", help="If you have your own API key, please use it. Your API key will not be stored anywhere.")
         
@@ -154,18 +169,25 @@ def main():
         
         logger.info(f"User asked: '{user_input}'")
         try:
-            with st.spinner("AI generating awesome answer for you...⏳"):
+            with st.spinner("AI searching the videos for you...⏳"):
                 logger.info(f"Getting answer from YouTube Browser using {search_type} search")
                 
                 start_time = time.time()
-                answer_data = get_answer(user_input, playlist, search_type)
-                end_time = time.time()
-                logger.info(f"Answer received in {end_time - start_time:.2f} seconds.")
-                st.success("AI found the answer! Check it out!")
-                st.write(answer_data["answer"])
+                answer_stream, answer_data = get_answer_stream(user_input, playlist, search_type)
+            
+            # The answer is rendered token by token while it is being generated
+            st.write_stream(answer_stream)
+            end_time = time.time()
+            logger.info(f"Answer received in {end_time - start_time:.2f} seconds "
+                        f"(first token in {answer_data['first_token_time'] or 0:.2f} seconds).")
+            st.success("AI found the answer! Check it out!")
 
-                # Save conversation to database
-                save_conversation(st.session_state.conversation_id, user_input, answer_data, playlist)
+            # Save conversation to database
+            save_conversation(st.session_state.conversation_id, user_input, answer_data, playlist)
+            # The relevance is evaluated in the background and updated in the saved conversation
+            # (answers from the answer cache are not evaluated)
+            if not answer_data.get("cache_hit"):
+                submit_evaluation(st.session_state.conversation_id, user_input, answer_data["answer"])
                 
         except Exception as e:
             st.error("Sorry, there was an issue generating the answer. Please try again later.")
@@ -198,7 +220,7 @@ def main():
     # Display recent conversations
     st.subheader("Recent Conversations")
     relevance_filter = st.selectbox(
-        "Filter by relevance (5 last conversations):", [" ", "All", "RELEVANT", "PARTICULARLY_RELEVANT", "NOT_RELEVANT"]
+        "Filter by relevance (5 last conversations):", [" ", "All", "RELEVANT", "PARTICULARLY_RELEVANT", "NOT_RELEVANT", "PENDING", "EVALUATING", "CACHED"]
     )
     
     if relevance_filter != " ":
@@ -0,0 +1,488 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import urllib.request
+import multiprocessing as mp
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from elasticsearch import Elasticsearch
+from sentence_transformers import SentenceTransformer
+
+from config import SENTENCE_TRANSFORMERS_MODEL, EMBEDDING_BATCH_SIZE, INGESTION_BATCH_SIZE, INGESTION_LOGS_PATH
+from config import ES_URL, ES_INDEX, GROUND_TRUTH_PATH
+from config import setup_logging
+from corpus import VECTOR_FIELDS
+from data_ingestion import iter_dataset, iter_batches, es_create_index
+from embeddings import embed_chunks, encode_batches, encode_texts
+from encoders import ENCODER_BACKENDS, load_encoder
+from index_profiles import VECTOR_INDEX_PROFILES, vector_index_profile
+from indexing import bulk_index
+from parallel_embedding import parallel_embed, torch_threads_per_worker
+
+logger = setup_logging(INGESTION_LOGS_PATH)
+
+# Compare the old per-chunk encoding path with the batched embedding stage
+def benchmark_embedding(sample_size=500, batch_size=EMBEDDING_BATCH_SIZE):
+    model = SentenceTransformer(SENTENCE_TRANSFORMERS_MODEL)
+    chunks = list(islice(iter_dataset(), sample_size))
+    print(f"Embedding benchmark: {len(chunks)} chunks, model {SENTENCE_TRANSFORMERS_MODEL}")
+
+    # Warm up the model so that the first measurement does not pay for lazy initialization
+    model.encode(["warm up"])
+
+    start_time = time.perf_counter()
+    for chunk in chunks:
+        model.encode(chunk["text"])
+        model.encode(chunk["video"])
+        model.encode(chunk["text"] + chunk["video"])
+    per_chunk_time = time.perf_counter() - start_time
+
+    # Batched path without the embedding store, so that only model inference is measured
+    start_time = time.perf_counter()
+    encode_batches(model, [chunk["text"] for chunk in chunks], batch_size)
+    encode_batches(model, list(dict.fromkeys(chunk["video"] for chunk in chunks)), batch_size)
+    encode_batches(model, [chunk["text"] + chunk["video"] for chunk in chunks], batch_size)
+    batched_time = time.perf_counter() - start_time
+
+    # Full embedding stage, the second run is served from the embedding store
+    embed_chunks(model, [dict(chunk) for chunk in chunks], batch_size)
+    start_time = time.perf_counter()
+    embed_chunks(model, [dict(chunk) for chunk in chunks], batch_size)
+    cached_time = time.perf_counter() - start_time
+
+    print(f"Per-chunk path: {len(chunks) / per_chunk_time:.1f} chunks/sec ({per_chunk_time:.2f} s)")
+    print(f"Batched path (batch size {batch_size}): {len(chunks) / batched_time:.1f} chunks/sec ({batched_time:.2f} s)")
+    print(f"Speed-up: {per_chunk_time / batched_time:.1f}x")
+    print(f"Embedding store (warm): {len(chunks) / cached_time:.1f} chunks/sec ({cached_time:.2f} s)")
+
+# Report embedding throughput of the parallel worker pool from 1 to max_workers workers
+def benchmark_parallel(sample_size=2000, max_workers=os.cpu_count(), batch_size=INGESTION_BATCH_SIZE):
+    chunks = list(islice(iter_dataset(), sample_size))
+    print(f"Parallel embedding benchmark: {len(chunks)} chunks, {os.cpu_count()} CPU cores")
+
+    workers_values = [1]
+    while workers_values[-1] * 2 <= max_workers:
+        workers_values.append(workers_values[-1] * 2)
+    if workers_values[-1] != max_workers:
+        workers_values.append(max_workers)
+
+    base_rate = None
+    for workers in workers_values:
+        batches = iter_batches([dict(chunk) for chunk in chunks], batch_size)
+        # The embedding store is not used, otherwise only the first run would do model inference
+        start_time = time.perf_counter()
+        for _ in parallel_embed(batches, workers, use_cache=False):
+            pass
+        elapsed_time = time.perf_counter() - start_time
+
+        rate = len(chunks) / elapsed_time
+        base_rate = base_rate or rate
+        print(f"{workers} workers x {torch_threads_per_worker(workers)} torch threads: "
+              f"{rate:.1f} chunks/sec ({elapsed_time:.2f} s, scaling {rate / base_rate:.2f}x)")
+
+# Load ground truth questions: list of {"id": chunk id, "playlist": ..., "questions": question}
+def load_ground_truth(limit=None):
+    with open(GROUND_TRUTH_PATH, 'r') as file:
+        ground_truth = json.load(file)
+    return ground_truth[:limit] if limit else ground_truth
+
+# Median and 99th percentile of latencies in milliseconds
+def latency_percentiles(latencies):
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+# Compare vector index profiles: index size, recall of the approximate kNN against exact search,
+# hit rate against the ground truth and kNN latency for several num_candidates values
+def benchmark_index_profiles(num_questions=500, num_results=5):
+    es_client = Elasticsearch([ES_URL])
+    model = SentenceTransformer(SENTENCE_TRANSFORMERS_MODEL)
+    dims = model.get_sentence_embedding_dimension()
+
+    chunks = list({chunk["id"]: chunk for chunk in iter_dataset()}.values())
+    embed_chunks(model, chunks)
+    ground_truth = load_ground_truth(num_questions)
+    query_vectors = encode_texts(model, [q["questions"] for q in ground_truth])
+
+    # Exact top-k by cosine similarity within the playlist
+    ids = np.array([chunk["id"] for chunk in chunks])
+    playlists = np.array([chunk["playlist"] for chunk in chunks])
+    matrix = np.stack([chunk["text_vector"] for chunk in chunks])
+    matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    normalized_queries = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    exact_top = []
+    for q, query_vector in zip(ground_truth, normalized_queries):
+        scores = np.where(playlists == q["playlist"], matrix @ query_vector, -np.inf)
+        exact_top.append(set(ids[np.argsort(-scores)[:num_results]]))
+
+    print(f"Vector index profiles benchmark: {len(chunks)} chunks, {len(ground_truth)} questions, k={num_results}")
+    print(f"{'profile':<18}{'store MB':>10}{'vectors MB':>12}{'candidates':>12}{'recall':>8}{'hit rate':>10}{'p50 ms':>8}{'p99 ms':>8}")
+
+    for name in VECTOR_INDEX_PROFILES:
+        index = f"{ES_INDEX}-profile-{name}"
+        es_client.indices.delete(index=index, ignore_unavailable=True)
+        # Profiles as they are defined: VECTOR_HNSW_* overrides of the app would make them all the same
+        es_create_index(es_client, dims, vector_index_profile(name, overrides=False), index)
+        bulk_index(es_client, (({"index": {"_index": index, "_id": chunk["id"]}}, chunk) for chunk in chunks))
+        es_client.indices.refresh(index=index)
+        es_client.indices.forcemerge(index=index, max_num_segments=1)
+
+        store_size = es_client.indices.stats(index=index)["indices"][index]["total"]["store"]["size_in_bytes"]
+        disk_usage = es_client.indices.disk_usage(index=index, run_expensive_tasks=True)[index]["fields"]
+        vectors_size = sum(disk_usage.get(field, {}).get("knn_vectors_in_bytes", 0) for field in VECTOR_FIELDS)
+
+        for num_candidates in (num_results * 10, 100, 500, 10000):
+            latencies, recalls, hits = [], [], []
+            for q, query_vector, exact in zip(ground_truth, query_vectors, exact_top):
+                start_time = time.perf_counter()
+                response = es_client.search(index=index, knn={
+                    "field": "text_vector",
+                    "query_vector": query_vector.tolist(),
+                    "k": num_results,
+                    "num_candidates": num_candidates,
+                    "filter": {"term": {"playlist": q["playlist"]}}
+                }, source=False)
+                latencies.append(time.perf_counter() - start_time)
+
+                found = [hit["_id"] for hit in response["hits"]["hits"]]
+                recalls.append(len(exact.intersection(found)) / num_results)
+                hits.append(q["id"] in found)
+
+            p50, p99 = latency_percentiles(latencies)
+            print(f"{name:<18}{store_size / 2**20:>10.1f}{vectors_size / 2**20:>12.1f}{num_candidates:>12}"
+                  f"{np.mean(recalls):>8.3f}{np.mean(hits):>10.3f}{p50:>8.1f}{p99:>8.1f}")
+
+        es_client.indices.delete(index=index)
+
+# Send a search request with urllib to measure the raw response size and JSON parse time
+def raw_search(body, params="", index=ES_INDEX):
+    request = urllib.request.Request(f"{ES_URL}/{index}/_search{params}", data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        raw = response.read()
+    start_time = time.perf_counter()
+    json.loads(raw)
+    return len(raw), time.perf_counter() - start_time
+
+# Compare bytes over the wire and parse time of full search responses and lean ones.
+# Full responses come from a temporary index which keeps vectors in _source (like the index before
+# the lean payload) without _source filtering and filter_path; lean ones from the production index
+# with _source limited to the prompt fields and filter_path dropping response metadata.
+def benchmark_payload(num_questions=200):
+    import es
+
+    es_client = Elasticsearch([ES_URL])
+    model = es.get_model()
+    ground_truth = load_ground_truth(num_questions)
+    query_vectors = encode_texts(model, [q["questions"] for q in ground_truth])
+    filter_path = "?filter_path=" + ",".join(es.FILTER_PATH)
+
+    full_index = f"{ES_INDEX}-payload-full"
+    chunks = list({chunk["id"]: chunk for chunk in iter_dataset()}.values())
+    embed_chunks(model, chunks)
+    es_client.indices.delete(index=full_index, ignore_unavailable=True)
+    es_create_index(es_client, model.get_sentence_embedding_dimension(), index=full_index, exclude_vectors=False)
+    try:
+        bulk_index(es_client, (({"index": {"_index": full_index, "_id": chunk["id"]}}, chunk) for chunk in chunks))
+        es_client.indices.refresh(index=full_index)
+
+        print(f"Search payload benchmark: {len(ground_truth)} questions, {len(chunks)} chunks")
+        print(f"{'search':<10}{'mode':<8}{'bytes/query':>14}{'parse ms/query':>16}")
+        for search_type in ("Text", "Vector"):
+            results = {"full": [], "lean": []}
+            for q, query_vector in zip(ground_truth, query_vectors):
+                if search_type == "Text":
+                    lean_query = es.keyword_search_query(q["questions"], q["playlist"])
+                else:
+                    lean_query = es.knn_search_query(query_vector.tolist(), q["playlist"])
+                full_query = {key: value for key, value in lean_query.items() if key != "_source"}
+
+                results["full"].append(raw_search(full_query, index=full_index))
+                results["lean"].append(raw_search(lean_query, filter_path))
+
+            for mode, measurements in results.items():
+                sizes, parse_times = zip(*measurements)
+                print(f"{search_type:<10}{mode:<8}{np.mean(sizes):>14.0f}{np.mean(parse_times) * 1000:>16.3f}")
+    finally:
+        es_client.indices.delete(index=full_index, ignore_unavailable=True)
+
+# Compare p50/p99 latency of the Elasticsearch kNN query and the in-process NumPy index
+# (query embeddings are computed beforehand, so only the vector search is measured)
+def benchmark_vector_backends(num_questions=500, num_results=5):
+    import es
+    from numpy_search import build_numpy_index
+
+    ground_truth = load_ground_truth(num_questions)
+    query_vectors = encode_texts(es.get_model(), [q["questions"] for q in ground_truth])
+    numpy_index = build_numpy_index(es.get_model(), es.SOURCE_FIELDS)
+    backends = {
+        "elasticsearch": lambda query_vector, playlist: es.knn_search(query_vector.tolist(), playlist, num_results),
+        "numpy": lambda query_vector, playlist: numpy_index.search(query_vector, playlist, num_results),
+    }
+
+    print(f"Vector backends benchmark: {len(ground_truth)} questions, k={num_results}")
+    print(f"{'backend':<16}{'hit rate':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, search in backends.items():
+        search(query_vectors[0], ground_truth[0]["playlist"])
+        latencies, hits = [], []
+        for q, query_vector in zip(ground_truth, query_vectors):
+            start_time = time.perf_counter()
+            docs = search(query_vector, q["playlist"])
+            latencies.append(time.perf_counter() - start_time)
+            hits.append(q["id"] in [doc["id"] for doc in docs])
+
+        p50, p99 = latency_percentiles(latencies)
+        print(f"{name:<16}{np.mean(hits):>10.3f}{p50:>10.2f}{p99:>10.2f}")
+
+# Compare relevance (hit rate, MRR against the ground truth) and p50/p99 latency
+# of the Elasticsearch keyword query and the in-process BM25 index
+def benchmark_keyword_backends(num_questions=500, num_results=5):
+    import es
+    from bm25 import build_bm25_index
+
+    ground_truth = load_ground_truth(num_questions)
+    bm25_index = build_bm25_index(iter_dataset())
+    es_client = Elasticsearch([ES_URL])
+    backends = {
+        "elasticsearch": lambda query, playlist: es.response_docs(es_client.search(
+            index=ES_INDEX, body=es.keyword_search_query(query, playlist, num_results), filter_path=es.FILTER_PATH)),
+        "bm25": lambda query, playlist: bm25_index.search(query, playlist, num_results, es.SOURCE_FIELDS),
+    }
+
+    print(f"Keyword backends benchmark: {len(ground_truth)} questions, k={num_results}")
+    print(f"{'backend':<16}{'hit rate':>10}{'mrr':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    results = {}
+    for name, search in backends.items():
+        latencies, ranks, found_ids = [], [], []
+        for q in ground_truth:
+            start_time = time.perf_counter()
+            docs = search(q["questions"], q["playlist"])
+            latencies.append(time.perf_counter() - start_time)
+
+            ids = [doc["id"] for doc in docs]
+            ranks.append(1 / (ids.index(q["id"]) + 1) if q["id"] in ids else 0)
+            found_ids.append(set(ids))
+        results[name] = found_ids
+
+        p50, p99 = latency_percentiles(latencies)
+        print(f"{name:<16}{np.mean([rank > 0 for rank in ranks]):>10.3f}{np.mean(ranks):>8.3f}{p50:>10.3f}{p99:>10.3f}")
+
+    overlaps = [len(a & b) / max(len(a | b), 1) for a, b in zip(results["elasticsearch"], results["bm25"])]
+    print(f"Top-{num_results} overlap (Jaccard) between the backends: {np.mean(overlaps):.3f}")
+
+# Resident memory of the current process in MB
+def current_rss_mb():
+    with open("/proc/self/status", 'r') as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0
+
+# Load the encoder in a fresh process and encode the questions one by one and the documents in batches:
+# returns load time, RSS after loading, single query latencies, document throughput and the vectors
+def encode_with_backend(backend, questions, docs):
+    start_time = time.perf_counter()
+    encoder = load_encoder(backend)
+    load_time = time.perf_counter() - start_time
+    encoder.encode(["warm up"])
+
+    latencies, question_vectors = [], []
+    for question in questions:
+        start_time = time.perf_counter()
+        question_vectors.append(encoder.encode([question])[0])
+        latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    doc_vectors = encode_batches(encoder, docs)
+    docs_rate = len(docs) / (time.perf_counter() - start_time)
+    return load_time, current_rss_mb(), latencies, docs_rate, np.array(question_vectors), doc_vectors
+
+# Compare encoder backends with the fp32 model on the ground truth questions: cosine drift of query vectors,
+# top-k overlap of exact search results (with fp32 document vectors and with document vectors of the backend),
+# hit rate, single query latency, document throughput, load time and RSS of a process with the encoder
+def benchmark_encoders(num_questions=500, num_results=5):
+    ground_truth = load_ground_truth(num_questions)
+    chunks = list({chunk["id"]: chunk for chunk in iter_dataset()}.values())
+    questions = [q["questions"] for q in ground_truth]
+    docs = [chunk["text"] for chunk in chunks]
+    ids = np.array([chunk["id"] for chunk in chunks])
+    playlists = np.array([chunk["playlist"] for chunk in chunks])
+
+    def normalize(vectors):
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def top_ids(question_vectors, doc_vectors):
+        scores = normalize(question_vectors) @ normalize(doc_vectors).T
+        return [
+            list(ids[np.argsort(-np.where(playlists == q["playlist"], row, -np.inf))[:num_results]])
+            for q, row in zip(ground_truth, scores)
+        ]
+
+    results = {}
+    for backend in ENCODER_BACKENDS:
+        # Every backend is measured in a separate process, so that RSS and thread pools are not shared
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as executor:
+            results[backend] = executor.submit(encode_with_backend, backend, questions, docs).result()
+
+    _, _, _, _, base_questions, base_docs = results["torch"]
+    base_top = top_ids(base_questions, base_docs)
+
+    print(f"Encoder backends benchmark: {len(questions)} questions, {len(docs)} documents, k={num_results}")
+    print(f"{'backend':<12}{'drift mean':>12}{'drift max':>11}{'overlap q':>11}{'overlap q+d':>13}{'hit rate':>10}"
+          f"{'p50 ms':>8}{'p99 ms':>8}{'docs/sec':>10}{'load s':>8}{'RSS MB':>8}")
+    for backend, (load_time, rss, latencies, docs_rate, question_vectors, doc_vectors) in results.items():
+        drift = 1 - np.sum(normalize(question_vectors) * normalize(base_questions), axis=1)
+        query_top = top_ids(question_vectors, base_docs)
+        full_top = top_ids(question_vectors, doc_vectors)
+        query_overlap = np.mean([len(set(a) & set(b)) / num_results for a, b in zip(query_top, base_top)])
+        full_overlap = np.mean([len(set(a) & set(b)) / num_results for a, b in zip(full_top, base_top)])
+        hit_rate = np.mean([q["id"] in found for q, found in zip(ground_truth, full_top)])
+
+        p50, p99 = latency_percentiles(latencies)
+        print(f"{backend:<12}{np.mean(drift):>12.5f}{np.max(drift):>11.5f}{query_overlap:>11.3f}{full_overlap:>13.3f}"
+              f"{hit_rate:>10.3f}{p50:>8.2f}{p99:>8.2f}{docs_rate:>10.1f}{load_time:>8.2f}{rss:>8.0f}")
+
+# Encode every question separately from several threads at once, returns latencies and queries/sec
+def concurrent_encode(encoder, questions, concurrency):
+    def encode(question):
+        start_time = time.perf_counter()
+        encoder.encode([question])
+        return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(encode, questions))
+    return latencies, len(questions) / (time.perf_counter() - start_time)
+
+# Compare concurrent single-question encoding with an in-process encoder and through the
+# micro-batching embedding service (started as a separate process on a temporary socket)
+def benchmark_embedding_service(concurrency=16, num_questions=500):
+    from embedding_service import RemoteEncoder
+
+    questions = [q["questions"] for q in load_ground_truth(num_questions)]
+    socket_path = f"/tmp/embedding_service_benchmark_{os.getpid()}.sock"
+    service = subprocess.Popen([sys.executable, "embedding_service.py"],
+                               env=dict(os.environ, EMBEDDING_SERVICE_SOCKET=socket_path))
+    try:
+        encoder = load_encoder()
+        encoder.encode(["warm up"])
+        results = {"in-process": concurrent_encode(encoder, questions, concurrency)}
+
+        while not os.path.exists(socket_path):
+            if service.poll() is not None:
+                raise RuntimeError("Embedding service failed to start.")
+            time.sleep(0.5)
+        remote_encoder = RemoteEncoder(socket_path)
+        remote_encoder.encode(["warm up"])
+        results["service"] = concurrent_encode(remote_encoder, questions, concurrency)
+    finally:
+        service.terminate()
+        service.wait()
+
+    print(f"Embedding service benchmark: {len(questions)} questions, {concurrency} concurrent clients")
+    print(f"{'encoder':<12}{'queries/sec':>12}{'p50 ms':>8}{'p99 ms':>8}")
+    for name, (latencies, rate) in results.items():
+        p50, p99 = latency_percentiles(latencies)
+        print(f"{name:<12}{rate:>12.1f}{p50:>8.2f}{p99:>8.2f}")
+
+# Compare search results with and without collapsing overlapping windows: hit rate against the ground truth
+# (a passage is a hit if it contains the chunk), number of results and words of context which are sent to the LLM
+def benchmark_collapse(search_type="Text", num_questions=500, num_results=5):
+    import es
+
+    ground_truth = load_ground_truth(num_questions)
+    print(f"Collapse benchmark: {search_type} search, {len(ground_truth)} questions, k={num_results}")
+    print(f"{'mode':<12}{'hit rate':>10}{'results':>10}{'context words':>15}")
+    for collapse in (False, True):
+        hits, results, words = [], [], []
+        for q in ground_truth:
+            docs = es.search_answer(q["questions"], q["playlist"], search_type, num_results, collapse=collapse)
+            hits.append(any(q["id"] in doc.get("merged_ids", [doc["id"]]) for doc in docs))
+            results.append(len(docs))
+            words.append(sum(len(doc["text"].split()) for doc in docs))
+        mode = "collapsed" if collapse else "windows"
+        print(f"{mode:<12}{np.mean(hits):>10.3f}{np.mean(results):>10.2f}{np.mean(words):>15.1f}")
+
+# Compare answering the ground truth questions one by one with the batched search
+# (the search cache is disabled, so both runs do the same searches)
+def benchmark_batch_search(search_type="Vector", num_questions=1000, chunk_size=50, concurrency=4):
+    import es
+
+    es.search_cache = None
+    ground_truth = load_ground_truth(num_questions)
+    queries = [q["questions"] for q in ground_truth]
+    playlists = [q["playlist"] for q in ground_truth]
+    es.warm_up([search_type])
+
+    start_time = time.perf_counter()
+    single_answers = [es.search_answer(query, playlist, search_type) for query, playlist in zip(queries, playlists)]
+    single_time = time.perf_counter() - start_time
+
+    # Query embeddings are computed again, otherwise the batch would reuse the cache filled by the first run
+    es.query_embedding_cache.clear()
+    start_time = time.perf_counter()
+    batch_answers, latencies = es.search_answer_batch(queries, playlists, search_type, chunk_size=chunk_size,
+                                                      concurrency=concurrency)
+    batch_time = time.perf_counter() - start_time
+
+    same = np.mean([[doc["id"] for doc in a] == [doc["id"] for doc in b] for a, b in zip(single_answers, batch_answers)])
+    p50, p99 = latency_percentiles(latencies)
+    print(f"Batch search benchmark: {search_type} search, {len(queries)} questions")
+    print(f"One by one: {len(queries) / single_time:.1f} queries/sec ({single_time:.2f} s)")
+    print(f"Batched (chunk {chunk_size}, concurrency {concurrency}): {len(queries) / batch_time:.1f} queries/sec "
+          f"({batch_time:.2f} s), per-query latency p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+    print(f"Same results: {same:.3f}")
+
+# Compare prompts with full and extractively compressed context on the ground truth questions:
+# prompt tokens, compression ratio and relevance of the LLM answers (every question costs 4 OpenAI calls)
+def benchmark_compression(search_type="Text", num_questions=50):
+    import es
+    import rag
+    from context_packer import count_tokens
+
+    ground_truth = load_ground_truth(num_questions)
+    relevance_levels = ["RELEVANT", "PARTLY_RELEVANT", "NON_RELEVANT", "UNKNOWN"]
+    print(f"Compression benchmark: {search_type} search, {len(ground_truth)} questions")
+    print(f"{'mode':<12}{'prompt tokens':>15}{'ratio':>8}" + "".join(f"{level:>17}" for level in relevance_levels))
+
+    full_tokens = None
+    for compression in (False, True):
+        tokens, relevance = [], []
+        for q in ground_truth:
+            docs = es.search_answer(q["questions"], q["playlist"], search_type)
+            prompt = rag.build_prompt(q["questions"], docs, compression=compression)
+            tokens.append(count_tokens(prompt))
+            answer, _, _ = rag.llm(prompt)
+            level, _, _ = rag.rag_evaluation(q["questions"], answer)
+            relevance.append(level if level in relevance_levels else "UNKNOWN")
+
+        full_tokens = full_tokens or np.mean(tokens)
+        mode = "compressed" if compression else "full"
+        print(f"{mode:<12}{np.mean(tokens):>15.1f}{np.mean(tokens) / full_tokens:>8.2f}"
+              + "".join(f"{relevance.count(level) / len(relevance):>17.3f}" for level in relevance_levels))
+
+
+BENCHMARKS = {
+    "embedding": benchmark_embedding,
+    "parallel": benchmark_parallel,
+    "index_profiles": benchmark_index_profiles,
+    "payload": benchmark_payload,
+    "vector_backends": benchmark_vector_backends,
+    "keyword_backends": benchmark_keyword_backends,
+    "encoders": benchmark_encoders,
+    "embedding_service": benchmark_embedding_service,
+    "collapse": benchmark_collapse,
+    "batch_search": benchmark_batch_search,
+    "compression": benchmark_compression,
+}
+
+if __name__ == "__main__":
+    # Usage: python benchmark.py <name> [args ...]
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmark.py <{'|'.join(BENCHMARKS)}> [args ...]")
+        sys.exit(1)
+
+    args = [int(arg) if arg.isdigit() else arg for arg in sys.argv[2:]]
+    BENCHMARKS[sys.argv[1]](*args)
@@ -0,0 +1,196 @@
+import io
+import os
+import re
+import json
+import time
+import logging
+from collections import Counter
+
+import numpy as np
+
+from config import BM25_INDEX_PATH
+from corpus import VECTOR_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters, the same as the defaults of Elasticsearch similarity
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Searched fields with boosts, as in the multi_match query of es.keyword_search_query
+# (playlist and youtube_link are keyword fields there, they match only the whole value, so they are not indexed here)
+BM25_FIELDS = {"text": 4.0, "video": 2.0}
+# Version of the serialized index format, an index file with another version is rebuilt
+BM25_INDEX_VERSION = 1
+
+# Words in lower case, close to the standard analyzer of Elasticsearch
+TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or "").casefold())
+
+
+# In-process BM25 keyword search over a precomputed inverted index.
+# For every field the postings of a term are stored as a slice of doc_ids/weights (CSR layout, offsets in indptr),
+# the weights already contain boost * idf * normalized term frequency, so a query only sums posting weights.
+# Documents are grouped by playlist, so the posting list of a playlist is a contiguous range of doc ids
+# and the playlist filter is an intersection of sorted term postings with this range.
+class BM25Index:
+    def __init__(self, vocabulary, postings, docs, playlist_rows, fingerprint=None, path=None):
+        self.vocabulary = vocabulary
+        self.postings = postings
+        self.docs = docs
+        self.playlist_rows = playlist_rows
+        self.fingerprint = fingerprint
+        self.path = path
+        self.mtime = os.path.getmtime(path) if path else None
+
+    # The index has to be reloaded when its file was rebuilt by the ingestion
+    def is_stale(self):
+        try:
+            return self.path is not None and os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
+    # Top-k documents of the playlist by the best field score (like multi_match best_fields)
+    def search(self, query, playlist, num_results=5, source_fields=None):
+        rows = self.playlist_rows.get(playlist)
+        term_counts = Counter(self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary)
+        if rows is None or not term_counts:
+            return []
+
+        start, end = rows
+        field_scores = []
+        for indptr, doc_ids, weights in self.postings.values():
+            scores = np.zeros(end - start, dtype=np.float32)
+            for term_id, count in term_counts.items():
+                posting_start, posting_end = indptr[term_id], indptr[term_id + 1]
+                term_docs = doc_ids[posting_start:posting_end]
+                low, high = np.searchsorted(term_docs, [start, end])
+                scores[term_docs[low:high] - start] += count * weights[posting_start + low:posting_start + high]
+            field_scores.append(scores)
+        scores = np.maximum.reduce(field_scores)
+
+        matched = np.flatnonzero(scores > 0)
+        k = min(num_results, len(matched))
+        if k == 0:
+            return []
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        docs = [self.docs[start + i] for i in top]
+        if source_fields:
+            return [{field: doc.get(field) for field in source_fields} for doc in docs]
+        return [dict(doc) for doc in docs]
+
+
+# Build the index from dataset chunks (vectors are dropped, duplicate ids are resolved like in the ingestion: the last chunk wins)
+def build_bm25_index(chunks, fingerprint=None):
+    start_time = time.perf_counter()
+    docs = {}
+    for chunk in chunks:
+        docs[chunk["id"]] = {field: value for field, value in chunk.items() if field not in VECTOR_FIELDS}
+    docs = sorted(docs.values(), key=lambda doc: doc.get("playlist") or "")
+
+    playlist_rows = {}
+    for row, doc in enumerate(docs):
+        start, _ = playlist_rows.get(doc.get("playlist"), (row, row))
+        playlist_rows[doc.get("playlist")] = (start, row + 1)
+
+    vocabulary = {}
+    postings = {}
+    for field, boost in BM25_FIELDS.items():
+        term_ids, doc_ids, frequencies = [], [], []
+        lengths = np.zeros(len(docs), dtype=np.float32)
+        for doc_id, doc in enumerate(docs):
+            tokens = tokenize(doc.get(field))
+            lengths[doc_id] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                frequencies.append(frequency)
+        term_ids = np.array(term_ids, dtype=np.int64)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        frequencies = np.array(frequencies, dtype=np.float32)
+
+        # Lucene BM25: idf = ln(1 + (N - n + 0.5) / (n + 0.5)), tf = f / (f + k1 * (1 - b + b * dl / avgdl)),
+        # where N and avgdl are calculated over the documents which have the field
+        docs_with_field = max(np.count_nonzero(lengths), 1)
+        average_length = max(lengths.sum() / docs_with_field, 1e-9)
+        document_frequency = np.bincount(term_ids, minlength=len(vocabulary))
+        idf = np.log(1 + (docs_with_field - document_frequency + 0.5) / (document_frequency + 0.5))
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / average_length)
+        weights = boost * idf[term_ids] * frequencies / (frequencies + norms)
+
+        # Sort postings by term and doc id and calculate the offsets of every term
+        order = np.lexsort((doc_ids, term_ids))
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(document_frequency)
+        postings[field] = (indptr, doc_ids[order], weights[order].astype(np.float32))
+
+    # Terms which were added to the vocabulary by a later field have empty postings in the earlier fields
+    for field, (indptr, doc_ids, weights) in postings.items():
+        if len(indptr) < len(vocabulary) + 1:
+            postings[field] = (np.pad(indptr, (0, len(vocabulary) + 1 - len(indptr)), mode="edge"), doc_ids, weights)
+
+    logger.info(f"BM25 index was built: {len(docs)} documents, {len(vocabulary)} terms, "
+                f"{sum(len(doc_ids) for _, doc_ids, _ in postings.values())} postings "
+                f"in {time.perf_counter() - start_time:.2f} s.")
+    return BM25Index(vocabulary, postings, docs, playlist_rows, fingerprint)
+
+# JSON value stored as a byte array in the npz file (loading does not need pickle)
+def json_array(value):
+    return np.frombuffer(json.dumps(value).encode(), dtype=np.uint8)
+
+# Save the index into one npz file: postings arrays and JSON blobs with the vocabulary, documents and metadata
+def save_bm25_index(index, path=BM25_INDEX_PATH):
+    arrays = {}
+    for field, (indptr, doc_ids, weights) in index.postings.items():
+        arrays[f"{field}.indptr"] = indptr
+        arrays[f"{field}.doc_ids"] = doc_ids
+        arrays[f"{field}.weights"] = weights
+    terms = sorted(index.vocabulary, key=index.vocabulary.get)
+    arrays["terms"] = json_array(terms)
+    arrays["docs"] = json_array(index.docs)
+    arrays["meta"] = json_array({
+        "version": BM25_INDEX_VERSION,
+        "fields": list(index.postings),
+        "playlist_rows": [[playlist, start, end] for playlist, (start, end) in index.playlist_rows.items()],
+        "fingerprint": index.fingerprint,
+    })
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    # Write to a temporary file first, so that the app never loads a partially written index
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as file:
+        file.write(buffer.getvalue())
+    os.replace(temp_path, path)
+    logger.info(f"BM25 index was saved to {path} ({len(buffer.getvalue()) / 2**20:.1f} MB).")
+
+# Read the metadata of the saved index, returns None if there is no index or it has another version
+def read_bm25_meta(path=BM25_INDEX_PATH):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].tobytes())
+    return meta if meta.get("version") == BM25_INDEX_VERSION else None
+
+def load_bm25_index(path=BM25_INDEX_PATH):
+    mtime = os.path.getmtime(path)
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].tobytes())
+        if meta.get("version") != BM25_INDEX_VERSION:
+            raise ValueError(f"BM25 index {path} has version {meta.get('version')}, expected {BM25_INDEX_VERSION}.")
+        terms = json.loads(data["terms"].tobytes())
+        docs = json.loads(data["docs"].tobytes())
+        postings = {
+            field: (data[f"{field}.indptr"], data[f"{field}.doc_ids"], data[f"{field}.weights"])
+            for field in meta["fields"]
+        }
+
+    index = BM25Index({term: i for i, term in enumerate(terms)}, postings, docs,
+                      {playlist: (start, end) for playlist, start, end in meta["playlist_rows"]},
+                      meta["fingerprint"], path)
+    index.mtime = mtime
+    logger.info(f"BM25 index was loaded from {path}: {len(docs)} documents, {len(terms)} terms.")
+    return index
@@ -0,0 +1,43 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Normalize the query text for cache keys: case, whitespace and trailing punctuation are ignored
+def normalize_query(query):
+    return re.sub(r"[\s?!.]+$", "", " ".join(query.casefold().split()))
+
+
+# Thread-safe, size-bounded LRU cache with hit/miss counters
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Get the value by key, returns None on a miss
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    # Put the value, evicting the least recently used entries when the cache is full
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
@@ -0,0 +1,81 @@
+import re
+import logging
+
+import numpy as np
+
+from config import COMPRESSION_TOP_SENTENCES, COMPRESSION_NEIGHBOUR_SENTENCES
+from embeddings import encode_texts
+from caches import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Sentences of the transcripts end with punctuation (Amazon Transcribe adds it)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+# Vectors of recently compressed sentences. They are not written into the persistent embedding store,
+# which would evict the corpus vectors and flush the store on every request.
+SENTENCE_CACHE_SIZE = 4096
+sentence_cache = LRUCache(SENTENCE_CACHE_SIZE)
+
+
+def split_sentences(text):
+    return [sentence for sentence in SENTENCE_SPLIT.split(text.strip()) if sentence]
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+# Normalized vectors of the sentences, only sentences which are missing in the cache are encoded
+def encode_sentences(encoder, sentences):
+    vectors = {sentence: sentence_cache.get(sentence) for sentence in set(sentences)}
+    missing = [sentence for sentence, vector in vectors.items() if vector is None]
+    if missing:
+        for sentence, vector in zip(missing, normalize(encode_texts(encoder, missing, use_cache=False))):
+            sentence_cache.put(sentence, vector)
+            vectors[sentence] = vector
+    return np.stack([vectors[sentence] for sentence in sentences])
+
+# Rows of the top sentences by score together with neighbours sentences before and after each of them
+def select_sentences(scores, top_sentences, neighbours):
+    rows = set()
+    for row in np.argsort(-scores, kind="stable")[:top_sentences]:
+        rows.update(range(max(row - neighbours, 0), min(row + neighbours + 1, len(scores))))
+    return sorted(rows)
+
+# Join the selected sentences in their original order, gaps are marked with "..."
+def join_sentences(sentences, rows):
+    parts = ["..."] if rows[0] > 0 else []
+    for previous, row in zip([None] + rows[:-1], rows):
+        if previous is not None and row != previous + 1:
+            parts.append("...")
+        parts.append(sentences[row])
+    if rows[-1] < len(sentences) - 1:
+        parts.append("...")
+    return " ".join(parts)
+
+# Extractive compression of search hits (or passages): sentences are scored by cosine similarity to the query
+# and only the top sentences of every hit with their neighbours are kept. Other fields (video title, link, ...)
+# are not changed. Sentence vectors of recent requests are reused from the in-memory cache.
+def compress_passages(query_vector, docs, encoder, top_sentences=COMPRESSION_TOP_SENTENCES,
+                      neighbours=COMPRESSION_NEIGHBOUR_SENTENCES):
+    doc_sentences = [split_sentences(doc["text"]) for doc in docs]
+    # Hits which are not longer than the selection are kept as they are
+    compressible = [i for i, sentences in enumerate(doc_sentences) if len(sentences) > top_sentences * (2 * neighbours + 1)]
+    if not compressible:
+        return docs
+
+    sentences = [sentence for i in compressible for sentence in doc_sentences[i]]
+    scores = encode_sentences(encoder, sentences) @ normalize(np.asarray(query_vector, dtype=np.float32))
+
+    compressed = list(docs)
+    start = 0
+    for i in compressible:
+        end = start + len(doc_sentences[i])
+        rows = select_sentences(scores[start:end], top_sentences, neighbours)
+        compressed[i] = {**docs[i], "text": join_sentences(doc_sentences[i], rows)}
+        start = end
+
+    original_length = sum(len(doc["text"]) for doc in docs)
+    compressed_length = sum(len(doc["text"]) for doc in compressed)
+    logger.info(f"Context was compressed from {original_length} to {compressed_length} characters "
+                f"(ratio {compressed_length / max(original_length, 1):.2f}).")
+    return compressed
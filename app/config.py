@@ -10,6 +10,31 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini-2024-07-18")
 
 #Sentence Transformers
 SENTENCE_TRANSFORMERS_MODEL = os.getenv("SENTENCE_TRANSFORMERS_MODEL", "paraphrase-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+# Encoder backend (see encoders.py): "torch" (fp32), "torch_int8" (dynamic int8 quantization),
+# "onnx" or "onnx_int8" (exported ONNX graph run by onnxruntime); threads per encoder (0 - library default)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "data/onnx")
+# Local embedding service (embedding_service.py) shared by all app processes on the host:
+# socket path (empty - every app process loads its own model), max texts per batch and max wait for a batch
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")
+EMBEDDING_SERVICE_MAX_BATCH = int(os.getenv("EMBEDDING_SERVICE_MAX_BATCH", "64"))
+EMBEDDING_SERVICE_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVICE_MAX_WAIT_MS", "5"))
+# Identity of the embeddings in caches, the corpus and the index: vectors of different backends are never mixed
+ENCODER_ID = SENTENCE_TRANSFORMERS_MODEL if ENCODER_BACKEND == "torch" else f"{SENTENCE_TRANSFORMERS_MODEL}:{ENCODER_BACKEND}"
+
+# Persistent embedding cache (memory-mapped store shared by ingestion and app)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache")
+# Capacity of a new store (an existing store keeps the capacity it was created with)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+# Stores of other encoders which were not used for this number of days are deleted (0 - never)
+EMBEDDING_CACHE_STALE_DAYS = int(os.getenv("EMBEDDING_CACHE_STALE_DAYS", "30"))
+# In-process LRU cache of query embeddings, optionally backed by the persistent embedding cache
+# (off by default: writing every new question into the shared store on the request path evicts corpus vectors)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_PERSISTENT = os.getenv("QUERY_EMBEDDING_CACHE_PERSISTENT", "false").lower() == "true"
 
 # Timezone
 TZ = os.getenv("TZ", "Pacific/Auckland")
@@ -18,6 +43,84 @@ TZ = os.getenv("TZ", "Pacific/Auckland")
 ES_URL = os.getenv("ES_URL", "http://elasticsearch:9200")
 ES_INDEX = os.getenv("ES_INDEX", "youtube-questions")
 # ES_INDEX = os.getenv("ES_INDEX", "audio_assistant_index")
+# Search clients (sync and async): persistent connections per node, request timeout in seconds and retries
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "10"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+ES_RETRY_ON_TIMEOUT = os.getenv("ES_RETRY_ON_TIMEOUT", "true").lower() == "true"
+
+# Vector index profile (see index_profiles.py) and optional overrides of its parameters
+VECTOR_INDEX_PROFILE = os.getenv("VECTOR_INDEX_PROFILE", "text_int8")
+VECTOR_INDEXED_FIELDS = [field for field in os.getenv("VECTOR_INDEXED_FIELDS", "").split(",") if field]
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "0"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "0"))
+# Number of candidates per shard for kNN search
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "10000"))
+# Vector search backend: "elasticsearch" (kNN query) or "numpy" (in-process exact search over the corpus)
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "elasticsearch")
+# NumPy backend: keep the normalized matrix in a memory-mapped file instead of process memory
+NUMPY_INDEX_MMAP = os.getenv("NUMPY_INDEX_MMAP", "false").lower() == "true"
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "data/numpy_index.npy")
+# Keyword search backend: "elasticsearch" (multi_match query) or "bm25" (in-process inverted index built by the ingestion)
+KEYWORD_SEARCH_BACKEND = os.getenv("KEYWORD_SEARCH_BACKEND", "elasticsearch")
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "data/bm25_index.npz")
+# Number of search results which are used as context
+SEARCH_RESULTS_NUMBER = int(os.getenv("SEARCH_RESULTS_NUMBER", "5"))
+# Max tokens of the prompt to the LLM (counted by the local tokenizer of OPENAI_MODEL), search results
+# which don't fit are trimmed or dropped; a trimmed passage keeps at least CONTEXT_MIN_PASSAGE_TOKENS of its text
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+CONTEXT_MIN_PASSAGE_TOKENS = int(os.getenv("CONTEXT_MIN_PASSAGE_TOKENS", "40"))
+# Extractive compression of the context: only the top sentences of every passage by similarity to the question
+# with the neighbour sentences around each of them are put into the prompt
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "false").lower() == "true"
+COMPRESSION_TOP_SENTENCES = int(os.getenv("COMPRESSION_TOP_SENTENCES", "2"))
+COMPRESSION_NEIGHBOUR_SENTENCES = int(os.getenv("COMPRESSION_NEIGHBOUR_SENTENCES", "1"))
+# Collapse overlapping windows of the same video in search results into passages (see passages.py):
+# windows which start within the gap are merged, fetch factor - how many more hits are requested before collapsing
+SEARCH_COLLAPSE = os.getenv("SEARCH_COLLAPSE", "false").lower() == "true"
+COLLAPSE_MAX_GAP_SECONDS = float(os.getenv("COLLAPSE_MAX_GAP_SECONDS", "60"))
+COLLAPSE_FETCH_FACTOR = int(os.getenv("COLLAPSE_FETCH_FACTOR", "3"))
+# Batched search: queries per _msearch request and number of requests which are sent concurrently
+SEARCH_BATCH_CHUNK_SIZE = int(os.getenv("SEARCH_BATCH_CHUNK_SIZE", "50"))
+SEARCH_BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "4"))
+# Search types which are warmed up when the app starts (comma separated: Text, Vector, Hybrid)
+WARM_UP_SEARCH_TYPES = [search_type for search_type in os.getenv("WARM_UP_SEARCH_TYPES", "Text").split(",") if search_type]
+
+# Hybrid search: weights of keyword and vector legs in reciprocal rank fusion,
+# RRF rank constant and number of candidates requested from every leg
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_RANK_CONSTANT = int(os.getenv("HYBRID_RANK_CONSTANT", "60"))
+HYBRID_WINDOW_SIZE = int(os.getenv("HYBRID_WINDOW_SIZE", "20"))
+
+# Search results cache: "memory" (in-process), "sqlite" (shared local file for several app replicas) or "none"
+SEARCH_CACHE_BACKEND = os.getenv("SEARCH_CACHE_BACKEND", "memory")
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "data/search_cache.sqlite")
+# SQLite cache: expired and least recently used entries are evicted every N puts of an app process
+SEARCH_CACHE_EVICT_INTERVAL = int(os.getenv("SEARCH_CACHE_EVICT_INTERVAL", "100"))
+# How often (in seconds) the index generation is checked to invalidate the cache after reindexing
+SEARCH_CACHE_GENERATION_CHECK_INTERVAL = int(os.getenv("SEARCH_CACHE_GENERATION_CHECK_INTERVAL", "30"))
+
+# Semantic answer cache: cosine similarity of a new question to a cached one which returns the cached answer,
+# max entries per playlist and search type, TTL in seconds and the file saved by the warm-up (answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "data/answer_cache.npz")
+# Similar questions are looked up only when the embedding service is configured or the encoder is loaded by the search
+# (Vector and Hybrid search); with Text search and no embedding service only the same question hits the cache.
+# true loads the encoder into the app process for the cache
+ANSWER_CACHE_LOAD_ENCODER = os.getenv("ANSWER_CACHE_LOAD_ENCODER", "false").lower() == "true"
+
+# ElasticSearch bulk indexing (max documents and bytes per request, parallel requests, retries on 429)
+BULK_MAX_DOCS = int(os.getenv("BULK_MAX_DOCS", "500"))
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", "2"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+BULK_INITIAL_BACKOFF = float(os.getenv("BULK_INITIAL_BACKOFF", "2"))
 
 # PostgreSQL configuration
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
@@ -35,12 +138,37 @@ GRAFANA_ADMIN_USER = os.getenv("GRAFANA_ADMIN_USER")
 GRAFANA_ADMIN_PASSWORD = os.getenv("GRAFANA_ADMIN_PASSWORD")
 GRAFANA_SECRET_KEY = os.getenv("GRAFANA_SECRET_KEY")
 
+# Background relevance evaluation: worker threads, max queued conversations,
+# retries of a failed evaluation with exponential backoff (initial delay in seconds)
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "2"))
+EVALUATION_QUEUE_SIZE = int(os.getenv("EVALUATION_QUEUE_SIZE", "1000"))
+EVALUATION_MAX_RETRIES = int(os.getenv("EVALUATION_MAX_RETRIES", "3"))
+EVALUATION_RETRY_BACKOFF = float(os.getenv("EVALUATION_RETRY_BACKOFF", "2"))
+# How often (in seconds) workers claim conversations which are still pending (the queue was full, the app was restarted):
+# pending conversations older than the min age and claims older than the timeout (the claiming process has died)
+EVALUATION_REQUEUE_INTERVAL = float(os.getenv("EVALUATION_REQUEUE_INTERVAL", "60"))
+EVALUATION_PENDING_MIN_AGE = int(os.getenv("EVALUATION_PENDING_MIN_AGE", "300"))
+EVALUATION_CLAIM_TIMEOUT = int(os.getenv("EVALUATION_CLAIM_TIMEOUT", "900"))
+
 # Dataset path
 DATASET_PATH = os.getenv("DATASET_PATH", "data/dataset.json")
+# Ground truth questions (generated by data_prep/create_ground_truth_dataset.py) for evaluation and benchmarks
+GROUND_TRUTH_PATH = os.getenv("GROUND_TRUTH_PATH", "data/ground_truth_dataset.json")
+# Pre-embedded corpus path prefix (<path>.jsonl, <path>.vectors.npy, <path>.meta.json), used instead of the dataset if it exists
+CORPUS_PATH = os.getenv("CORPUS_PATH", "data/corpus")
+
+# Ingestion mode: "incremental" (upsert changed chunks only) or "rebuild" (build a new versioned index and switch the ES_INDEX alias to it)
+INGESTION_MODE = os.getenv("INGESTION_MODE", "incremental")
+# Number of chunks which are embedded and kept in memory at once during ingestion
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "512"))
+# Number of embedding worker processes and torch intra-op threads per worker (0 - share CPU cores between workers)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "1"))
+INGESTION_TORCH_THREADS = int(os.getenv("INGESTION_TORCH_THREADS", "0"))
 
 # Logs paths
 APP_LOGS_PATH = os.getenv("APP_LOGS_PATH", "logs/app.log")
 INGESTION_LOGS_PATH = os.getenv("INGESTION_LOGS_PATH", "logs/ingestion.log")
+EMBEDDING_SERVICE_LOGS_PATH = os.getenv("EMBEDDING_SERVICE_LOGS_PATH", "logs/embedding_service.log")
 
 # Amazon Transcribe configuration
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -0,0 +1,108 @@
+import re
+import logging
+import threading
+
+from config import OPENAI_MODEL, PROMPT_TOKEN_BUDGET, CONTEXT_MIN_PASSAGE_TOKENS
+from passages import collapse_passages
+
+logger = logging.getLogger(__name__)
+
+# Tokenizer of the OpenAI model, it is loaded on the first use
+tokenizer = None
+tokenizer_lock = threading.Lock()
+
+# End of a sentence, trimmed passages are cut after the last complete sentence when possible
+SENTENCE_END = re.compile(r"[.!?](?=\s|$)")
+
+
+# Approximate tokenizer which is used when the tiktoken encoding can't be loaded (it is downloaded on the first use,
+# the app image has it in TIKTOKEN_CACHE_DIR): a token is about 4 characters of English text
+class ApproximateTokenizer:
+    CHARS_PER_TOKEN = 4
+
+    def encode(self, text):
+        return [text[i:i + self.CHARS_PER_TOKEN] for i in range(0, len(text), self.CHARS_PER_TOKEN)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def get_tokenizer():
+    global tokenizer
+    with tokenizer_lock:
+        if tokenizer is None:
+            try:
+                import tiktoken
+
+                try:
+                    tokenizer = tiktoken.encoding_for_model(OPENAI_MODEL)
+                except KeyError:
+                    # A model which is unknown to this tiktoken version, the encoding of the latest models is used
+                    tokenizer = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"Tokenizer of {OPENAI_MODEL} can't be loaded ({str(e)}), "
+                               f"prompt tokens are approximated by the number of characters.")
+                tokenizer = ApproximateTokenizer()
+        return tokenizer
+
+def count_tokens(text):
+    return len(get_tokenizer().encode(text))
+
+# Cut the text to max_tokens tokens, after the last complete sentence if it keeps at least a half of the text
+def trim_to_tokens(text, max_tokens):
+    tokens = get_tokenizer().encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    trimmed = get_tokenizer().decode(tokens[:max_tokens])
+    sentence_ends = [match.end() for match in SENTENCE_END.finditer(trimmed)]
+    if sentence_ends and sentence_ends[-1] >= len(trimmed) // 2:
+        return trimmed[:sentence_ends[-1]]
+    return trimmed[:trimmed.rfind(" ")].rstrip() + " ..." if " " in trimmed else trimmed
+
+# Pack the search results into the prompt context within the token budget.
+# Overlapping windows of the same video are merged into passages first (the windows share most of their text),
+# and optionally compressed (compress is a function of the list of passages),
+# then passages are added in the rank order of their best search hit. The passage which doesn't fit is trimmed
+# if at least min_passage_tokens of its text fit, and the following passages are dropped.
+# Returns the context and the number of its tokens.
+def pack_context(search_results, context_template, budget, compress=None, min_passage_tokens=CONTEXT_MIN_PASSAGE_TOKENS):
+    passages = collapse_passages(search_results)
+    if compress is not None:
+        passages = compress(passages)
+    # Every passage is followed by an empty line
+    separator_tokens = count_tokens("\n\n")
+
+    parts = []
+    used_tokens = 0
+    for passage in passages:
+        fields = {"video": passage["video"], "youtube_link": passage["youtube_link"]}
+        part = context_template.format(text=passage["text"], **fields).strip()
+        part_tokens = count_tokens(part) + separator_tokens
+        if used_tokens + part_tokens <= budget:
+            parts.append(part)
+            used_tokens += part_tokens
+            continue
+
+        header_tokens = count_tokens(context_template.format(text="", **fields).strip()) + separator_tokens
+        text_budget = budget - used_tokens - header_tokens
+        if text_budget >= min_passage_tokens:
+            # One token is reserved for the " ..." ending of a text which is cut in the middle of a sentence
+            part = context_template.format(text=trim_to_tokens(passage["text"], text_budget - 1), **fields).strip()
+            parts.append(part)
+            used_tokens += count_tokens(part) + separator_tokens
+        break
+
+    context = "".join(part + "\n\n" for part in parts)
+    logger.info(f"Context was packed: {len(search_results)} search results, {len(passages)} passages, "
+                f"{len(parts)} passages in the context, {used_tokens} tokens (budget: {budget}).")
+    return context, used_tokens
+
+# Number of context tokens without packing: every search result in full
+def unpacked_context_tokens(search_results, context_template):
+    return count_tokens("".join(
+        context_template.format(text=doc["text"], video=doc["video"], youtube_link=doc["youtube_link"]).strip() + "\n\n"
+        for doc in search_results))
+
+# Token budget of the context: the prompt budget without the tokens of the prompt template and the question
+def context_budget(prompt_template, query, prompt_budget=PROMPT_TOKEN_BUDGET):
+    return max(prompt_budget - count_tokens(prompt_template.format(question=query, context="")), 0)
@@ -0,0 +1,118 @@
+import os
+import json
+import logging
+
+import numpy as np
+
+from config import DATASET_PATH, CORPUS_PATH, ENCODER_ID
+
+logger = logging.getLogger(__name__)
+
+# Compact pre-embedded corpus: "<path>.jsonl" with chunk metadata (one chunk per line),
+# "<path>.vectors.npy" with a (3, chunks, dims) float32 array of the embeddings and
+# "<path>.meta.json" with the model name and the shape of the vectors.
+VECTOR_FIELDS = ["text_vector", "video_vector", "text_video_vector"]
+
+# Paths of the corpus files
+def corpus_files(path):
+    return f"{path}.jsonl", f"{path}.vectors.npy", f"{path}.meta.json"
+
+# Read the corpus metadata, returns None if there is no corpus
+def read_corpus_meta(path):
+    _, _, meta_path = corpus_files(path)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as file:
+        return json.load(file)
+
+# Check if the pre-embedded corpus exists and was built with the configured model and encoder backend
+def corpus_is_available(path=CORPUS_PATH):
+    meta = read_corpus_meta(path)
+    return meta is not None and meta["model"] == ENCODER_ID
+
+# Memory-map the corpus vectors: (vector field, chunk, dims) float32 array
+def load_corpus_vectors(path):
+    _, vectors_path, _ = corpus_files(path)
+    vectors = np.load(vectors_path, mmap_mode="r")
+    if vectors.shape[0] != len(VECTOR_FIELDS):
+        raise ValueError(f"Corpus vectors {vectors_path} have unexpected shape {vectors.shape}.")
+    return vectors
+
+# Stream corpus chunks with the vectors attached as views into the memory-mapped array
+def iter_corpus(path):
+    metadata_path, _, _ = corpus_files(path)
+    vectors = load_corpus_vectors(path)
+    logger.info(f"Streaming corpus from {metadata_path} with {vectors.shape[1]} pre-computed vectors ...")
+
+    with open(metadata_path, 'r') as file:
+        row = 0
+        for line in file:
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            for i, field in enumerate(VECTOR_FIELDS):
+                chunk[field] = vectors[i, row]
+            row += 1
+            yield chunk
+
+    if row != vectors.shape[1]:
+        raise ValueError(f"Corpus {metadata_path} has {row} chunks but {vectors.shape[1]} vectors.")
+
+# Size of the blocks which are read from the dataset file
+READ_BLOCK_SIZE = 64 * 1024
+
+# Read a JSON array from file item by item without loading the whole file into memory
+def iter_json_array(path):
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as file:
+        buffer = ""
+        position = 0
+        started = False
+        eof = False
+        
+        while True:
+            # Skip whitespace and separators between items
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != "[":
+                    raise ValueError(f"File {path} does not contain a JSON array.")
+                started = True
+                position += 1
+                continue
+            if started and position < len(buffer) and buffer[position] == "]":
+                return
+            
+            try:
+                if position >= len(buffer):
+                    raise ValueError("Buffer is empty")
+                item, end = decoder.raw_decode(buffer, position)
+                # A number at the end of the buffer could continue in the next block
+                if end == len(buffer) and not eof:
+                    raise ValueError("Item could be incomplete")
+            except ValueError:
+                # The item is not complete yet, read the next block
+                if eof:
+                    raise ValueError(f"Unexpected end of JSON array in {path}.")
+                block = file.read(READ_BLOCK_SIZE)
+                eof = not block
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+            
+            yield item
+            position = end
+
+# Read a JSONL file line by line
+def iter_jsonl(path):
+    with open(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+# Stream dataset chunks from a JSON array or a JSONL file
+def iter_dataset(path=DATASET_PATH):
+    logger.info(f"Streaming dataset from {path} ...")
+    if path.endswith(".jsonl"):
+        return iter_jsonl(path)
+    return iter_json_array(path)
@@ -1,45 +1,133 @@
 import json
+import time
+import hashlib
+import resource
 from tqdm.auto import tqdm
-from sentence_transformers import SentenceTransformer
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
 
-from config import DATASET_PATH, ES_INDEX, ES_URL, SENTENCE_TRANSFORMERS_MODEL, INGESTION_LOGS_PATH
+from config import DATASET_PATH, ES_INDEX, ES_URL, ENCODER_ID, INGESTION_LOGS_PATH, INGESTION_MODE
+from config import INGESTION_BATCH_SIZE, INGESTION_WORKERS, CORPUS_PATH, BM25_INDEX_PATH
 from config import setup_logging
 from db import init_db
+from corpus import VECTOR_FIELDS, corpus_files, corpus_is_available, read_corpus_meta, iter_corpus, iter_dataset
+from index_profiles import vector_index_profile, vector_mappings, profile_signature
+from embeddings import embed_chunks
+from encoders import load_encoder
+from parallel_embedding import EmbeddingWorkerPool
+from bm25 import build_bm25_index, save_bm25_index, read_bm25_meta
+from indexing import bulk_index, disable_refresh_and_replicas, restore_refresh_and_replicas
 
 logger = setup_logging(INGESTION_LOGS_PATH)
 
-# Read json file
-def read_json(path):
-    try:
-        # Open JSON file
-        with open(path, 'r') as file:
-            data = json.load(file)
-            logger.info(f"JSON file was read successfully from {path} ")
-        return data
-
-    except FileNotFoundError:
-        return logger.error(f"File {path} not found.")
-    except Exception as e:
-        return logger.error(f"An error occurred: {str(e)}")
-
-# Load dataset from json file
-def load_dataset():
-    data = read_json(DATASET_PATH)
-    documents = []
-
-    for doc in data:
-        documents.append(doc)
-    return documents
-
-# Create an ElasticSearch index and Indexing the dataset chunks
-def es_create_and_indexing(es_client, encoding_model):
-    if es_client.indices.exists(index=ES_INDEX):
-        logger.error(f"ES index has already exist with name: {ES_INDEX}")
-        logger.info(f"Delete ES index with name: {ES_INDEX} ... ")
-        es_client.indices.delete(index=ES_INDEX, ignore_unavailable=True)
-        
-    logger.info(f"Creating a new ES index with name: {ES_INDEX} ... ")
+# Stream chunks from the pre-embedded corpus (with vectors) if it is available, otherwise from the dataset
+def iter_chunks():
+    if corpus_is_available():
+        return iter_corpus(CORPUS_PATH)
+    return iter_dataset()
+
+# Load the whole dataset into a list (for evaluation and benchmarks)
+def load_dataset(path=DATASET_PATH):
+    return list(iter_dataset(path))
+
+# Group a stream of items into lists of batch_size items
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Log the peak resident memory of the ingestion process
+def log_peak_memory(stage):
+    # ru_maxrss is measured in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info(f"Peak RSS after {stage}: {peak_rss:.1f} MB")
+
+# Chunk fields which are used to calculate the content hash of the document
+CONTENT_FIELDS = ["id", "text", "video", "playlist", "youtube_video_id", "youtube_link", "start_time"]
+
+# Calculate a hash of the chunk content together with the model name and encoder backend,
+# so that a chunk has to be re-embedded when either of them changes
+def content_hash(chunk):
+    content = json.dumps({field: chunk.get(field) for field in CONTENT_FIELDS}, sort_keys=True)
+    return hashlib.md5(f"{ENCODER_ID}-{content}".encode()).hexdigest()
+
+# Version of the index mappings, an index with another version is re-created
+MAPPING_VERSION = 2
+
+# Calculate a fingerprint of the dataset file, the model name and the index mappings without parsing the file
+def dataset_fingerprint():
+    paths = corpus_files(CORPUS_PATH) if corpus_is_available() else [DATASET_PATH]
+    hash_object = hashlib.md5(f"{ENCODER_ID}-{MAPPING_VERSION}-{profile_signature(vector_index_profile())}".encode())
+    for path in paths:
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                hash_object.update(block)
+    return hash_object.hexdigest()
+
+# Read the _meta of the index (fingerprint of the last ingested dataset, model and vector index profile).
+# ES_INDEX is an alias of the current versioned index (or the index itself, if it was created before the aliases).
+def index_meta(es_client, index=ES_INDEX):
+    if not es_client.indices.exists(index=index):
+        return {}
+    # The response is keyed by the name of the index behind the alias
+    mapping = next(iter(es_client.indices.get_mapping(index=index).values()))["mappings"]
+    return mapping.get("_meta", {})
+
+# Check if the index was created with the current mappings version, vector index profile and encoder
+# (vectors of another encoder can't be mixed with the indexed ones, and vectors of another size are rejected)
+def index_mappings_match(meta, dims):
+    return (meta.get("mapping_version") == MAPPING_VERSION and
+            meta.get("vector_profile") == profile_signature(vector_index_profile()) and
+            meta.get("model") == ENCODER_ID and
+            meta.get("dims") == dims)
+
+# Save the fingerprint of the ingested dataset into the index _meta and bump the index generation,
+# which invalidates search caches of the app
+def save_index_fingerprint(es_client, fingerprint, index=ES_INDEX):
+    meta = index_meta(es_client, index)
+    generation = meta.get("generation", 0) + 1
+    meta.update(fingerprint=fingerprint, model=ENCODER_ID, generation=generation)
+    es_client.indices.put_mapping(index=index, meta=meta)
+    logger.info(f"Dataset fingerprint {fingerprint} and generation {generation} were saved into {index} _meta.")
+
+# Name of a new versioned index, the app searches it through the ES_INDEX alias
+def versioned_index_name():
+    return f"{ES_INDEX}-v{time.strftime('%Y%m%d%H%M%S')}"
+
+# Point the ES_INDEX alias to the new index in one atomic request and delete the indexes it pointed to before.
+# An index named ES_INDEX (created before the aliases) is removed in the same request, so there is no moment
+# when the app searches nothing.
+def swap_alias(es_client, new_index):
+    actions = [{"add": {"index": new_index, "alias": ES_INDEX}}]
+    old_indexes = []
+    if es_client.indices.exists_alias(name=ES_INDEX):
+        old_indexes = [index for index in es_client.indices.get_alias(name=ES_INDEX) if index != new_index]
+        actions = [{"remove": {"index": index, "alias": ES_INDEX}} for index in old_indexes] + actions
+    elif es_client.indices.exists(index=ES_INDEX):
+        actions = [{"remove_index": {"index": ES_INDEX}}] + actions
+    es_client.indices.update_aliases(actions=actions)
+    logger.info(f"Alias {ES_INDEX} was switched to {new_index}.")
+
+    for index in old_indexes:
+        es_client.indices.delete(index=index, ignore_unavailable=True)
+        logger.info(f"Previous index {index} was deleted.")
+
+# Vector size of the embeddings: from the loaded model or from the pre-embedded corpus
+def embedding_dims(encoding_model):
+    if encoding_model is not None:
+        return encoding_model.get_sentence_embedding_dimension()
+    return read_corpus_meta(CORPUS_PATH)["dims"]
+
+# Create an ElasticSearch index with vector fields mapped according to the vector index profile
+# (exclude_vectors=False keeps vectors in _source, as in the indexes before the lean payload; used by benchmarks)
+def es_create_index(es_client, dims, profile=None, index=ES_INDEX, generation=0, exclude_vectors=True):
+    profile = profile or vector_index_profile()
+    logger.info(f"Creating a new ES index with name: {index} (vector index profile: {profile['name']}, dims: {dims}) ... ")
     
     index_settings = {
         "settings": {
@@ -47,6 +135,17 @@ def es_create_and_indexing(es_client, encoding_model):
             "number_of_replicas": 0
         },
         "mappings": {
+            "_meta": {
+                "model": ENCODER_ID,
+                "mapping_version": MAPPING_VERSION,
+                "vector_profile": profile_signature(profile),
+                "dims": dims,
+                "generation": generation
+            },
+            # Vectors are indexed but not stored in _source, so search responses never carry them
+            "_source": {
+                "excludes": VECTOR_FIELDS if exclude_vectors else []
+            },
             "properties": {
                 "id": {"type": "keyword"},
                 "text": {"type": "text"},
@@ -55,59 +154,182 @@ def es_create_and_indexing(es_client, encoding_model):
                 "youtube_video_id": {"type": "keyword"},
                 "youtube_link": {"type": "keyword"},
                 "start_time": {"type": "keyword"},
-                "text_vector": {
-                    "type": "dense_vector",
-                    "dims": 384,
-                    "index": True,
-                    "similarity": "cosine"
-                },
-                "video_vector": {
-                    "type": "dense_vector",
-                    "dims": 384,
-                    "index": True,
-                    "similarity": "cosine"
-                },
-                "text_video_vector": {
-                    "type": "dense_vector",
-                    "dims": 384,
-                    "index": True,
-                    "similarity": "cosine"
-                },
+                "content_hash": {"type": "keyword", "index": False},
+                **vector_mappings(dims, profile),
             }
         }
     }
     
     # Create ElasticSearch index
-    es_client.indices.create(index=ES_INDEX, body=index_settings)
-    logger.info(f"A new ES index with name: {ES_INDEX} was created.")
-    
-    logger.info(f"Starting load a dataset...")
-    # Load dataset from json file
-    chunks = load_dataset()
-    logger.info(f"Dataset was loaded.")
+    es_client.indices.create(index=index, body=index_settings)
+    logger.info(f"A new ES index with name: {index} was created.")
+
+# Stream the dataset once and calculate content hashes of all chunks.
+# Only ids and hashes are kept in memory; for duplicated ids the last chunk wins.
+def dataset_hashes():
+    hashes = {}
+    count = 0
+    for chunk in iter_chunks():
+        hashes[chunk["id"]] = content_hash(chunk)
+        count += 1
+    if count != len(hashes):
+        logger.warning(f"Dataset contains {count - len(hashes)} chunks with duplicated ids, only the last of them is indexed.")
+    logger.info(f"Dataset contains {len(hashes)} chunks.")
+    return hashes
+
+# Send index and delete actions to ElasticSearch with disabled refresh
+def es_bulk_indexing(es_client, actions, index=ES_INDEX):
+    logger.info(f"Starting indexing a dataset into {index} ...")
     
-    # ElasticSearch documents indexing
-    logger.info(f"Starting indexing a dataset into {ES_INDEX} ...")
+    previous_settings = disable_refresh_and_replicas(es_client, index)
+    try:
+        stats = bulk_index(es_client, actions)
+    finally:
+        restore_refresh_and_replicas(es_client, index, previous_settings)
     
-    for chunk in tqdm(chunks):
-        text_video = chunk["text"] + chunk["video"]
-        
-        chunk["text_vector"] = encoding_model.encode(chunk["text"])
-        chunk["video_vector"] = encoding_model.encode(chunk["video"])
-        chunk["text_video_vector"] = encoding_model.encode(text_video)
-        
-        es_client.index(index=ES_INDEX, document=chunk)
-        
+    if stats["failed"]:
+        logger.error(f"{stats['failed']} documents were not indexed, see errors above.")
     logger.info(f"Indexing a dataset was completed.")
+    return stats
+
+# Streaming pipeline: read dataset -> select chunks to index -> embed in batches -> index actions.
+# Only one batch of chunks with vectors is kept in memory at once.
+def index_actions(encoding_model, selected_hashes, total, index=ES_INDEX):
+    def selected_chunks():
+        emitted = set()
+        for chunk in iter_chunks():
+            chunk_hash = content_hash(chunk)
+            if selected_hashes.get(chunk["id"]) == chunk_hash and chunk["id"] not in emitted:
+                emitted.add(chunk["id"])
+                chunk["content_hash"] = chunk_hash
+                yield chunk
+    
+    batches = iter_batches(selected_chunks(), INGESTION_BATCH_SIZE)
+    if corpus_is_available():
+        # Vectors are already attached from the pre-embedded corpus
+        embedded_batches = batches
+    elif isinstance(encoding_model, EmbeddingWorkerPool):
+        # Calculate embeddings in parallel worker processes, each of them holds its own model
+        embedded_batches = encoding_model.embed(batches)
+    else:
+        # Calculate embeddings for every batch of chunks in this process
+        embedded_batches = (embed_chunks(encoding_model, batch) for batch in batches)
+    
+    with tqdm(total=total) as progress:
+        for batch in embedded_batches:
+            for chunk in batch:
+                yield {"index": {"_index": index, "_id": chunk["id"]}}, chunk
+            progress.update(len(batch))
+
+# Create a new versioned ElasticSearch index, index the dataset chunks into it and switch the ES_INDEX alias to it.
+# The app keeps searching the previous index until the new one is complete. If some documents were not indexed,
+# the previous index stays in place (the new one is used only if there is no previous index).
+def es_create_and_indexing(es_client, encoding_model, fingerprint):
+    # Generation of the new index continues the generation of the previous one
+    generation = index_meta(es_client).get("generation", 0)
+    new_index = versioned_index_name()
+    es_create_index(es_client, embedding_dims(encoding_model), index=new_index, generation=generation)
+    
+    try:
+        hashes = dataset_hashes()
+        stats = es_bulk_indexing(es_client, index_actions(encoding_model, hashes, len(hashes), new_index), new_index)
+    except Exception:
+        es_client.indices.delete(index=new_index, ignore_unavailable=True)
+        raise
+    
+    if stats["failed"] and es_client.indices.exists(index=ES_INDEX):
+        logger.error(f"The new index {new_index} is incomplete, {ES_INDEX} is not switched to it.")
+        es_client.indices.delete(index=new_index, ignore_unavailable=True)
+        return
+    if not stats["failed"]:
+        save_index_fingerprint(es_client, fingerprint, new_index)
+    swap_alias(es_client, new_index)
+    logger.info(f"Data ingestion was completed.")
+
+# Compare content hashes of the dataset chunks with the indexed ones: returns hashes of new or changed chunks
+# and ids of indexed documents which are not in the dataset anymore
+def diff_hashes(hashes, indexed_hashes):
+    changed_hashes = {
+        chunk_id: chunk_hash for chunk_id, chunk_hash in hashes.items()
+        if indexed_hashes.get(chunk_id) != chunk_hash
+    }
+    deleted_ids = [doc_id for doc_id in indexed_hashes if doc_id not in hashes]
+    return changed_hashes, deleted_ids
+
+# Update the existing ElasticSearch index: embed and upsert only new or changed chunks,
+# delete documents of chunks which are not in the dataset anymore
+def es_incremental_indexing(es_client, encoding_model, fingerprint):
+    if not es_client.indices.exists(index=ES_INDEX):
+        return es_create_and_indexing(es_client, encoding_model, fingerprint)
+    if not index_mappings_match(index_meta(es_client), embedding_dims(encoding_model)):
+        # Mappings of existing vector fields and _source can't be changed, so a new index is built and swapped in
+        logger.info(f"Mappings, vector index profile or encoder of {ES_INDEX} were changed, the index will be rebuilt.")
+        return es_create_and_indexing(es_client, encoding_model, fingerprint)
+    
+    hashes = dataset_hashes()
+    
+    # Content hashes of the documents which are already in the index
+    indexed_hashes = {
+        hit["_id"]: hit["_source"].get("content_hash")
+        for hit in scan(es_client, index=ES_INDEX, query={"query": {"match_all": {}}}, _source=["content_hash"])
+    }
+    changed_hashes, deleted_ids = diff_hashes(hashes, indexed_hashes)
+    logger.info(f"Incremental ingestion: {len(changed_hashes)} new or changed chunks, "
+                f"{len(deleted_ids)} deleted chunks, {len(hashes) - len(changed_hashes)} unchanged chunks.")
+    
+    def actions():
+        if changed_hashes:
+            yield from index_actions(encoding_model, changed_hashes, len(changed_hashes))
+        for doc_id in deleted_ids:
+            yield {"delete": {"_index": ES_INDEX, "_id": doc_id}}, None
+    
+    stats = {"failed": 0}
+    if changed_hashes or deleted_ids:
+        stats = es_bulk_indexing(es_client, actions())
+    if not stats["failed"]:
+        save_index_fingerprint(es_client, fingerprint)
     logger.info(f"Data ingestion was completed.")
 
+# Build the serialized BM25 index for the in-process keyword search, if the dataset was changed since the last build
+def build_keyword_index(fingerprint):
+    meta = read_bm25_meta(BM25_INDEX_PATH)
+    if meta is not None and meta["fingerprint"] == fingerprint:
+        logger.info(f"BM25 index {BM25_INDEX_PATH} is up to date.")
+        return
+    logger.info(f"Building BM25 index {BM25_INDEX_PATH} ...")
+    save_bm25_index(build_bm25_index(iter_chunks(), fingerprint), BM25_INDEX_PATH)
+
 
 def data_ingestion():
     try:
-        logger.info("Starting Dataset ingestion ... ")
-        model = SentenceTransformer(SENTENCE_TRANSFORMERS_MODEL)
+        logger.info(f"Starting Dataset ingestion in {INGESTION_MODE} mode ... ")
         es_client = Elasticsearch([ES_URL])
-        es_create_and_indexing(es_client, model)
+        fingerprint = dataset_fingerprint()
+        build_keyword_index(fingerprint)
+        
+        # Skip the run if the same dataset was already ingested with the same model
+        if INGESTION_MODE == "incremental" and index_meta(es_client).get("fingerprint") == fingerprint:
+            logger.info(f"Dataset and model were not changed since the last ingestion (fingerprint {fingerprint}). Skipping.")
+            return
+        
+        # The model is not needed for the pre-embedded corpus. With several workers every worker
+        # process loads its own model and the vector size comes from the workers, this process loads no model.
+        model = None
+        if corpus_is_available():
+            logger.info(f"Using the pre-embedded corpus {CORPUS_PATH} instead of {DATASET_PATH}.")
+        elif INGESTION_WORKERS > 1:
+            model = EmbeddingWorkerPool(INGESTION_WORKERS)
+        else:
+            model = load_encoder()
+        try:
+            if INGESTION_MODE == "incremental":
+                es_incremental_indexing(es_client, model, fingerprint)
+            else:
+                es_create_and_indexing(es_client, model, fingerprint)
+        finally:
+            if isinstance(model, EmbeddingWorkerPool):
+                model.close()
+        log_peak_memory("dataset ingestion")
         logger.info("Dataset ingestion was completed.")
     except Exception as e:
         return logger.error(f"An error occurred with data ingestion: {str(e)}")
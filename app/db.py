@@ -47,6 +47,8 @@ def init_db():
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
+            # Time when an app process took the conversation for the background relevance evaluation
+            cur.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS evaluation_claimed_at TIMESTAMP WITH TIME ZONE")
             
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS feedback (
@@ -101,6 +103,90 @@ def save_conversation(conversation_id, question, answer_data, playlist, timestam
     finally:
         conn.close()
 
+# Update the relevance evaluation of the conversation, it is evaluated in the background after saving
+def update_conversation_evaluation(conversation_id, relevance, explanation, eval_tokens):
+    conn = get_db_connection()
+    try:
+        logger.info(f"Trying to update evaluation of conversation {conversation_id} ...")
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE conversations SET
+                    relevance = %s, relevance_explanation = %s,
+                    eval_prompt_tokens = %s, eval_completion_tokens = %s, eval_total_tokens = %s
+                WHERE id = %s
+                """,
+                (
+                    relevance,
+                    explanation,
+                    eval_tokens["prompt_tokens"],
+                    eval_tokens["completion_tokens"],
+                    eval_tokens["total_tokens"],
+                    conversation_id,
+                ),
+            )
+        conn.commit()
+        logger.info("Scripts for updating conversation evaluation were successfully completed.")
+    finally:
+        conn.close()
+
+# Claim the conversation for the relevance evaluation: its relevance is changed from pending to evaluating
+# in one statement, so the conversation is evaluated only by the process which claimed it.
+# Returns False if the conversation was claimed by another process (or already evaluated).
+def claim_conversation(conversation_id, pending, evaluating):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE conversations SET relevance = %s, evaluation_claimed_at = NOW()
+                WHERE id = %s AND relevance = %s
+                RETURNING id
+            """, (evaluating, conversation_id, pending))
+            claimed = cur.fetchone() is not None
+        conn.commit()
+        return claimed
+    finally:
+        conn.close()
+
+# Claim conversations which are still waiting for the relevance evaluation: pending conversations older than
+# min_age_seconds (e.g. the queue was full or the app was restarted) and conversations whose claim is older
+# than claim_timeout_seconds (the process which claimed them has died). Rows which are being claimed
+# by another process are skipped. Returns the claimed conversations.
+def claim_pending_conversations(pending, evaluating, min_age_seconds=300, claim_timeout_seconds=900, limit=100):
+    conn = get_db_connection()
+    try:
+        logger.info("Trying to claim conversations with pending evaluation ...")
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute("""
+                UPDATE conversations SET relevance = %s, evaluation_claimed_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM conversations
+                    WHERE (relevance = %s AND timestamp < NOW() - make_interval(secs => %s))
+                       OR (relevance = %s AND evaluation_claimed_at < NOW() - make_interval(secs => %s))
+                    ORDER BY timestamp LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, question, answer
+            """, (evaluating, pending, min_age_seconds, evaluating, claim_timeout_seconds, limit))
+            conversations = cur.fetchall()
+        conn.commit()
+        return conversations
+    finally:
+        conn.close()
+
+# Return the claimed conversation to pending (e.g. it can't be queued now), another process may claim it later
+def release_conversation(conversation_id, pending, evaluating):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE conversations SET relevance = %s, evaluation_claimed_at = NULL
+                WHERE id = %s AND relevance = %s
+            """, (pending, conversation_id, evaluating))
+        conn.commit()
+    finally:
+        conn.close()
+
 # Save feedback into Postgres DB
 def save_feedback(conversation_id, feedback, timestamp=None):
     if timestamp is None:
@@ -0,0 +1,209 @@
+import os
+import json
+import logging
+import time
+import queue
+import socket
+import struct
+import threading
+import socketserver
+from concurrent.futures import Future
+
+import numpy as np
+
+from config import EMBEDDING_SERVICE_SOCKET, EMBEDDING_SERVICE_MAX_BATCH, EMBEDDING_SERVICE_MAX_WAIT_MS
+from config import EMBEDDING_SERVICE_LOGS_PATH, ENCODER_ID, ENCODER_BACKEND
+from config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Protocol over the local socket: every message is a 4-byte big-endian length followed by the body.
+# Request body: JSON {"texts": [...]} or {"info": true}.
+# Response: JSON header {"shape": [rows, dims]} (or {"error": ...}, or the info) and, for vectors,
+# a second message with the raw float32 bytes.
+
+def send_message(connection, body):
+    connection.sendall(struct.pack(">I", len(body)) + body)
+
+def receive_exactly(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        block = connection.recv(size - len(data))
+        if not block:
+            raise ConnectionError("Connection was closed")
+        data.extend(block)
+    return bytes(data)
+
+def receive_message(connection):
+    size, = struct.unpack(">I", receive_exactly(connection, 4))
+    return receive_exactly(connection, size)
+
+
+# Collects encode requests from all connections into micro-batches: the first request waits at most
+# max_wait_ms for others, and a batch is encoded as soon as it has max_batch texts.
+# One forward pass serves many concurrent single-question requests. Requests with more than max_batch texts
+# are split into chunks, so a bulk request never becomes one huge forward pass and requests of other
+# connections are batched between its chunks.
+class MicroBatcher:
+    def __init__(self, encoder, max_batch=EMBEDDING_SERVICE_MAX_BATCH, max_wait_ms=EMBEDDING_SERVICE_MAX_WAIT_MS):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    # Encode the texts in the next batches, blocks until the vectors are ready
+    def encode(self, texts):
+        futures = []
+        for start in range(0, max(len(texts), 1), self.max_batch):
+            future = Future()
+            self.requests.put((texts[start:start + self.max_batch], future))
+            futures.append(future)
+        return np.concatenate([future.result() for future in futures])
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self.encode_batch(batch)
+
+    def encode_batch(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            vectors = self.encoder.encode(texts, batch_size=self.max_batch, convert_to_numpy=True,
+                                          show_progress_bar=False).astype(np.float32)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for request_texts, future in batch:
+            future.set_result(vectors[start:start + len(request_texts)])
+            start += len(request_texts)
+
+        self.batches += 1
+        self.texts += len(texts)
+        logger.debug(f"Encoded a batch of {len(texts)} texts from {len(batch)} requests "
+                     f"(average batch: {self.texts / self.batches:.1f} texts).")
+
+
+# Handler of one client connection, a client keeps the connection open for many requests
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = json.loads(receive_message(self.request))
+            except (ConnectionError, OSError):
+                return
+
+            if request.get("info"):
+                send_message(self.request, json.dumps({
+                    "encoder_id": ENCODER_ID,
+                    "dims": self.server.batcher.encoder.get_sentence_embedding_dimension(),
+                }).encode())
+                continue
+
+            try:
+                vectors = self.server.batcher.encode(request["texts"])
+            except Exception as e:
+                logger.error(f"Encoding failed: {str(e)}")
+                send_message(self.request, json.dumps({"error": f"{type(e).__name__}: {str(e)}"}).encode())
+                continue
+            send_message(self.request, json.dumps({"shape": list(vectors.shape)}).encode())
+            send_message(self.request, vectors.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+# Run the service: one encoder per host shared by all app processes through the local socket
+def serve(socket_path=EMBEDDING_SERVICE_SOCKET):
+    from encoders import load_encoder
+
+    encoder = load_encoder()
+    encoder.encode(["warm up"])
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with EmbeddingServer(socket_path, EmbeddingRequestHandler) as server:
+        server.batcher = MicroBatcher(encoder)
+        logger.info(f"Embedding service ({ENCODER_BACKEND}) is listening on {socket_path} "
+                    f"(max batch: {EMBEDDING_SERVICE_MAX_BATCH}, max wait: {EMBEDDING_SERVICE_MAX_WAIT_MS} ms).")
+        server.serve_forever()
+
+
+# Client of the embedding service with the encoder interface of embeddings.py
+# (encode and get_sentence_embedding_dimension). Every thread uses its own connection.
+class RemoteEncoder:
+    def __init__(self, socket_path=EMBEDDING_SERVICE_SOCKET):
+        self.socket_path = socket_path
+        self.local = threading.local()
+        info = self.request({"info": True})
+        self.dims = info["dims"]
+        if info["encoder_id"] != ENCODER_ID:
+            logger.warning(f"Embedding service uses encoder {info['encoder_id']}, but {ENCODER_ID} is configured.")
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(self.socket_path)
+            self.local.connection = connection
+        return self.local.connection
+
+    # Send a request, the connection is re-opened once if the service was restarted
+    def request(self, body, with_vectors=False):
+        for attempt in range(2):
+            try:
+                connection = self.connection()
+                send_message(connection, json.dumps(body).encode())
+                header = json.loads(receive_message(connection))
+                if "error" in header:
+                    raise RuntimeError(f"Embedding service failed: {header['error']}")
+                if not with_vectors:
+                    return header
+                return np.frombuffer(receive_message(connection), dtype=np.float32).reshape(header["shape"])
+            except (ConnectionError, OSError):
+                if getattr(self.local, "connection", None) is not None:
+                    self.local.connection.close()
+                    self.local.connection = None
+                if attempt:
+                    raise
+
+    def get_sentence_embedding_dimension(self):
+        return self.dims
+
+    # Texts are sent in requests of at most batch_size texts one after another,
+    # so a bulk call doesn't hold the service while single questions of other processes wait
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        single_text = isinstance(texts, str)
+        if single_text:
+            texts = [texts]
+        if not texts:
+            return np.empty((0, self.dims), dtype=np.float32)
+        texts = list(texts)
+        batch_size = batch_size or EMBEDDING_SERVICE_MAX_BATCH
+        vectors = np.concatenate([self.request({"texts": texts[start:start + batch_size]}, with_vectors=True)
+                                  for start in range(0, len(texts), batch_size)])
+        return vectors[0] if single_text else vectors
+
+
+if __name__ == "__main__":
+    logger = setup_logging(EMBEDDING_SERVICE_LOGS_PATH)
+    logger.info("Starting embedding service ...")
+    serve()
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_STALE_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Size of the key (md5 digest of model name and normalized text) in bytes
+KEY_BYTES = 16
+
+# Normalize text before hashing: the same text with different whitespace gets the same embedding
+def normalize_text(text):
+    return " ".join(text.split())
+
+# Calculate the key of the embedding from model name and normalized text
+def text_key(model_name, text):
+    return hashlib.md5(f"{model_name}\0{normalize_text(text)}".encode()).digest()
+
+
+# Persistent embedding store shared by ingestion and app processes.
+# Vectors are kept in a memory-mapped float32 matrix, the keys in a compact (entries x 16 bytes) matrix
+# and the last access time of every slot is used for LRU eviction when the store is full.
+# Every encoder (model, backend and vector size) has its own store directory, so processes with different
+# encoders never re-create the files which another process has memory-mapped.
+# The capacity is a property of the store saved in its meta: max_entries is used only when the store is created,
+# so processes with different EMBEDDING_CACHE_MAX_ENTRIES share the existing store instead of re-creating it.
+class EmbeddingStore:
+    def __init__(self, path, model_name, dims, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.model_name = model_name
+        self.dims = dims
+        self.max_entries = max_entries
+        self.thread_lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        with self.lock():
+            self.open()
+
+    # Lock the store for changes both between threads and between processes
+    @contextmanager
+    def lock(self):
+        with self.thread_lock, open(os.path.join(self.path, "store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Open memory-mapped files of the store, create them if the store is empty or was built for another model
+    def open(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        meta = {"model": self.model_name, "dims": self.dims, "max_entries": self.max_entries}
+
+        mode = "w+"
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                saved_meta = json.load(file)
+            if saved_meta.get("model") == self.model_name and saved_meta.get("dims") == self.dims:
+                mode = "r+"
+                if saved_meta["max_entries"] != self.max_entries:
+                    logger.info(f"Embedding store {self.path} keeps its capacity of {saved_meta['max_entries']} entries "
+                                f"(delete the directory to use {self.max_entries}).")
+                meta = saved_meta
+                self.max_entries = saved_meta["max_entries"]
+            else:
+                logger.info(f"Embedding store {self.path} was built for another encoder, it will be re-created.")
+
+        self.vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode=mode,
+                                 shape=(self.max_entries, self.dims))
+        self.keys = np.memmap(os.path.join(self.path, "keys.bin"), dtype=np.uint8, mode=mode,
+                              shape=(self.max_entries, KEY_BYTES))
+        # Last access time of every slot, zero means the slot is free
+        self.last_used = np.memmap(os.path.join(self.path, "last_used.f64"), dtype=np.float64, mode=mode,
+                                   shape=(self.max_entries,))
+        # Generation counter which is incremented on every write to notice changes made by other processes
+        self.header = np.memmap(os.path.join(self.path, "header.i64"), dtype=np.int64, mode=mode, shape=(1,))
+
+        if mode == "w+":
+            self.header.flush()
+            with open(meta_path, 'w') as file:
+                json.dump(meta, file)
+        else:
+            # Modification time of the meta is the last time the store was opened (see prune_stale_stores)
+            os.utime(meta_path)
+
+        self.load_index()
+        logger.info(f"Embedding store {self.path} was opened with {len(self.slots)} entries.")
+
+    # Rebuild the in-memory mapping from keys to slots
+    def load_index(self):
+        used_slots = np.flatnonzero(self.last_used > 0)
+        self.slots = {self.keys[slot].tobytes(): int(slot) for slot in used_slots}
+        self.generation = int(self.header[0])
+
+    # Look up vectors by keys. Returns a vectors matrix and a mask of the keys which were found.
+    def get_many(self, keys):
+        vectors = np.empty((len(keys), self.dims), dtype=np.float32)
+        found = np.zeros(len(keys), dtype=bool)
+
+        # Rows are read under the lock, so that put_many of another thread or process can't reuse a slot
+        # between the key check and the read of its vector
+        with self.lock():
+            if int(self.header[0]) != self.generation:
+                self.load_index()
+            slots = [self.slots.get(key, -1) for key in keys]
+
+            for i, (key, slot) in enumerate(zip(keys, slots)):
+                # The slot could be reused by another process, so check the key stored in the slot
+                found[i] = slot >= 0 and self.last_used[slot] > 0 and self.keys[slot].tobytes() == key
+
+            hit_slots = np.array([slot for slot, hit in zip(slots, found) if hit], dtype=np.int64)
+            if len(hit_slots):
+                vectors[found] = self.vectors[hit_slots]
+                self.last_used[hit_slots] = time.time()
+        return vectors, found
+
+    # Save vectors by keys, evicting the least recently used entries when the store is full
+    def put_many(self, keys, vectors):
+        with self.lock():
+            if int(self.header[0]) != self.generation:
+                self.load_index()
+
+            new_entries = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.slots:
+                    new_entries[key] = vector
+            if not new_entries:
+                return
+            new_keys = list(new_entries)[:self.max_entries]
+
+            free_slots = np.flatnonzero(self.last_used == 0)
+            evict_count = len(new_keys) - len(free_slots)
+            if evict_count > 0:
+                used_slots = np.flatnonzero(self.last_used > 0)
+                evicted = used_slots[np.argpartition(self.last_used[used_slots], evict_count - 1)[:evict_count]]
+                for slot in evicted:
+                    self.slots.pop(self.keys[slot].tobytes(), None)
+                self.last_used[evicted] = 0
+                free_slots = np.concatenate([free_slots, evicted])
+                logger.debug(f"{evict_count} entries were evicted from the embedding store.")
+
+            slots = free_slots[:len(new_keys)]
+            self.vectors[slots] = np.stack([new_entries[key] for key in new_keys])
+            self.keys[slots] = np.frombuffer(b"".join(new_keys), dtype=np.uint8).reshape(-1, KEY_BYTES)
+            self.last_used[slots] = time.time()
+            for key, slot in zip(new_keys, slots):
+                self.slots[key] = int(slot)
+
+            self.header[0] += 1
+            self.generation = int(self.header[0])
+            for array in (self.vectors, self.keys, self.last_used, self.header):
+                array.flush()
+
+
+# Last time the store was opened or changed: newest modification time of its files (writes through the memory maps
+# update it as well)
+def last_modified(path):
+    return max((entry.stat().st_mtime for entry in os.scandir(path) if entry.is_file()), default=0)
+
+# Delete store directories of other encoders (e.g. after the model or backend was changed) which were not opened
+# or changed for max_age_days. A store which is locked by another process at the moment is kept.
+def prune_stale_stores(path, keep_path, max_age_days=EMBEDDING_CACHE_STALE_DAYS):
+    if max_age_days <= 0 or not os.path.isdir(path):
+        return
+    min_time = time.time() - max_age_days * 24 * 3600
+    for entry in os.scandir(path):
+        store_path = entry.path
+        if not entry.is_dir() or os.path.abspath(store_path) == os.path.abspath(keep_path):
+            continue
+        if not os.path.exists(os.path.join(store_path, "meta.json")) or last_modified(store_path) >= min_time:
+            continue
+        with open(os.path.join(store_path, "store.lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            shutil.rmtree(store_path, ignore_errors=True)
+        logger.info(f"Stale embedding store {store_path} was deleted.")
+
+
+stores = {}
+stores_lock = threading.Lock()
+
+# Directory of the store of the encoder, e.g. paraphrase-MiniLM-L6-v2__onnx_int8__384d
+def embedding_store_path(model_name, dims, path=EMBEDDING_CACHE_PATH):
+    encoder_name = re.sub(r"[^\w.-]+", "__", model_name)
+    return os.path.join(path, f"{encoder_name}__{dims}d")
+
+# Get the embedding store for the encoder (model name with backend, one store per process and encoder).
+# Stale stores of other encoders are pruned when the store is opened.
+def get_embedding_store(model_name, dims):
+    with stores_lock:
+        if (model_name, dims) not in stores:
+            store_path = embedding_store_path(model_name, dims)
+            stores[(model_name, dims)] = EmbeddingStore(store_path, model_name, dims)
+            prune_stale_stores(EMBEDDING_CACHE_PATH, store_path)
+        return stores[(model_name, dims)]
@@ -0,0 +1,68 @@
+import logging
+import numpy as np
+
+from config import EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_ENABLED, ENCODER_ID
+from embedding_store import get_embedding_store, text_key
+
+logger = logging.getLogger(__name__)
+
+# Encode a list of texts in batches reading through the persistent embedding store:
+# only texts which are missing in the store are passed to the model.
+def encode_texts(encoding_model, texts, batch_size=EMBEDDING_BATCH_SIZE, use_cache=EMBEDDING_CACHE_ENABLED):
+    dims = encoding_model.get_sentence_embedding_dimension()
+    if not texts:
+        return np.empty((0, dims), dtype=np.float32)
+    if not use_cache:
+        return encode_batches(encoding_model, texts, batch_size)
+
+    store = get_embedding_store(ENCODER_ID, dims)
+    keys = [text_key(ENCODER_ID, text) for text in texts]
+    vectors, found = store.get_many(keys)
+
+    missing = np.flatnonzero(~found)
+    logger.debug(f"Embedding store: {len(texts) - len(missing)} hits, {len(missing)} misses.")
+    if len(missing):
+        missing_vectors = encode_batches(encoding_model, [texts[i] for i in missing], batch_size)
+        vectors[missing] = missing_vectors
+        store.put_many([keys[i] for i in missing], missing_vectors)
+    return vectors
+
+# Encode a list of texts with the model in batches. Texts are sorted by length (longest first)
+# so that every batch holds similar-sized inputs and wastes little on padding,
+# then the vectors are put back into the original order.
+def encode_batches(encoding_model, texts, batch_size=EMBEDDING_BATCH_SIZE):
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    sorted_texts = [texts[i] for i in order]
+
+    sorted_vectors = encoding_model.encode(
+        sorted_texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+
+    vectors = np.empty_like(sorted_vectors)
+    vectors[order] = sorted_vectors
+    return vectors
+
+# Calculate text, video and text+video vectors for a list of chunks.
+# Every distinct video title is encoded only once and shared between its chunks.
+def embed_chunks(encoding_model, chunks, batch_size=EMBEDDING_BATCH_SIZE, use_cache=EMBEDDING_CACHE_ENABLED):
+    texts = [chunk["text"] for chunk in chunks]
+    text_videos = [chunk["text"] + chunk["video"] for chunk in chunks]
+    videos = list(dict.fromkeys(chunk["video"] for chunk in chunks))
+
+    logger.debug(f"Encoding {len(texts)} chunks and {len(videos)} distinct video titles (batch size: {batch_size}) ...")
+    text_vectors = encode_texts(encoding_model, texts, batch_size, use_cache)
+    video_vectors = encode_texts(encoding_model, videos, batch_size, use_cache)
+    text_video_vectors = encode_texts(encoding_model, text_videos, batch_size, use_cache)
+
+    video_positions = {video: i for i, video in enumerate(videos)}
+
+    for i, chunk in enumerate(chunks):
+        chunk["text_vector"] = text_vectors[i]
+        chunk["video_vector"] = video_vectors[video_positions[chunk["video"]]]
+        chunk["text_video_vector"] = text_video_vectors[i]
+
+    logger.debug("Encoding chunks was completed.")
+    return chunks
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import shutil
+import logging
+
+import numpy as np
+
+from config import SENTENCE_TRANSFORMERS_MODEL, ENCODER_BACKEND, ENCODER_THREADS, ONNX_MODEL_PATH, EMBEDDING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Encoder backends:
+#   torch - SentenceTransformer in fp32 (the original encoder)
+#   torch_int8 - SentenceTransformer with dynamic int8 quantization of the Linear layers
+#   onnx - the transformer exported to an ONNX graph and run by onnxruntime (torch is needed only for the export)
+#   onnx_int8 - the ONNX graph with dynamically quantized int8 weights
+ENCODER_BACKENDS = ["torch", "torch_int8", "onnx", "onnx_int8"]
+
+
+# Load the encoder of the backend. Every encoder has encode(texts, batch_size, ...) and
+# get_sentence_embedding_dimension() like SentenceTransformer, so it can be used by embeddings.py as is.
+def load_encoder(backend=ENCODER_BACKEND, model_name=SENTENCE_TRANSFORMERS_MODEL, threads=ENCODER_THREADS):
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend}. Available backends: {', '.join(ENCODER_BACKENDS)}")
+
+    start_time = time.perf_counter()
+    if backend.startswith("torch"):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        encoder = SentenceTransformer(model_name, device="cpu")
+        if backend == "torch_int8":
+            torch.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    else:
+        encoder = OnnxEncoder(onnx_model_dir(model_name), quantized=backend == "onnx_int8", threads=threads)
+
+    logger.info(f"Encoder {model_name} ({backend}) was loaded in {time.perf_counter() - start_time:.2f} s.")
+    return encoder
+
+
+# Directory of the exported ONNX model, it is exported on the first use
+def onnx_model_dir(model_name=SENTENCE_TRANSFORMERS_MODEL, path=ONNX_MODEL_PATH):
+    model_dir = os.path.join(path, model_name.replace("/", "__"))
+    if not os.path.exists(os.path.join(model_dir, "encoder.json")):
+        export_onnx(model_name, model_dir)
+    return model_dir
+
+# Export the transformer of the SentenceTransformer model to ONNX together with the tokenizer,
+# pooling settings and an int8 quantized copy of the graph
+def export_onnx(model_name, model_dir):
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    logger.info(f"Exporting {model_name} to ONNX into {model_dir} ...")
+    model = SentenceTransformer(model_name, device="cpu")
+    module_types = [type(module).__name__ for module in model]
+    if module_types[:2] != ["Transformer", "Pooling"] or not set(module_types[2:]) <= {"Normalize"}:
+        raise ValueError(f"Model {model_name} with modules {module_types} can't be exported to ONNX.")
+
+    transformer, pooling = model[0], model[1]
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in ("mean", "cls", "max"):
+        raise ValueError(f"Pooling mode {pooling_mode} of {model_name} is not supported by the ONNX encoder.")
+
+    # Write into a temporary directory first, so that other processes never load a partially exported model
+    temp_dir = f"{model_dir}.tmp-{os.getpid()}"
+    os.makedirs(temp_dir, exist_ok=True)
+
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["warm up"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(transformer.auto_model.eval(), ({name: sample[name] for name in input_names},),
+                          os.path.join(temp_dir, "model.onnx"), input_names=input_names,
+                          output_names=["token_embeddings"], dynamic_axes=dynamic_axes, opset_version=14)
+    quantize_dynamic(os.path.join(temp_dir, "model.onnx"), os.path.join(temp_dir, "model.int8.onnx"),
+                     weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(temp_dir)
+    with open(os.path.join(temp_dir, "encoder.json"), 'w') as file:
+        json.dump({
+            "model": model_name,
+            "dims": model.get_sentence_embedding_dimension(),
+            "max_seq_length": transformer.max_seq_length,
+            "pooling": pooling_mode,
+            "normalize": "Normalize" in module_types,
+            "input_names": input_names,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, file)
+
+    if os.path.exists(model_dir):
+        # Another process has already exported the model
+        shutil.rmtree(temp_dir)
+    else:
+        os.replace(temp_dir, model_dir)
+    logger.info(f"{model_name} was exported to ONNX.")
+
+
+# Encoder which runs the exported ONNX graph with onnxruntime. Tokenization uses the tokenizers library,
+# so neither torch nor transformers are imported.
+class OnnxEncoder:
+    def __init__(self, model_dir, quantized=False, threads=ENCODER_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "encoder.json"), 'r') as file:
+            self.config = json.load(file)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        model_path = os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dims"]
+
+    # Encode a text or a list of texts, the signature is compatible with SentenceTransformer.encode
+    def encode(self, texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        single_text = isinstance(texts, str)
+        if single_text:
+            texts = [texts]
+
+        vectors = np.empty((len(texts), self.config["dims"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            vectors[start:start + batch_size] = self.encode_batch(texts[start:start + batch_size])
+        return vectors[0] if single_text else vectors
+
+    def encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        tokens = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: tokens[name] for name in self.config["input_names"]})[0]
+
+        # Pooling of the token embeddings, the same as the Pooling module of the SentenceTransformer model
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        if self.config["pooling"] == "mean":
+            vectors = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        elif self.config["pooling"] == "max":
+            vectors = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        else:
+            vectors = token_embeddings[:, 0]
+
+        if self.config["normalize"]:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
@@ -1,13 +1,131 @@
 
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
+import os
+import time
+import asyncio
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from config import ES_INDEX, ES_URL, SENTENCE_TRANSFORMERS_MODEL, APP_LOGS_PATH
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+
+from config import ES_INDEX, ES_URL, SENTENCE_TRANSFORMERS_MODEL, ENCODER_BACKEND, EMBEDDING_SERVICE_SOCKET, APP_LOGS_PATH, KNN_NUM_CANDIDATES
+from config import QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_PERSISTENT, SEARCH_RESULTS_NUMBER
+from config import HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT, HYBRID_RANK_CONSTANT, HYBRID_WINDOW_SIZE
+from config import VECTOR_SEARCH_BACKEND, KEYWORD_SEARCH_BACKEND, BM25_INDEX_PATH, WARM_UP_SEARCH_TYPES
+from config import SEARCH_COLLAPSE, COLLAPSE_FETCH_FACTOR, SEARCH_BATCH_CHUNK_SIZE, SEARCH_BATCH_CONCURRENCY
+from config import ES_CONNECTIONS_PER_NODE, ES_REQUEST_TIMEOUT, ES_MAX_RETRIES, ES_RETRY_ON_TIMEOUT
 from config import setup_logging
+from caches import LRUCache, normalize_query
+from embeddings import encode_texts
+from encoders import load_encoder
+from search_cache import create_search_cache
+from numpy_search import build_numpy_index
+from bm25 import build_bm25_index, load_bm25_index
+from corpus import iter_dataset
+from passages import collapse_passages
+
+# Fields of the documents which are needed to build the prompt (and "id" for evaluation)
+# (youtube_video_id and start_time - to collapse overlapping windows of the same video)
+SOURCE_FIELDS = ["id", "text", "video", "playlist", "youtube_link", "youtube_video_id", "start_time"]
+# Return only the documents from search responses, without shards info, timings, scores, etc.
+FILTER_PATH = ["hits.hits._source"]
+HYBRID_FILTER_PATH = ["responses.hits.hits._id", "responses.hits.hits._source", "responses.error"]
+# Batched searches also keep the server-side time of every search
+BATCH_FILTER_PATH = HYBRID_FILTER_PATH + ["responses.took"]
+# Connection pool, timeouts and retries of the sync and async clients.
+# Pooled connections are kept alive between requests, so searches don't pay for new TCP connections.
+ES_CLIENT_OPTIONS = {
+    "connections_per_node": ES_CONNECTIONS_PER_NODE,
+    "request_timeout": ES_REQUEST_TIMEOUT,
+    "max_retries": ES_MAX_RETRIES,
+    "retry_on_timeout": ES_RETRY_ON_TIMEOUT,
+}
 
 logger = setup_logging(APP_LOGS_PATH)
-model = SentenceTransformer(SENTENCE_TRANSFORMERS_MODEL)
-es_client = Elasticsearch([ES_URL])
+# The model and the client are created on the first use (see get_model and get_es_client),
+# so a text-only deployment never loads torch and the model
+model = None
+model_lock = threading.Lock()
+es_client = None
+es_client_lock = threading.Lock()
+# Async clients by event loop: the aiohttp session of a client is bound to the loop where it was created
+async_es_clients = weakref.WeakKeyDictionary()
+# In-process cache of query embeddings keyed by normalized query text
+query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+
+# Get the embedding model, it is loaded on the first call.
+# With the embedding service the model is shared by all app processes and only a client is created here.
+def get_model():
+    global model
+    with model_lock:
+        if model is None and EMBEDDING_SERVICE_SOCKET:
+            logger.info(f"Connecting to the embedding service {EMBEDDING_SERVICE_SOCKET} ...")
+            from embedding_service import RemoteEncoder
+            model = RemoteEncoder(EMBEDDING_SERVICE_SOCKET)
+        elif model is None:
+            logger.info(f"Loading the embedding model {SENTENCE_TRANSFORMERS_MODEL} ({ENCODER_BACKEND}) ...")
+            model = load_encoder()
+        return model
+
+# Get the sync Elasticsearch client, it is created on the first call
+def get_es_client():
+    global es_client
+    with es_client_lock:
+        if es_client is None:
+            es_client = Elasticsearch([ES_URL], **ES_CLIENT_OPTIONS)
+        return es_client
+
+# Encode the query, repeated questions are served from the in-process cache
+# (and, optionally, from the persistent embedding store before running the model)
+def encode_query(query):
+    key = normalize_query(query)
+    query_vector = query_embedding_cache.get(key)
+    if query_vector is None:
+        query_vector = encode_texts(get_model(), [query], use_cache=QUERY_EMBEDDING_CACHE_PERSISTENT)[0]
+        # Cached vectors are shared between requests, so they must not be modified
+        query_vector.setflags(write=False)
+        query_embedding_cache.put(key, query_vector)
+    logger.debug(f"Query embedding cache: {query_embedding_cache.stats()}")
+    return query_vector
+
+# Get the async client of the running event loop
+def get_async_es_client():
+    loop = asyncio.get_running_loop()
+    client = async_es_clients.get(loop)
+    if client is None:
+        client = AsyncElasticsearch([ES_URL], **ES_CLIENT_OPTIONS)
+        async_es_clients[loop] = client
+    return client
+
+# Close the async client of the running event loop (before the loop is closed)
+async def close_async_es_client():
+    client = async_es_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+# Encode several queries at once: vectors of repeated questions come from the cache,
+# the other questions are encoded in one batched call
+def encode_queries(queries):
+    keys = [normalize_query(query) for query in queries]
+    vectors = {key: query_embedding_cache.get(key) for key in keys}
+    missing = {key: query for key, query in zip(keys, queries) if vectors[key] is None}
+    if missing:
+        missing_vectors = encode_texts(get_model(), list(missing.values()), use_cache=QUERY_EMBEDDING_CACHE_PERSISTENT)
+        for key, query_vector in zip(missing, missing_vectors):
+            query_vector.setflags(write=False)
+            query_embedding_cache.put(key, query_vector)
+            vectors[key] = query_vector
+    logger.info(f"Encoded {len(missing)} of {len(queries)} queries, the others were found in the cache.")
+    return [vectors[key] for key in keys]
+
+# Index generation from the index _meta, it is changed by every ingestion run
+# (ES_INDEX is an alias, the response is keyed by the name of the versioned index behind it)
+def index_generation():
+    mapping = next(iter(get_es_client().indices.get_mapping(index=ES_INDEX).values()))["mappings"]
+    return mapping.get("_meta", {}).get("generation")
+
+# Cache of search results, invalidated when the index generation changes
+search_cache = create_search_cache(index_generation)
 
 # Logging responses
 def log_search_response(response, query_type):
@@ -16,10 +134,9 @@ def log_search_response(response, query_type):
     else:
         logger.warning(f"No results found for {query_type} search.")
 
-# Search documents by query
-def keyword_search(query, playlist, num_results=5):
-    logger.info("Starting the sending Keyword search query .....")
-    search_query = {
+# Build keyword search query
+def keyword_search_query(query, playlist, num_results=5):
+    return {
         "size": num_results,
         "query": {
             "bool": {
@@ -36,29 +153,17 @@ def keyword_search(query, playlist, num_results=5):
                     }
                 }
             }
-        }
+        },
+        "_source": SOURCE_FIELDS
     }
-    
-    response = es_client.search(index=ES_INDEX, body=search_query)
 
-    result_docs = []
-    if 'hits' in response and 'hits' in response['hits']:
-        for hit in response['hits']['hits']:
-            result_docs.append(hit['_source'])
-    else:
-        logger.warning("No hits found in the Elasticsearch response.")
-    
-    log_search_response(response, "Keyword")
-    return result_docs
-
-def knn_search(query_vector, playlist, num_results=5):
-    logger.info("Starting the sending KNN search query .....")
-    
+# Build KNN search query
+def knn_search_query(query_vector, playlist, num_results=5):
     knn = {
         "field": "text_vector",     # options: "text_vector", "video_vector", "text_video_vector"
         "query_vector": query_vector,
         "k": num_results,
-        "num_candidates": 10000, 
+        "num_candidates": KNN_NUM_CANDIDATES,
         "filter": {
             "term": {
                 "playlist": playlist
@@ -66,41 +171,427 @@ def knn_search(query_vector, playlist, num_results=5):
         }
     }
     
-    search_query = {
+    return {
         "knn": knn,
-        "_source": ["id", "text", "video", "playlist", "youtube_link"]
+        "_source": SOURCE_FIELDS
     }
-    
-    response = es_client.search(index=ES_INDEX, body=search_query)
 
+# Extract documents from search response
+def response_docs(response):
     result_docs = []
     if 'hits' in response and 'hits' in response['hits']:
         for hit in response['hits']['hits']:
             result_docs.append(hit['_source'])
     else:
         logger.warning("No hits found in the Elasticsearch response.")
+    return result_docs
+
+keyword_index = None
+keyword_index_lock = threading.Lock()
+
+# Get the in-process BM25 index, it is loaded from the file built by the ingestion and reloaded when the file changes.
+# Without the file the index is built from the dataset in memory.
+def get_keyword_index():
+    global keyword_index
+    with keyword_index_lock:
+        if keyword_index is None or keyword_index.is_stale():
+            if os.path.exists(BM25_INDEX_PATH):
+                keyword_index = load_bm25_index(BM25_INDEX_PATH)
+            else:
+                logger.warning(f"BM25 index {BM25_INDEX_PATH} was not found, building it from the dataset ...")
+                keyword_index = build_bm25_index(iter_dataset())
+        return keyword_index
+
+# Search documents by query
+def keyword_search(query, playlist, num_results=5):
+    if KEYWORD_SEARCH_BACKEND == "bm25":
+        result_docs = get_keyword_index().search(query, playlist, num_results, SOURCE_FIELDS)
+        logger.info(f"Keyword search (bm25) returned {len(result_docs)} results.")
+        return result_docs
+    if KEYWORD_SEARCH_BACKEND != "elasticsearch":
+        raise ValueError(f"Unsupported keyword search backend: {KEYWORD_SEARCH_BACKEND}")
+    
+    logger.info("Starting the sending Keyword search query .....")
+    search_query = keyword_search_query(query, playlist, num_results)
+    
+    response = get_es_client().search(index=ES_INDEX, body=search_query, filter_path=FILTER_PATH)
+    result_docs = response_docs(response)
+    
+    log_search_response(response, "Keyword")
+    return result_docs
+
+def knn_search(query_vector, playlist, num_results=5):
+    logger.info("Starting the sending KNN search query .....")
+    search_query = knn_search_query(query_vector, playlist, num_results)
+    
+    response = get_es_client().search(index=ES_INDEX, body=search_query, filter_path=FILTER_PATH)
+    result_docs = response_docs(response)
     
     log_search_response(response, "KNN")
     return result_docs
 
-# Search answer based on two possible approaches - keyword and vector search
-def search_answer(query, playlist, search_type):
+# Vector search backend which sends kNN queries to Elasticsearch
+class ElasticsearchVectorBackend:
+    def search(self, query_vector, playlist, num_results=5):
+        return knn_search(query_vector, playlist, num_results)
+
+    def is_stale(self):
+        return False
+
+# Vector search backends: every backend has search(query_vector, playlist, num_results),
+# which returns the documents in the _source shape, and is_stale()
+VECTOR_BACKENDS = {
+    "elasticsearch": lambda: ElasticsearchVectorBackend(),
+    "numpy": lambda: build_numpy_index(get_model(), SOURCE_FIELDS),
+}
+
+vector_backend = None
+vector_backend_lock = threading.Lock()
+
+# Get the configured vector search backend, it is created on the first use and rebuilt when it is stale
+def get_vector_backend():
+    global vector_backend
+    with vector_backend_lock:
+        if vector_backend is None or vector_backend.is_stale():
+            if VECTOR_SEARCH_BACKEND not in VECTOR_BACKENDS:
+                raise ValueError(f"Unsupported vector search backend: {VECTOR_SEARCH_BACKEND}")
+            logger.info(f"Creating the {VECTOR_SEARCH_BACKEND} vector search backend ...")
+            vector_backend = VECTOR_BACKENDS[VECTOR_SEARCH_BACKEND]()
+        return vector_backend
+
+# Search documents by query vector with the configured backend
+def vector_search(query_vector, playlist, num_results=5):
+    result_docs = get_vector_backend().search(query_vector, playlist, num_results)
+    logger.info(f"Vector search ({VECTOR_SEARCH_BACKEND}) returned {len(result_docs)} results.")
+    return result_docs
+
+# Fuse ranked lists of hits with weighted reciprocal rank fusion: score = sum(weight / (rank_constant + rank))
+def rrf_fuse(ranked_hits, weights, rank_constant=HYBRID_RANK_CONSTANT, num_results=5):
+    scores = {}
+    sources = {}
+    for hits, weight in zip(ranked_hits, weights):
+        for rank, hit in enumerate(hits, start=1):
+            scores[hit['_id']] = scores.get(hit['_id'], 0) + weight / (rank_constant + rank)
+            sources.setdefault(hit['_id'], hit['_source'])
+    
+    ranked_ids = sorted(scores, key=scores.get, reverse=True)[:num_results]
+    return [sources[doc_id] for doc_id in ranked_ids]
+
+# Searches of the hybrid _msearch request: keyword and KNN legs with window_size candidates each
+def hybrid_searches(query, query_vector, playlist, window_size):
+    return [
+        {"index": ES_INDEX}, keyword_search_query(query, playlist, window_size),
+        {"index": ES_INDEX}, knn_search_query(query_vector, playlist, window_size),
+    ]
+
+# Fuse the keyword and KNN legs of the _msearch response
+def fuse_hybrid_response(response, num_results):
+    ranked_hits = []
+    for leg, leg_response in zip(["Keyword", "KNN"], response.get('responses', [])):
+        if 'error' in leg_response:
+            logger.error(f"{leg} leg of the Hybrid search failed: {leg_response['error']}")
+        log_search_response(leg_response, f"Hybrid {leg}")
+        ranked_hits.append(leg_response.get('hits', {}).get('hits', []))
+    
+    result_docs = rrf_fuse(ranked_hits, [HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT], num_results=num_results)
+    logger.info(f"Hybrid search query returned {len(result_docs)} results.")
+    return result_docs
+
+# Fuse documents of the keyword and vector legs which were searched separately
+def fuse_hybrid_docs(keyword_docs, vector_docs, num_results):
+    ranked_hits = [[{'_id': doc['id'], '_source': doc} for doc in docs] for docs in (keyword_docs, vector_docs)]
+    result_docs = rrf_fuse(ranked_hits, [HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT], num_results=num_results)
+    logger.info(f"Hybrid search query returned {len(result_docs)} results.")
+    return result_docs
+
+# Both legs of the hybrid search are served by Elasticsearch, so they can be sent in one _msearch request
+def hybrid_uses_msearch():
+    return VECTOR_SEARCH_BACKEND == "elasticsearch" and KEYWORD_SEARCH_BACKEND == "elasticsearch"
+
+# Hybrid search: keyword and KNN legs are sent in one _msearch request and fused with reciprocal rank fusion.
+# With in-process backends the legs are searched separately.
+def hybrid_search(query, query_vector, playlist, num_results=5):
+    logger.info("Starting the sending Hybrid search query .....")
+    window_size = max(HYBRID_WINDOW_SIZE, num_results)
+    
+    if not hybrid_uses_msearch():
+        return fuse_hybrid_docs(keyword_search(query, playlist, window_size),
+                                vector_search(query_vector, playlist, window_size), num_results)
+    
+    response = get_es_client().msearch(searches=hybrid_searches(query, query_vector, playlist, window_size),
+                                       filter_path=HYBRID_FILTER_PATH)
+    return fuse_hybrid_response(response, num_results)
+
+# Number of hits to fetch: collapsing overlapping windows needs more hits to fill num_results passages
+def hits_to_fetch(num_results, collapse):
+    return num_results * COLLAPSE_FETCH_FACTOR if collapse else num_results
+
+# Search type in the cache keys, collapsed results are cached separately
+def cache_search_type(search_type, collapse):
+    return f"{search_type} (collapsed)" if collapse else search_type
+
+# Search answer based on three possible approaches - keyword, vector and hybrid search.
+# With collapse, overlapping windows of the same video are merged into passages.
+def search_answer(query, playlist, search_type, num_results=SEARCH_RESULTS_NUMBER, collapse=SEARCH_COLLAPSE):
     logger.info(f"Starting the sending search query with the type: {search_type}")
     answer = None
     
     logger.debug(f"QUERY: {query}")
     logger.debug(f"PLAYLIST: {playlist}")
     
+    if search_cache is not None:
+        answer = search_cache.get(query, playlist, cache_search_type(search_type, collapse), num_results)
+        if answer is not None:
+            logger.info(f"Search results were found in the cache ({search_cache.stats()}).")
+            return answer
+    
+    fetch_results = hits_to_fetch(num_results, collapse)
     if search_type == "Text":
-        answer = keyword_search(query, playlist)
+        answer = keyword_search(query, playlist, fetch_results)
         
     elif search_type == "Vector":
-        query_vector = model.encode(query)
-        answer = knn_search(query_vector, playlist)
+        query_vector = encode_query(query)
+        answer = vector_search(query_vector, playlist, fetch_results)
+    
+    elif search_type == "Hybrid":
+        query_vector = encode_query(query)
+        answer = hybrid_search(query, query_vector, playlist, fetch_results)
     
     else:
         logger.error(f"Invalid search type provided: {search_type}")
         raise ValueError(f"Unsupported search type: {search_type}")
     
+    if collapse:
+        answer = collapse_passages(answer, num_results=num_results)
+    
+    if search_cache is not None:
+        search_cache.put(query, playlist, cache_search_type(search_type, collapse), num_results, answer)
+    
     logger.info(f"Sending search query with the type: {search_type} was completed.")
     return answer
+
+# Search types which were warmed up successfully
+warmed_up_search_types = set()
+
+# Load the components which are needed for the search types and run one search of every type
+# (bypassing the search cache), so that the first user query doesn't pay for model loading,
+# connection set-up and in-process index loading
+def warm_up(search_types=WARM_UP_SEARCH_TYPES):
+    for search_type in search_types:
+        start_time = time.perf_counter()
+        try:
+            if search_type == "Text":
+                keyword_search("warm up", "", 1)
+            elif search_type == "Vector":
+                vector_search(encode_query("warm up"), "", 1)
+            elif search_type == "Hybrid":
+                hybrid_search("warm up", encode_query("warm up"), "", 1)
+            else:
+                raise ValueError(f"Unsupported search type: {search_type}")
+        except Exception as e:
+            logger.error(f"Warm-up of {search_type} search failed: {str(e)}")
+            continue
+        warmed_up_search_types.add(search_type)
+        logger.info(f"{search_type} search was warmed up in {time.perf_counter() - start_time:.2f} s.")
+    return readiness()
+
+# Report which search components are loaded and which search types were warmed up
+def readiness():
+    return {
+        "embedding_model": model is not None,
+        "elasticsearch_client": es_client is not None,
+        "keyword_index": keyword_index is not None,
+        "vector_backend": vector_backend is not None,
+        "warmed_up": sorted(warmed_up_search_types),
+    }
+
+# Searches of a query in the batched _msearch request
+def batch_searches(search_type, query, query_vector, playlist, num_results):
+    if search_type == "Text":
+        return [keyword_search_query(query, playlist, num_results)]
+    if search_type == "Vector":
+        return [knn_search_query(query_vector, playlist, num_results)]
+    return hybrid_searches(query, query_vector, playlist, max(HYBRID_WINDOW_SIZE, num_results))
+
+# The search type is fully served by Elasticsearch, so the queries can be sent in _msearch requests
+def batch_uses_msearch(search_type):
+    if search_type == "Text":
+        return KEYWORD_SEARCH_BACKEND == "elasticsearch"
+    if search_type == "Vector":
+        return VECTOR_SEARCH_BACKEND == "elasticsearch"
+    return hybrid_uses_msearch()
+
+# Send a chunk of queries in one _msearch request, returns the responses of every query
+def msearch_chunk(chunk):
+    searches = []
+    for _, query_searches in chunk:
+        for body in query_searches:
+            searches.extend([{"index": ES_INDEX}, body])
+    response = get_es_client().msearch(searches=searches, filter_path=BATCH_FILTER_PATH)
+    
+    responses = iter(response.get('responses', []))
+    return [(position, [next(responses, {}) for _ in query_searches]) for position, query_searches in chunk]
+
+# Search answers of many queries at once (evaluation, cache warming): the queries are encoded in one batched call
+# and sent in _msearch requests of chunk_size queries, up to concurrency requests at once.
+# playlists is one playlist for all queries or a list with a playlist for every query.
+# Returns the answers and the latency of every query in seconds: cache lookup time for cached answers,
+# otherwise its share of the batched encoding plus the server-side time of its searches
+# (or the measured time of the in-process search).
+def search_answer_batch(queries, playlists, search_type, num_results=SEARCH_RESULTS_NUMBER, collapse=SEARCH_COLLAPSE,
+                        chunk_size=SEARCH_BATCH_CHUNK_SIZE, concurrency=SEARCH_BATCH_CONCURRENCY):
+    if search_type not in ("Text", "Vector", "Hybrid"):
+        logger.error(f"Invalid search type provided: {search_type}")
+        raise ValueError(f"Unsupported search type: {search_type}")
+    if isinstance(playlists, str):
+        playlists = [playlists] * len(queries)
+    logger.info(f"Starting the batched search of {len(queries)} queries with the type: {search_type}")
+    start_time = time.perf_counter()
+    
+    answers = [None] * len(queries)
+    latencies = [0.0] * len(queries)
+    cached_type = cache_search_type(search_type, collapse)
+    if search_cache is not None:
+        for position, (query, playlist) in enumerate(zip(queries, playlists)):
+            lookup_start = time.perf_counter()
+            answers[position] = search_cache.get(query, playlist, cached_type, num_results)
+            latencies[position] = time.perf_counter() - lookup_start
+    pending = [position for position, answer in enumerate(answers) if answer is None]
+    
+    query_vectors = [None] * len(queries)
+    if pending and search_type != "Text":
+        encode_start = time.perf_counter()
+        for position, query_vector in zip(pending, encode_queries([queries[position] for position in pending])):
+            query_vectors[position] = query_vector
+        encode_share = (time.perf_counter() - encode_start) / len(pending)
+        for position in pending:
+            latencies[position] = encode_share
+    
+    fetch_results = hits_to_fetch(num_results, collapse)
+    
+    # Search one query with the single-query functions (in-process backends)
+    def search_one(position):
+        search_start = time.perf_counter()
+        query, playlist, query_vector = queries[position], playlists[position], query_vectors[position]
+        if search_type == "Text":
+            docs = keyword_search(query, playlist, fetch_results)
+        elif search_type == "Vector":
+            docs = vector_search(query_vector, playlist, fetch_results)
+        else:
+            docs = hybrid_search(query, query_vector, playlist, fetch_results)
+        return [(position, docs, time.perf_counter() - search_start)]
+    
+    # Search a chunk of queries in one _msearch request
+    def search_chunk(chunk_positions):
+        chunk = [
+            (position, batch_searches(search_type, queries[position], query_vectors[position], playlists[position], fetch_results))
+            for position in chunk_positions
+        ]
+        results = []
+        for position, responses in msearch_chunk(chunk):
+            if search_type == "Hybrid":
+                docs = fuse_hybrid_response({'responses': responses}, fetch_results)
+            else:
+                if 'error' in responses[0]:
+                    logger.error(f"{search_type} search of a batched query failed: {responses[0]['error']}")
+                docs = response_docs(responses[0])
+            results.append((position, docs, max(response.get('took', 0) for response in responses) / 1000))
+        return results
+    
+    if batch_uses_msearch(search_type):
+        tasks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+        search_task = search_chunk
+    else:
+        tasks = pending
+        search_task = search_one
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for results in executor.map(search_task, tasks):
+            for position, docs, search_time in results:
+                if collapse:
+                    docs = collapse_passages(docs, num_results=num_results)
+                answers[position] = docs
+                latencies[position] += search_time
+                if search_cache is not None:
+                    search_cache.put(queries[position], playlists[position], cached_type, num_results, docs)
+    
+    elapsed_time = time.perf_counter() - start_time
+    logger.info(f"Batched search of {len(queries)} queries ({len(queries) - len(pending)} from the cache) "
+                f"was completed in {elapsed_time:.2f} s ({len(queries) / max(elapsed_time, 1e-9):.1f} queries/sec).")
+    return answers, latencies
+
+
+# Async versions of the searches for fanning out several searches at once (e.g. with asyncio.gather).
+# Elasticsearch requests go through the async client, in-process backends are called directly
+# and the query encoding runs in a worker thread, so the event loop is not blocked by the model.
+
+async def async_keyword_search(query, playlist, num_results=5):
+    if KEYWORD_SEARCH_BACKEND != "elasticsearch":
+        return keyword_search(query, playlist, num_results)
+    
+    logger.info("Starting the sending async Keyword search query .....")
+    response = await get_async_es_client().search(index=ES_INDEX, body=keyword_search_query(query, playlist, num_results),
+                                                  filter_path=FILTER_PATH)
+    log_search_response(response, "Keyword")
+    return response_docs(response)
+
+async def async_knn_search(query_vector, playlist, num_results=5):
+    logger.info("Starting the sending async KNN search query .....")
+    response = await get_async_es_client().search(index=ES_INDEX, body=knn_search_query(query_vector, playlist, num_results),
+                                                  filter_path=FILTER_PATH)
+    log_search_response(response, "KNN")
+    return response_docs(response)
+
+# In-process backends run in a worker thread: the first search (or the first after the corpus was changed)
+# builds the index, which must not block the event loop
+async def async_vector_search(query_vector, playlist, num_results=5):
+    if VECTOR_SEARCH_BACKEND == "elasticsearch":
+        return await async_knn_search(query_vector, playlist, num_results)
+    return await asyncio.to_thread(vector_search, query_vector, playlist, num_results)
+
+async def async_hybrid_search(query, query_vector, playlist, num_results=5):
+    logger.info("Starting the sending async Hybrid search query .....")
+    window_size = max(HYBRID_WINDOW_SIZE, num_results)
+    
+    if not hybrid_uses_msearch():
+        keyword_docs, vector_docs = await asyncio.gather(async_keyword_search(query, playlist, window_size),
+                                                         async_vector_search(query_vector, playlist, window_size))
+        return fuse_hybrid_docs(keyword_docs, vector_docs, num_results)
+    
+    response = await get_async_es_client().msearch(searches=hybrid_searches(query, query_vector, playlist, window_size),
+                                                   filter_path=HYBRID_FILTER_PATH)
+    return fuse_hybrid_response(response, num_results)
+
+async def async_search_answer(query, playlist, search_type, num_results=SEARCH_RESULTS_NUMBER, collapse=SEARCH_COLLAPSE):
+    logger.info(f"Starting the sending async search query with the type: {search_type}")
+    
+    if search_cache is not None:
+        answer = await asyncio.to_thread(search_cache.get, query, playlist, cache_search_type(search_type, collapse), num_results)
+        if answer is not None:
+            logger.info(f"Search results were found in the cache ({search_cache.stats()}).")
+            return answer
+    
+    fetch_results = hits_to_fetch(num_results, collapse)
+    if search_type == "Text":
+        answer = await async_keyword_search(query, playlist, fetch_results)
+    
+    elif search_type == "Vector":
+        query_vector = await asyncio.to_thread(encode_query, query)
+        answer = await async_vector_search(query_vector, playlist, fetch_results)
+    
+    elif search_type == "Hybrid":
+        query_vector = await asyncio.to_thread(encode_query, query)
+        answer = await async_hybrid_search(query, query_vector, playlist, fetch_results)
+    
+    else:
+        logger.error(f"Invalid search type provided: {search_type}")
+        raise ValueError(f"Unsupported search type: {search_type}")
+    
+    if collapse:
+        answer = collapse_passages(answer, num_results=num_results)
+    
+    if search_cache is not None:
+        await asyncio.to_thread(search_cache.put, query, playlist, cache_search_type(search_type, collapse), num_results, answer)
+    
+    logger.info(f"Sending async search query with the type: {search_type} was completed.")
+    return answer
@@ -0,0 +1,132 @@
+import time
+import queue
+import logging
+import threading
+
+from config import EVALUATION_WORKERS, EVALUATION_QUEUE_SIZE, EVALUATION_MAX_RETRIES, EVALUATION_RETRY_BACKOFF
+from config import EVALUATION_REQUEUE_INTERVAL, EVALUATION_PENDING_MIN_AGE, EVALUATION_CLAIM_TIMEOUT
+from db import update_conversation_evaluation, claim_conversation, claim_pending_conversations, release_conversation
+from rag import rag_evaluation, PENDING_RELEVANCE
+
+# Relevance of a conversation which was claimed by an app process for the evaluation
+EVALUATING_RELEVANCE = "EVALUATING"
+# Max conversations which are claimed by one requeue run
+REQUEUE_LIMIT = 100
+
+logger = logging.getLogger(__name__)
+
+
+# Relevance evaluation of saved conversations in background worker threads, so that the user doesn't wait
+# for the second LLM call. The queue is bounded; a failed evaluation is retried with exponential backoff.
+# A conversation is claimed in the database before it is evaluated (PENDING -> EVALUATING), so several app
+# processes never evaluate the same conversation. Conversations which were not evaluated (full queue, app restart)
+# stay PENDING and workers periodically claim them again, together with claims of processes which have died.
+class EvaluationQueue:
+    def __init__(self, workers=EVALUATION_WORKERS, queue_size=EVALUATION_QUEUE_SIZE,
+                 max_retries=EVALUATION_MAX_RETRIES, retry_backoff=EVALUATION_RETRY_BACKOFF,
+                 requeue_interval=EVALUATION_REQUEUE_INTERVAL):
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.requeue_interval = requeue_interval
+        # The first requeue runs when a worker starts
+        self.next_requeue = 0
+        self.requeue_lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+        logger.info(f"Evaluation queue was started with {workers} workers.")
+
+    # Queue the conversation for evaluation, returns False if the queue is full.
+    # claimed - the conversation was already claimed by this process (by requeue_pending)
+    def submit(self, conversation_id, question, answer, claimed=False):
+        try:
+            self.jobs.put_nowait((conversation_id, question, answer, claimed))
+            return True
+        except queue.Full:
+            logger.warning(f"Evaluation queue is full, conversation {conversation_id} stays {PENDING_RELEVANCE}.")
+            return False
+
+    def worker(self):
+        while True:
+            self.requeue_if_due()
+            try:
+                conversation_id, question, answer, claimed = self.jobs.get(timeout=self.requeue_interval)
+            except queue.Empty:
+                continue
+            try:
+                if claimed or claim_conversation(conversation_id, PENDING_RELEVANCE, EVALUATING_RELEVANCE):
+                    self.evaluate(conversation_id, question, answer)
+                else:
+                    logger.info(f"Conversation {conversation_id} was claimed by another process.")
+            except Exception as e:
+                logger.error(f"Saving evaluation of conversation {conversation_id} failed: {str(e)}")
+            finally:
+                self.jobs.task_done()
+
+    def evaluate(self, conversation_id, question, answer):
+        for attempt in range(self.max_retries + 1):
+            try:
+                relevance, explanation, eval_tokens = rag_evaluation(question, answer)
+                # An answer which can't be parsed is retried as well
+                if relevance != "UNKNOWN" or attempt == self.max_retries:
+                    break
+            except Exception as e:
+                logger.warning(f"Evaluation of conversation {conversation_id} failed (attempt {attempt + 1}): {str(e)}")
+                if attempt == self.max_retries:
+                    relevance, explanation = "UNKNOWN", f"Evaluation failed: {str(e)}"
+                    eval_tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                    break
+            time.sleep(self.retry_backoff * 2 ** attempt)
+
+        update_conversation_evaluation(conversation_id, relevance, explanation, eval_tokens)
+        logger.info(f"Conversation {conversation_id} was evaluated as {relevance}.")
+
+    # Run requeue_pending in one of the workers once per requeue interval
+    def requeue_if_due(self):
+        if not self.requeue_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() < self.next_requeue:
+                return
+            self.next_requeue = time.monotonic() + self.requeue_interval
+            self.requeue_pending()
+        finally:
+            self.requeue_lock.release()
+
+    # Claim and queue conversations which are still PENDING in the database (or whose claim is stale),
+    # only as many as the queue has room for; a claimed conversation which can't be queued is released
+    def requeue_pending(self):
+        free_slots = self.jobs.maxsize - self.jobs.qsize() if self.jobs.maxsize > 0 else REQUEUE_LIMIT
+        if free_slots <= 0:
+            return
+        try:
+            conversations = claim_pending_conversations(PENDING_RELEVANCE, EVALUATING_RELEVANCE,
+                                                        EVALUATION_PENDING_MIN_AGE, EVALUATION_CLAIM_TIMEOUT,
+                                                        min(free_slots, REQUEUE_LIMIT))
+        except Exception as e:
+            logger.error(f"Failed to claim conversations with pending evaluation: {str(e)}")
+            return
+        for conversation in conversations:
+            if not self.submit(conversation["id"], conversation["question"], conversation["answer"], claimed=True):
+                try:
+                    release_conversation(conversation["id"], PENDING_RELEVANCE, EVALUATING_RELEVANCE)
+                except Exception as e:
+                    logger.error(f"Failed to release conversation {conversation['id']}: {str(e)}")
+        if conversations:
+            logger.info(f"{len(conversations)} conversations with pending evaluation were queued again.")
+
+
+evaluation_queue = None
+evaluation_queue_lock = threading.Lock()
+
+# Get the evaluation queue of the process, it is started on the first call
+def get_evaluation_queue():
+    global evaluation_queue
+    with evaluation_queue_lock:
+        if evaluation_queue is None:
+            evaluation_queue = EvaluationQueue()
+        return evaluation_queue
+
+# Queue the saved conversation for the background relevance evaluation
+def submit_evaluation(conversation_id, question, answer):
+    return get_evaluation_queue().submit(conversation_id, question, answer)
@@ -0,0 +1,60 @@
+import json
+
+from config import VECTOR_INDEX_PROFILE, VECTOR_INDEXED_FIELDS, VECTOR_HNSW_M, VECTOR_HNSW_EF_CONSTRUCTION
+from corpus import VECTOR_FIELDS
+
+# Vector index profiles:
+#   indexed_fields - vector fields with an HNSW graph (other vector fields are stored but not indexed for kNN)
+#   index_type - "hnsw" (float32) or "int8_hnsw" (int8 scalar quantization, Elasticsearch 8.12+)
+#   m, ef_construction - HNSW graph parameters
+VECTOR_INDEX_PROFILES = {
+    # All three vector fields indexed as float32 with default HNSW parameters (the original mapping)
+    "full": {"indexed_fields": VECTOR_FIELDS, "index_type": "hnsw", "m": 16, "ef_construction": 100},
+    # Only text_vector (the field used by knn_search) is indexed
+    "text": {"indexed_fields": ["text_vector"], "index_type": "hnsw", "m": 16, "ef_construction": 100},
+    # Only text_vector is indexed with int8 quantization
+    "text_int8": {"indexed_fields": ["text_vector"], "index_type": "int8_hnsw", "m": 16, "ef_construction": 100},
+    # Smallest graph: int8 quantization with fewer connections per node
+    "text_int8_small": {"indexed_fields": ["text_vector"], "index_type": "int8_hnsw", "m": 8, "ef_construction": 64},
+}
+
+# Get the vector index profile by name with overrides from environment variables
+# (overrides=False returns the profile as it is defined, e.g. to compare the profiles with each other)
+def vector_index_profile(name=VECTOR_INDEX_PROFILE, overrides=True):
+    if name not in VECTOR_INDEX_PROFILES:
+        raise ValueError(f"Unknown vector index profile: {name}. Available profiles: {', '.join(VECTOR_INDEX_PROFILES)}")
+
+    profile = dict(VECTOR_INDEX_PROFILES[name], name=name)
+    if not overrides:
+        return profile
+    if VECTOR_INDEXED_FIELDS:
+        profile["indexed_fields"] = VECTOR_INDEXED_FIELDS
+    if VECTOR_HNSW_M:
+        profile["m"] = VECTOR_HNSW_M
+    if VECTOR_HNSW_EF_CONSTRUCTION:
+        profile["ef_construction"] = VECTOR_HNSW_EF_CONSTRUCTION
+    return profile
+
+# Build the mappings of the vector fields for the profile
+def vector_mappings(dims, profile):
+    mappings = {}
+    for field in VECTOR_FIELDS:
+        if field in profile["indexed_fields"]:
+            mappings[field] = {
+                "type": "dense_vector",
+                "dims": dims,
+                "index": True,
+                "similarity": "cosine",
+                "index_options": {
+                    "type": profile["index_type"],
+                    "m": profile["m"],
+                    "ef_construction": profile["ef_construction"]
+                }
+            }
+        else:
+            mappings[field] = {"type": "dense_vector", "dims": dims, "index": False}
+    return mappings
+
+# Signature of the profile which is saved into the index _meta to notice profile changes
+def profile_signature(profile):
+    return json.dumps({key: profile[key] for key in sorted(profile) if key != "name"}, sort_keys=True)
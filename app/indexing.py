@@ -0,0 +1,125 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from elasticsearch import ApiError
+
+from config import BULK_MAX_DOCS, BULK_MAX_BYTES, BULK_MAX_IN_FLIGHT, BULK_MAX_RETRIES, BULK_INITIAL_BACKOFF
+
+logger = logging.getLogger(__name__)
+
+# Number of per-document errors written into the log for every batch
+MAX_LOGGED_ERRORS = 10
+
+# Disable refresh and replicas for the time of loading and return previous values to restore them later
+def disable_refresh_and_replicas(es_client, index):
+    # The response is keyed by the name of the index behind the alias
+    settings = next(iter(es_client.indices.get_settings(index=index, flat_settings=True).values()))["settings"]
+    previous_settings = {
+        "refresh_interval": settings.get("index.refresh_interval"),
+        "number_of_replicas": settings.get("index.number_of_replicas"),
+    }
+    es_client.indices.put_settings(index=index, settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    logger.info(f"Refresh and replicas were disabled for {index} while loading (previous settings: {previous_settings}).")
+    return previous_settings
+
+# Restore refresh and replicas settings after loading and make the documents searchable
+def restore_refresh_and_replicas(es_client, index, previous_settings):
+    es_client.indices.put_settings(index=index, settings={"index": previous_settings})
+    es_client.indices.refresh(index=index)
+    logger.info(f"Settings {previous_settings} were restored for {index}.")
+
+# Serialize bulk actions into NDJSON lines and group them into batches limited by docs and bytes
+def bulk_batches(es_client, actions, max_docs=BULK_MAX_DOCS, max_bytes=BULK_MAX_BYTES):
+    serializer = es_client.transport.serializers.get_serializer("application/json")
+    batch, batch_bytes = [], 0
+
+    for action, document in actions:
+        lines = [serializer.dumps(action)]
+        if document is not None:
+            lines.append(serializer.dumps(document))
+        action_bytes = sum(len(line) + 1 for line in lines)
+
+        if batch and (len(batch) >= max_docs or batch_bytes + action_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+
+        batch.append(lines)
+        batch_bytes += action_bytes
+
+    if batch:
+        yield batch
+
+# Send one batch to the _bulk API, retrying documents (or the whole request) rejected with 429
+def send_batch(es_client, batch, max_retries=BULK_MAX_RETRIES, initial_backoff=BULK_INITIAL_BACKOFF):
+    stats = {"indexed": 0, "failed": 0, "retried": 0}
+    errors = []
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = es_client.bulk(operations=[line for lines in batch for line in lines])
+        except ApiError as e:
+            if e.meta.status != 429 or attempt == max_retries:
+                raise
+            stats["retried"] += len(batch)
+            time.sleep(initial_backoff * 2 ** attempt)
+            continue
+
+        rejected = []
+        for lines, item in zip(batch, response["items"]):
+            result = next(iter(item.values()))
+            status = result.get("status", 500)
+            # Deleting a document which is already absent is not an error
+            if status < 300 or (status == 404 and "delete" in item):
+                stats["indexed"] += 1
+            elif status == 429 and attempt < max_retries:
+                rejected.append(lines)
+            else:
+                stats["failed"] += 1
+                errors.append({"id": result.get("_id"), "status": status, "error": result.get("error")})
+
+        if not rejected:
+            break
+
+        stats["retried"] += len(rejected)
+        batch = rejected
+        time.sleep(initial_backoff * 2 ** attempt)
+
+    for error in errors[:MAX_LOGGED_ERRORS]:
+        logger.error(f"Failed to index document {error['id']} (status {error['status']}): {error['error']}")
+    if len(errors) > MAX_LOGGED_ERRORS:
+        logger.error(f"... and {len(errors) - MAX_LOGGED_ERRORS} more failed documents in this batch.")
+
+    return stats
+
+# Index a stream of (action, document) pairs using the _bulk API.
+# At most max_in_flight requests are sent at once. The actions are pulled from the stream
+# only when a request slot is free, so the whole dataset is never buffered in memory.
+def bulk_index(es_client, actions, max_docs=BULK_MAX_DOCS, max_bytes=BULK_MAX_BYTES, max_in_flight=BULK_MAX_IN_FLIGHT):
+    totals = {"indexed": 0, "failed": 0, "retried": 0}
+
+    def collect(done):
+        for future in done:
+            batch_size = pending.pop(future)
+            try:
+                stats = future.result()
+            except Exception as e:
+                logger.error(f"Bulk request with {batch_size} documents failed: {str(e)}")
+                stats = {"failed": batch_size}
+            for key, value in stats.items():
+                totals[key] += value
+
+    # Futures of the requests in flight mapped to the number of documents they carry
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for batch in bulk_batches(es_client, actions, max_docs, max_bytes):
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(send_batch, es_client, batch)] = len(batch)
+
+        done, _ = wait(pending)
+        collect(done)
+
+    logger.info(f"Bulk indexing was completed: {totals['indexed']} indexed, {totals['failed']} failed, {totals['retried']} retried.")
+    return totals
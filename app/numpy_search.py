@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+
+import numpy as np
+
+from config import CORPUS_PATH, DATASET_PATH, NUMPY_INDEX_MMAP, NUMPY_INDEX_PATH
+from corpus import corpus_files, corpus_is_available, iter_corpus, iter_dataset
+from embeddings import encode_texts
+
+logger = logging.getLogger(__name__)
+
+
+# In-process exact vector search over text_vector of all chunks.
+# Rows of the matrix are grouped by playlist, so the playlist filter is a contiguous slice
+# of the matrix and the search is one matrix-vector product plus argpartition.
+class NumpyVectorIndex:
+    def __init__(self, matrix, docs, playlist_rows, source_path):
+        self.matrix = matrix
+        self.docs = docs
+        self.playlist_rows = playlist_rows
+        self.source_path = source_path
+        self.source_mtime = os.path.getmtime(source_path)
+
+    # The index has to be rebuilt when the corpus or dataset file was changed
+    def is_stale(self):
+        try:
+            return os.path.getmtime(self.source_path) != self.source_mtime
+        except OSError:
+            return False
+
+    # Top-k documents of the playlist by cosine similarity, in the same shape as _source of ES hits
+    def search(self, query_vector, playlist, num_results=5):
+        rows = self.playlist_rows.get(playlist)
+        if rows is None:
+            logger.warning(f"Playlist {playlist} was not found in the NumPy vector index.")
+            return []
+
+        start, end = rows
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+        scores = self.matrix[start:end] @ query_vector
+
+        k = min(num_results, end - start)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [dict(self.docs[start + i]) for i in top]
+
+
+# Build the index from the pre-embedded corpus if it is available, otherwise from the dataset
+# (text vectors are read through the embedding store, so only new texts are encoded).
+# Duplicate chunk ids are resolved like in the ingestion: the last chunk wins.
+def build_numpy_index(encoding_model, source_fields, use_mmap=NUMPY_INDEX_MMAP, mmap_path=NUMPY_INDEX_PATH):
+    start_time = time.perf_counter()
+
+    if corpus_is_available():
+        source_path = corpus_files(CORPUS_PATH)[1]
+        chunks = {chunk["id"]: chunk for chunk in iter_corpus(CORPUS_PATH)}
+        docs = [{field: chunk.get(field) for field in source_fields} for chunk in chunks.values()]
+        vectors = np.stack([chunk["text_vector"] for chunk in chunks.values()]) if chunks else None
+    else:
+        source_path = DATASET_PATH
+        chunks = {chunk["id"]: chunk for chunk in iter_dataset(DATASET_PATH)}
+        docs = [{field: chunk.get(field) for field in source_fields} for chunk in chunks.values()]
+        vectors = encode_texts(encoding_model, [chunk["text"] for chunk in chunks.values()])
+    del chunks
+
+    if not docs:
+        raise ValueError(f"No documents were found in {source_path} to build the NumPy vector index.")
+
+    # Group rows by playlist (stable, so the dataset order is kept inside a playlist)
+    playlists = np.array([doc.get("playlist") or "" for doc in docs])
+    order = np.argsort(playlists, kind="stable")
+    docs = [docs[i] for i in order]
+    matrix = np.ascontiguousarray(vectors[order], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    playlist_rows = {}
+    for row, doc in enumerate(docs):
+        start, _ = playlist_rows.get(doc.get("playlist"), (row, row))
+        playlist_rows[doc.get("playlist")] = (start, row + 1)
+
+    if use_mmap:
+        # Write to a temporary file first, so that other processes never map a partially written file
+        temp_path = f"{mmap_path}.tmp-{os.getpid()}"
+        with open(temp_path, 'wb') as file:
+            np.save(file, matrix)
+        os.replace(temp_path, mmap_path)
+        matrix = np.load(mmap_path, mmap_mode="r")
+
+    logger.info(f"NumPy vector index was built from {source_path}: {matrix.shape[0]} vectors, "
+                f"{len(playlist_rows)} playlists, {matrix.nbytes / 2**20:.1f} MB"
+                f"{' (memory-mapped)' if use_mmap else ''} in {time.perf_counter() - start_time:.2f} s.")
+    return NumpyVectorIndex(matrix, docs, playlist_rows, source_path)
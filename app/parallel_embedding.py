@@ -0,0 +1,163 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+
+from config import SENTENCE_TRANSFORMERS_MODEL, EMBEDDING_CACHE_ENABLED, INGESTION_TORCH_THREADS, ENCODER_BACKEND
+from encoders import load_encoder
+
+logger = logging.getLogger(__name__)
+
+# How often (in seconds) the workers are checked while waiting for their results
+WORKER_CHECK_INTERVAL = 5
+
+# Number of encoder intra-op threads for every worker: configured value or CPU cores shared between workers
+def torch_threads_per_worker(workers, torch_threads=INGESTION_TORCH_THREADS):
+    if torch_threads > 0:
+        return torch_threads
+    return max(1, (os.cpu_count() or 1) // workers)
+
+# Worker process: loads its own encoder, reports the vector size and embeds batches of chunks from the input queue
+def embedding_worker(encoder_loader, model_name, backend, torch_threads, use_cache, input_queue, output_queue, dims):
+    from embeddings import embed_chunks
+
+    model = encoder_loader(backend, model_name, torch_threads)
+    dims.value = model.get_sentence_embedding_dimension()
+
+    while True:
+        batch = input_queue.get()
+        if batch is None:
+            break
+        try:
+            output_queue.put((embed_chunks(model, batch, use_cache=use_cache), None))
+        except Exception as e:
+            output_queue.put((None, f"{type(e).__name__}: {str(e)}"))
+
+    output_queue.put(None)
+
+
+# Pool of embedding worker processes, every worker holds its own encoder. The workers are started
+# when the pool is created, so the vector size is known (get_sentence_embedding_dimension, as of an encoder)
+# before the first batch is embedded and the ingestion process doesn't need a model of its own.
+# encoder_loader is called in every worker as load_encoder(backend, model_name, threads).
+class EmbeddingWorkerPool:
+    def __init__(self, workers, torch_threads=None, use_cache=EMBEDDING_CACHE_ENABLED,
+                 model_name=SENTENCE_TRANSFORMERS_MODEL, backend=ENCODER_BACKEND, encoder_loader=load_encoder):
+        if torch_threads is None:
+            torch_threads = torch_threads_per_worker(workers)
+        logger.info(f"Starting {workers} embedding workers ({backend}) with {torch_threads} threads each ...")
+
+        self.workers = workers
+        context = mp.get_context("spawn")
+        self.input_queue = context.Queue(maxsize=workers * 2)
+        self.output_queue = context.Queue(maxsize=workers * 2)
+        # Vector size, it is set by the first worker which has loaded its encoder
+        self.dims = context.Value("i", 0)
+        # Set when the pool is closed, so that the feeder thread doesn't wait for workers which are gone
+        self.stopped = threading.Event()
+        self.processes = [
+            context.Process(target=embedding_worker,
+                            args=(encoder_loader, model_name, backend, torch_threads, use_cache,
+                                  self.input_queue, self.output_queue, self.dims),
+                            daemon=True)
+            for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    # A worker which was killed (e.g. by the OOM killer) never sends its results
+    def check_workers(self):
+        failed = [process for process in self.processes if process.exitcode not in (None, 0)]
+        if failed:
+            raise RuntimeError(f"{len(failed)} embedding workers died "
+                               f"(exit codes: {', '.join(str(process.exitcode) for process in failed)}).")
+
+    # Vector size of the embeddings, waits until the first worker has loaded its encoder
+    def get_sentence_embedding_dimension(self):
+        while self.dims.value == 0:
+            self.check_workers()
+            time.sleep(0.1)
+        return self.dims.value
+
+    # Put the item into the input queue unless the pool is closed, returns False if it was not put
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.input_queue.put(item, timeout=WORKER_CHECK_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Embed batches of chunks in the workers and yield the embedded batches
+    # as soon as they are ready (not necessarily in the input order). Can be called once per pool.
+    # Both queues are bounded, so reading the dataset waits for the workers and
+    # the workers wait for the consumer (the bulk indexer) when it is slower.
+    def embed(self, batches):
+        feeder_errors = []
+
+        # Send batches to workers in a separate thread, so that the results can be consumed at the same time
+        def feed():
+            try:
+                for batch in batches:
+                    if not self.put(batch):
+                        return
+            except Exception as e:
+                feeder_errors.append(e)
+            for _ in range(self.workers):
+                self.put(None)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        start_time = time.perf_counter()
+        chunks_count = 0
+        finished_workers = 0
+        try:
+            while finished_workers < self.workers:
+                try:
+                    result = self.output_queue.get(timeout=WORKER_CHECK_INTERVAL)
+                except queue.Empty:
+                    self.check_workers()
+                    continue
+                if result is None:
+                    finished_workers += 1
+                    continue
+
+                batch, error = result
+                if error:
+                    raise RuntimeError(f"Embedding worker failed: {error}")
+                chunks_count += len(batch)
+                yield batch
+        finally:
+            self.close()
+            feeder.join()
+
+        if feeder_errors:
+            raise feeder_errors[0]
+
+        elapsed_time = time.perf_counter() - start_time
+        logger.info(f"{self.workers} embedding workers processed {chunks_count} chunks "
+                    f"in {elapsed_time:.2f} s ({chunks_count / max(elapsed_time, 1e-9):.1f} chunks/sec).")
+
+    # Stop the workers (they are terminated if they are still running)
+    def close(self):
+        self.stopped.set()
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        # Batches which are still buffered for the terminated workers are dropped instead of blocking the exit
+        self.input_queue.cancel_join_thread()
+
+
+# Embed batches of chunks in a new pool of worker processes (see EmbeddingWorkerPool.embed)
+def parallel_embed(batches, workers, torch_threads=None, use_cache=EMBEDDING_CACHE_ENABLED, model_name=SENTENCE_TRANSFORMERS_MODEL,
+                   backend=ENCODER_BACKEND, encoder_loader=load_encoder):
+    pool = EmbeddingWorkerPool(workers, torch_threads, use_cache, model_name, backend, encoder_loader)
+    try:
+        yield from pool.embed(batches)
+    finally:
+        pool.close()
@@ -0,0 +1,79 @@
+import logging
+
+from config import COLLAPSE_MAX_GAP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Number of leading words of the next window which are searched in the previous one to find the overlap
+OVERLAP_PROBE_WORDS = 8
+
+
+def start_seconds(doc):
+    try:
+        return float(doc.get("start_time") or 0)
+    except ValueError:
+        return 0.0
+
+# Join two texts removing the words which end the first text and start the second one
+# (windows of the dataset are consecutive segments with stride one, so neighbours share most of their text)
+def merge_overlapping_text(first, second):
+    first_words, second_words = first.split(), second.split()
+    probe = second_words[:OVERLAP_PROBE_WORDS]
+    if not probe:
+        return first
+
+    for position in range(len(first_words) - len(probe) + 1):
+        if first_words[position:position + len(probe)] != probe:
+            continue
+        overlap = len(first_words) - position
+        if first_words[position:] == second_words[:overlap]:
+            return " ".join(first_words + second_words[overlap:])
+        if len(second_words) <= overlap and first_words[position:position + len(second_words)] == second_words:
+            # The second text is completely inside the first one
+            return first
+    return f"{first} ... {second}"
+
+# Merge a group of windows of one video into a passage which covers their time range:
+# the text without repeated overlaps, the link and the start time of the earliest window
+def merge_group(group):
+    windows = sorted(group, key=start_seconds)
+    text = windows[0]["text"]
+    for window in windows[1:]:
+        text = merge_overlapping_text(text, window["text"])
+
+    passage = dict(windows[0])
+    passage.update(
+        # The id of the best ranked window is kept, so that evaluation by chunk id still works
+        id=group[0]["id"],
+        text=text,
+        merged_ids=[window["id"] for window in windows],
+        time_range=[start_seconds(windows[0]), start_seconds(windows[-1])],
+    )
+    return passage
+
+# Collapse search hits from the same video whose windows start within max_gap seconds of each other
+# into one passage. Passages keep the order of their best ranked hit, num_results limits the number of passages.
+def collapse_passages(docs, max_gap=COLLAPSE_MAX_GAP_SECONDS, num_results=None):
+    groups = []
+    for doc in docs:
+        start = start_seconds(doc)
+        matched = [
+            group for group in groups
+            if group[0].get("youtube_video_id") == doc.get("youtube_video_id")
+            and any(abs(start_seconds(window) - start) <= max_gap for window in group)
+        ]
+        if not matched:
+            groups.append([doc])
+            continue
+
+        # The hit can join several groups (it lies between them), they are merged into the best ranked one
+        matched[0].append(doc)
+        for group in matched[1:]:
+            matched[0].extend(group)
+            groups.remove(group)
+
+    passages = [merge_group(group) if len(group) > 1 else dict(group[0]) for group in groups]
+    if num_results is not None:
+        passages = passages[:num_results]
+    logger.info(f"{len(docs)} search hits were collapsed into {len(passages)} passages.")
+    return passages
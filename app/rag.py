@@ -3,11 +3,47 @@ from openai import OpenAI
 import es
 import time
 import json
-from config import OPENAI_API_KEY, OPENAI_MODEL, APP_LOGS_PATH
+import threading
+from config import OPENAI_API_KEY, OPENAI_MODEL, APP_LOGS_PATH, CONTEXT_COMPRESSION, ANSWER_CACHE_LOAD_ENCODER
+from config import EMBEDDING_SERVICE_SOCKET
 from config import setup_logging
+from answer_cache import create_answer_cache
+from context_packer import pack_context, context_budget, unpacked_context_tokens, get_tokenizer
+from compression import compress_passages
 
 logger = setup_logging(APP_LOGS_PATH)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Relevance of an answer which is waiting for the background evaluation (evaluation_queue.py)
+PENDING_RELEVANCE = "PENDING"
+# Relevance of an answer from the answer cache, it is not evaluated (the cache hit costs no LLM calls)
+CACHED_RELEVANCE = "CACHED"
+NO_TOKENS = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+# OpenAI client is created on the first request
+client = None
+client_lock = threading.Lock()
+
+def get_openai_client():
+    global client
+    with client_lock:
+        if client is None:
+            client = OpenAI(api_key=OPENAI_API_KEY)
+        return client
+
+# Semantic cache of answers, the same or a similar question of the playlist is answered without search and LLM calls.
+# Similar questions are encoded only if it doesn't load a model into the app process: with the embedding service,
+# when the encoder is already loaded (Vector and Hybrid search) or when ANSWER_CACHE_LOAD_ENCODER is set
+answer_cache = create_answer_cache(es.encode_query, es.index_generation,
+                                   lambda: ANSWER_CACHE_LOAD_ENCODER or bool(EMBEDDING_SERVICE_SOCKET) or es.model is not None)
+
+# Warm up the search components, so that the first question is answered without loading delays
+def warm_up():
+    get_openai_client()
+    get_tokenizer()
+    return es.warm_up()
+
+# Report which components of the app are loaded
+def readiness():
+    return {**es.readiness(), "openai_client": client is not None,
+            "answer_cache": answer_cache.stats() if answer_cache is not None else None}
 
 # Generate answer to the question (prompt)
 def llm(prompt):
@@ -15,7 +51,7 @@ def llm(prompt):
     messages = [{"role": "user", "content": prompt}]
     
     start_time = time.time()
-    response = client.chat.completions.create(
+    response = get_openai_client().chat.completions.create(
         model = OPENAI_MODEL,
         messages = messages, 
         max_tokens = 1024,
@@ -36,8 +72,53 @@ def llm(prompt):
     logger.info(f"Answer from OpenAI: {generated_text} ")
     return generated_text, stats, response_time
 
+# Generate answer to the question (prompt) as a stream of text deltas, so that the answer can be shown
+# while it is being generated. Token usage comes in the last chunk of the stream (include_usage).
+# When the stream is finished, result contains the answer, stats, response time and time to first token.
+def llm_stream(prompt, result):
+    logger.info("Starting the sending the streaming query to OpenAI .....")
+    messages = [{"role": "user", "content": prompt}]
+    
+    start_time = time.time()
+    stream = get_openai_client().chat.completions.create(
+        model = OPENAI_MODEL,
+        messages = messages, 
+        max_tokens = 1024,
+        n = 1,
+        stop = None,
+        temperature = 0.7,
+        stream = True,
+        stream_options = {"include_usage": True})
+    
+    parts = []
+    usage = None
+    first_token_time = None
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token_time is None:
+                first_token_time = time.time() - start_time
+                logger.info(f"First token from OpenAI was received in {first_token_time:.2f} seconds.")
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    
+    result.update(
+        answer = "".join(parts),
+        stats = {
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "total_tokens": usage.total_tokens if usage else 0,
+        },
+        response_time = time.time() - start_time,
+        first_token_time = first_token_time,
+    )
+    logger.info("Streaming the query to OpenAI was completed.")
+    logger.info(f"Answer from OpenAI: {result['answer']} ")
+
 # Build prompt for LLM based on question and context
-def build_prompt(query, search_results):
+# (with compression, only the sentences of the search results which are the most similar to the question are used)
+def build_prompt(query, search_results, compression=CONTEXT_COMPRESSION):
     logger.info("Starting the build prompt .....")
     context_template = """
     Answer: {text}
@@ -58,12 +139,14 @@ def build_prompt(query, search_results):
     CONTEXT: {context}
     """.strip()
     
-    context = ""
-    
-    for doc in search_results:
-        context = context + context_template.format(text=doc['text'],
-                                                    video=doc['video'],
-                                                    youtube_link=doc['youtube_link']).strip() + "\n\n"
+    # Search results are packed into the context within the prompt token budget
+    budget = context_budget(prompt_template, query)
+    compress = None
+    if compression:
+        compress = lambda passages: compress_passages(es.encode_query(query), passages, es.get_model())
+    context, context_tokens = pack_context(search_results, context_template, budget, compress)
+    saved_tokens = unpacked_context_tokens(search_results, context_template) - context_tokens
+    logger.info(f"Prompt context has {context_tokens} tokens, {saved_tokens} tokens were saved by packing.")
     
     prompt = prompt_template.format(question=query, context=context).strip()
     logger.info("Building prompt was completed.")
@@ -114,18 +197,62 @@ def openai_cost(stats):
     logger.info("OpenAI costs calculation was completed.")
     return cost
 
-def get_answer(query, playlist, search_type):
+# Answer data of the cached answer to the same or a similar question, None if there is no such answer.
+# The answer data has cache_hit flag, the answer is not evaluated again.
+def cached_answer(query, playlist, search_type):
+    if answer_cache is None:
+        return None
+    start_time = time.time()
+    try:
+        hit = answer_cache.get(query, playlist, search_type)
+    except Exception as e:
+        # The cache must not break answering (e.g. the embedding service is down), an error is a miss
+        logger.error(f"Answer cache lookup failed: {str(e)}")
+        return None
+    if hit is None:
+        return None
+    value, similarity, cached_question = hit
+    logger.info(f"Answer was found in the cache (similarity {similarity:.3f} to '{cached_question}', "
+                f"{answer_cache.stats()}).")
+    explanation = f"Cached answer to the question '{cached_question}' (similarity {similarity:.3f})"
+    return {**answer_data(value["answer"], time.time() - start_time, CACHED_RELEVANCE, explanation,
+                          NO_TOKENS, NO_TOKENS, 0), "cache_hit": True}
+
+# Put the generated answer into the answer cache
+def cache_answer(query, playlist, search_type, answer, stats):
+    if answer_cache is None or not answer:
+        return
+    try:
+        answer_cache.put(query, playlist, search_type, {"answer": answer, "stats": stats})
+    except Exception as e:
+        logger.error(f"Failed to put the answer into the answer cache: {str(e)}")
+
+# The relevance is PENDING and evaluated in the background after the conversation is saved,
+# evaluate=True evaluates it before returning (e.g. for offline evaluation scripts)
+def get_answer(query, playlist, search_type, evaluate=False):
     logger.info("Starting the RAG query .....")
     
+    cached = cached_answer(query, playlist, search_type)
+    if cached is not None:
+        return cached
+    
     search_results = es.search_answer(query, playlist, search_type)
     prompt = build_prompt(query, search_results)
     answer, stats, response_time = llm(prompt)
-    relevance, explanation, eval_tokens = rag_evaluation(query, answer)
+    cache_answer(query, playlist, search_type, answer, stats)
+    if evaluate:
+        relevance, explanation, eval_tokens = rag_evaluation(query, answer)
+    else:
+        relevance, explanation, eval_tokens = PENDING_RELEVANCE, "", NO_TOKENS
     
     cost = openai_cost(stats)
     
     logger.info("RAG query was completed.")
 
+    return answer_data(answer, response_time, relevance, explanation, stats, eval_tokens, cost)
+
+# Answer with the stats in the format of save_conversation
+def answer_data(answer, response_time, relevance, explanation, stats, eval_tokens, cost):
     return {
         'answer': answer,
         'response_time': response_time,
@@ -139,3 +266,30 @@ def get_answer(query, playlist, search_type):
         'eval_total_tokens': eval_tokens['total_tokens'],
         'openai_cost': cost
     }
+
+# Streaming version of get_answer: returns a generator of answer text deltas and a dict which is filled
+# with the answer data (in the format of get_answer, plus time to first token) when the generator is exhausted.
+# The relevance is PENDING, the answer is evaluated in the background after the conversation is saved.
+def get_answer_stream(query, playlist, search_type):
+    logger.info("Starting the streaming RAG query .....")
+    
+    cached = cached_answer(query, playlist, search_type)
+    if cached is not None:
+        # The cached answer is streamed at once
+        return iter([cached["answer"]]), {**cached, "first_token_time": cached["response_time"]}
+    
+    search_results = es.search_answer(query, playlist, search_type)
+    prompt = build_prompt(query, search_results)
+    result = {}
+    
+    def answer_stream():
+        generation = {}
+        yield from llm_stream(prompt, generation)
+        cache_answer(query, playlist, search_type, generation["answer"], generation["stats"])
+        cost = openai_cost(generation["stats"])
+        result.update(answer_data(generation["answer"], generation["response_time"], PENDING_RELEVANCE, "",
+                                  generation["stats"], NO_TOKENS, cost),
+                      first_token_time=generation["first_token_time"])
+        logger.info("Streaming RAG query was completed.")
+    
+    return answer_stream(), result
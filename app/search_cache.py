@@ -0,0 +1,186 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from config import SEARCH_CACHE_BACKEND, SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_PATH
+from config import SEARCH_CACHE_GENERATION_CHECK_INTERVAL, SEARCH_CACHE_EVICT_INTERVAL
+from caches import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+# In-process cache store (for a single app replica): values with TTL, LRU eviction by total size in bytes
+class MemoryCacheStore:
+    def __init__(self, max_bytes=SEARCH_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                self.total_bytes -= len(self.entries.pop(key)[0])
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= len(self.entries.pop(key)[0])
+            self.entries[key] = (value, time.time() + ttl)
+            self.total_bytes += len(value)
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, (evicted_value, _) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted_value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+# Cache store in a local SQLite file, shared by several app replicas on the same host.
+# Expired and least recently used entries are evicted every evict_interval puts of the process, not on every put
+# (the size check scans the table), so the cache can exceed max_bytes by the entries put since the last eviction.
+class SQLiteCacheStore:
+    def __init__(self, path=SEARCH_CACHE_PATH, max_bytes=SEARCH_CACHE_MAX_BYTES, evict_interval=SEARCH_CACHE_EVICT_INTERVAL):
+        self.max_bytes = max_bytes
+        self.evict_interval = max(1, evict_interval)
+        self.puts = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS search_cache_expires_at ON search_cache (expires_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM search_cache WHERE key = ? AND expires_at >= ?", (key, now)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key, value, ttl):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now))
+            self.puts += 1
+            if self.puts % self.evict_interval == 0:
+                self.evict(now)
+
+    # Remove expired entries, then the least recently used ones if the cache is above the size limit
+    def evict(self, now):
+        self.connection.execute("DELETE FROM search_cache WHERE expires_at < ?", (now,))
+        total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM search_cache").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        self.connection.execute("""
+            DELETE FROM search_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running_size FROM search_cache
+                ) WHERE running_size > ?
+            )
+        """, (self.max_bytes,))
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM search_cache")
+
+
+# Watches the index generation, which is bumped by every ingestion run: the generation is requested
+# at most once per check interval and on_change is called when it differs from the previous one
+class GenerationWatcher:
+    def __init__(self, generation_fn, on_change, check_interval=SEARCH_CACHE_GENERATION_CHECK_INTERVAL):
+        self.generation_fn = generation_fn
+        self.on_change = on_change
+        self.check_interval = check_interval
+        self.current_generation = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def generation(self):
+        with self.lock:
+            if time.time() - self.checked_at >= self.check_interval:
+                try:
+                    generation = self.generation_fn()
+                except Exception as e:
+                    logger.warning(f"Failed to get the index generation: {str(e)}")
+                    generation = self.current_generation
+                if self.current_generation is not None and generation != self.current_generation:
+                    self.on_change(generation)
+                self.current_generation = generation
+                self.checked_at = time.time()
+            return self.current_generation
+
+
+# Search result cache keyed by (normalized query, playlist, search type, number of results).
+# Keys include the index generation, which is bumped by every ingestion run,
+# so all the entries are invalidated at once after a reindex.
+class SearchCache:
+    def __init__(self, store, generation_fn, ttl=SEARCH_CACHE_TTL, check_interval=SEARCH_CACHE_GENERATION_CHECK_INTERVAL):
+        self.store = store
+        self.ttl = ttl
+        self.watcher = GenerationWatcher(generation_fn, self.invalidate, check_interval)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, generation):
+        logger.info(f"Index generation was changed to {generation}, the search cache is cleared.")
+        self.store.clear()
+
+    def key(self, query, playlist, search_type, num_results):
+        return json.dumps([self.watcher.generation(), normalize_query(query), playlist, search_type, num_results])
+
+    def get(self, query, playlist, search_type, num_results):
+        value = self.store.get(self.key(query, playlist, search_type, num_results))
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, query, playlist, search_type, num_results, result_docs):
+        self.store.put(self.key(query, playlist, search_type, num_results), json.dumps(result_docs), self.ttl)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "generation": self.watcher.current_generation}
+
+
+# Create the search cache with the configured backend: "memory", "sqlite" or "none" (returns None)
+def create_search_cache(generation_fn, backend=SEARCH_CACHE_BACKEND):
+    if backend == "memory":
+        store = MemoryCacheStore()
+    elif backend == "sqlite":
+        store = SQLiteCacheStore()
+    elif backend == "none":
+        return None
+    else:
+        raise ValueError(f"Unsupported search cache backend: {backend}")
+    logger.info(f"Search cache was created with {backend} backend.")
+    return SearchCache(store, generation_fn)
@@ -1,8 +1,16 @@
 import text_helpers as th
 import os
+import sys
 import hashlib
+import numpy as np
 from collections import defaultdict
 
+# The corpus is embedded by the app modules, so its vectors are the same as the vectors calculated by the ingestion
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+# Fields of the chunk which are saved into the corpus metadata file
+CORPUS_FIELDS = ["id", "text", "video", "playlist", "youtube_video_id", "youtube_link", "start_time"]
+
 # Construct a YouTube link with start time
 def construct_youtube_link(video_id, start_time):
     time = int(start_time.split('.')[0])
@@ -62,6 +70,32 @@ def merge_audio_segments(input_path, playlist, video_ids_path):
         print(f"---- WARNING ----: lengths are different! \nLen hashes: {len(hashes)},  Len docs: {len(merged_segments)}")
     return merged_segments
 
+# Save compact pre-embedded corpus: metadata in jsonl file and (3, chunks, dims) float32 vectors in npy file.
+# The encoder (model and backend) is configured by SENTENCE_TRANSFORMERS_MODEL and ENCODER_BACKEND as for the app.
+def save_corpus(dataset, corpus_path, batch_size=128):
+    from config import ENCODER_ID
+    from corpus import VECTOR_FIELDS, corpus_files
+    from encoders import load_encoder
+    from embeddings import embed_chunks
+    
+    metadata_path, vectors_path, meta_path = corpus_files(corpus_path)
+    # The old metadata is removed first: the corpus is not used while its files are being replaced
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    
+    chunks = embed_chunks(load_encoder(), [dict(doc) for doc in dataset], batch_size, use_cache=False)
+    vectors = np.stack([np.stack([chunk[field] for chunk in chunks]) for field in VECTOR_FIELDS]).astype(np.float32)
+    
+    th.save_jsonl([{field: doc[field] for field in CORPUS_FIELDS} for doc in dataset], metadata_path)
+    th.write_atomically(vectors_path, lambda file: np.save(file, vectors))
+    # Metadata is saved last, so the corpus is used only when all files are complete
+    th.save_json_atomically({
+        "model": ENCODER_ID,
+        "dims": int(vectors.shape[2]),
+        "count": len(dataset),
+        "vector_fields": VECTOR_FIELDS,
+    }, meta_path)
+
 
 if __name__ == "__main__":
     
@@ -69,6 +103,9 @@ if __name__ == "__main__":
     yt_channel_dir = f"./{yt_channel}/{yt_channel} - transcripts"
     video_ids_path = f"./{yt_channel}/video_ids.json"
     dataset_path = f"./{yt_channel}/dataset.json"
+    corpus_path = f"./{yt_channel}/corpus"
+    # Create pre-embedded corpus for the ingestion container as well
+    create_corpus = True
     
     # final dataset
     dataset = []
@@ -90,4 +127,7 @@ if __name__ == "__main__":
                     transcript_segments = merge_audio_segments(transcript_path, playlist, video_ids_path)
                     dataset.extend(transcript_segments)
                     
-    th.save_json(dataset, dataset_path)
\ No newline at end of file
+    th.save_json(dataset, dataset_path)
+    
+    if create_corpus:
+        save_corpus(dataset, corpus_path)
\ No newline at end of file
@@ -17,6 +17,34 @@ def save_json(data, path):
     except Exception as e:
         return f"An error occurred: {str(e)}"
 
+# Write a file through a temporary file which replaces the target only when it is complete,
+# so readers never see a partially written file. write is called with the open binary file, errors are raised.
+def write_atomically(path, write):
+    # Create directory if it doesn't exist
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(temp_path, 'wb') as file:
+            write(file)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Save list of dicts into jsonl file (one compact json object per line), the file is replaced atomically
+def save_jsonl(data, path):
+    def write(jsonl_file):
+        for item in data:
+            jsonl_file.write((json.dumps(item, separators=(',', ':')) + "\n").encode())
+
+    write_atomically(path, write)
+    print(f"JSONL data was saved to {path}.")
+
+# Save json file, the file is replaced atomically and errors are raised (unlike save_json)
+def save_json_atomically(data, path):
+    write_atomically(path, lambda json_file: json_file.write(json.dumps(data, indent=4).encode()))
+    print(f"JSON data was saved to {path}.")
+
 # Read json file
 def read_json(path):
     try:
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# App modules are flat modules in app/ which import each other by name (from config import ...)
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+# Modules which set up logging at import time (es.py, data_ingestion.py) write into a temporary file instead of app/logs
+os.environ.setdefault("APP_LOGS_PATH", os.path.join(tempfile.gettempdir(), "youtube_browser_tests.log"))
+os.environ.setdefault("INGESTION_LOGS_PATH", os.path.join(tempfile.gettempdir(), "youtube_browser_tests.log"))
@@ -0,0 +1,78 @@
+import numpy as np
+
+from answer_cache import AnswerGroup, SemanticAnswerCache
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_answer_group_exact_and_nearest():
+    group = AnswerGroup(max_entries=10)
+    group.put("what is fft", unit(1, 0, 0), "fft", ttl=60, now=0)
+    group.put("what is mfcc", unit(0, 1, 0), "mfcc", ttl=60, now=0)
+    assert group.exact_match("what is fft", now=1) == (0, 1.0)
+    assert group.exact_match("what is stft", now=1) is None
+
+    row, similarity = group.nearest(unit(0.1, 1, 0), threshold=0.9, now=1)
+    assert group.values[row] == "mfcc" and similarity > 0.99
+    assert group.nearest(unit(0, 0, 1), threshold=0.9, now=1) is None
+
+
+def test_answer_group_expires_and_evicts_least_recently_used():
+    group = AnswerGroup(max_entries=2)
+    group.put("a", unit(1, 0), "a", ttl=60, now=0)
+    group.put("b", unit(0, 1), "b", ttl=60, now=1)
+    assert group.exact_match("a", now=61) is None
+    assert group.nearest(unit(1, 0), threshold=0.5, now=61) is None
+
+    group.last_used[0] = 10
+    group.put("c", unit(1, 1), "c", ttl=60, now=20)
+    assert set(group.rows) == {"a", "c"}
+    assert len(group) == 2
+
+
+def test_answer_group_grows_beyond_initial_capacity():
+    group = AnswerGroup(max_entries=100)
+    for i in range(40):
+        group.put(f"q{i}", unit(i + 1, 1), i, ttl=60, now=0)
+    assert len(group) == 40
+    assert all(group.values[group.rows[f"q{i}"]] == i for i in range(40))
+
+
+def test_entries_without_vectors_match_only_exactly():
+    group = AnswerGroup(max_entries=10)
+    group.put("a", None, "a", ttl=60, now=0)
+    assert group.vectors is None
+    assert group.exact_match("a", now=1) == (0, 1.0)
+    group.put("b", unit(1, 0), "b", ttl=60, now=0)
+    row, _ = group.nearest(unit(1, 0), threshold=0.5, now=1)
+    assert group.values[row] == "b"
+
+
+def test_semantic_cache_without_encoder_uses_exact_match(tmp_path):
+    encoded = []
+    cache = SemanticAnswerCache(lambda query: encoded.append(query) or unit(1, 0), lambda: 1,
+                                can_encode_fn=lambda: False)
+    cache.put("What is FFT?", "p", "Text", {"answer": "fft"})
+    assert cache.get("what is fft", "p", "Text")[0] == {"answer": "fft"}
+    assert cache.get("explain fft", "p", "Text") is None
+    assert cache.get("what is fft", "other", "Text") is None
+    assert encoded == []
+
+    path = str(tmp_path / "answer_cache.npz")
+    cache.save(path)
+    loaded = SemanticAnswerCache(lambda query: unit(1, 0), lambda: 1)
+    loaded.load(path)
+    assert loaded.get("What is FFT", "p", "Text")[0] == {"answer": "fft"}
+
+
+def test_semantic_cache_is_cleared_on_new_generation():
+    generations = {"current": 1}
+    cache = SemanticAnswerCache(lambda query: unit(1, 0), lambda: generations["current"])
+    cache.watcher.check_interval = 0
+    cache.put("question", "p", "Vector", {"answer": "a"})
+    assert cache.get("similar question", "p", "Vector") is not None
+    generations["current"] = 2
+    assert cache.get("question", "p", "Vector") is None
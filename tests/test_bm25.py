@@ -0,0 +1,73 @@
+import numpy as np
+
+from bm25 import tokenize, build_bm25_index, save_bm25_index, load_bm25_index, read_bm25_meta, BM25_INDEX_VERSION
+
+CHUNKS = [
+    {"id": "a1", "playlist": "Audio", "video": "Fourier transform", "text": "The Fourier transform of a signal.",
+     "text_vector": [0.1, 0.2]},
+    {"id": "a2", "playlist": "Audio", "video": "Spectrograms", "text": "Mel spectrograms and the Fourier transform, Fourier again."},
+    {"id": "a3", "playlist": "Audio", "video": "MFCC", "text": "Cepstral coefficients explained."},
+    {"id": "d1", "playlist": "Deep", "video": "Neural networks", "text": "Training a neural network on audio."},
+    {"id": "d2", "playlist": "Deep", "video": "Datasets", "text": "Preparing a dataset of spectrograms."},
+]
+
+
+def ids(docs):
+    return [doc["id"] for doc in docs]
+
+
+def test_tokenize_lowercases_and_keeps_apostrophes():
+    assert tokenize("It's the FFT, isn't it?") == ["it's", "the", "fft", "isn't", "it"]
+    assert tokenize(None) == []
+
+
+def test_vector_fields_are_dropped_and_last_duplicate_wins():
+    index = build_bm25_index(CHUNKS + [{"id": "a3", "playlist": "Audio", "video": "MFCC", "text": "Updated text."}])
+    assert all("text_vector" not in doc for doc in index.docs)
+    assert [doc["text"] for doc in index.docs if doc["id"] == "a3"] == ["Updated text."]
+
+
+def test_search_ranks_by_term_frequency():
+    index = build_bm25_index(CHUNKS)
+    assert ids(index.search("fourier", "Audio", 5)) == ["a2", "a1"]
+
+
+def test_search_filters_by_playlist():
+    index = build_bm25_index(CHUNKS)
+    assert set(ids(index.search("spectrograms", "Audio", 5))) == {"a2"}
+    assert set(ids(index.search("spectrograms", "Deep", 5))) == {"d2"}
+    # Terms which occur only in another playlist and unknown playlists match nothing
+    assert index.search("neural", "Audio", 5) == []
+    assert index.search("fourier", "Unknown", 5) == []
+
+
+def test_search_limits_results_and_source_fields():
+    index = build_bm25_index(CHUNKS)
+    docs = index.search("fourier spectrograms cepstral", "Audio", 2, source_fields=["id", "video"])
+    assert len(docs) == 2
+    assert all(set(doc) == {"id", "video"} for doc in docs)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "bm25_index.npz")
+    index = build_bm25_index(CHUNKS, fingerprint="abc")
+    save_bm25_index(index, path)
+
+    assert read_bm25_meta(path)["version"] == BM25_INDEX_VERSION
+    loaded = load_bm25_index(path)
+    assert loaded.vocabulary == index.vocabulary
+    assert loaded.docs == index.docs
+    assert loaded.playlist_rows == index.playlist_rows
+    assert loaded.fingerprint == "abc"
+    assert loaded.postings.keys() == index.postings.keys()
+    for field, arrays in index.postings.items():
+        for loaded_array, array in zip(loaded.postings[field], arrays):
+            np.testing.assert_array_equal(loaded_array, array)
+
+    for query, playlist in [("fourier transform", "Audio"), ("spectrograms", "Deep"), ("audio", "Deep")]:
+        assert loaded.search(query, playlist, 5) == index.search(query, playlist, 5)
+    assert not loaded.is_stale()
+
+
+def test_read_meta_of_missing_index(tmp_path):
+    assert read_bm25_meta(str(tmp_path / "missing.npz")) is None
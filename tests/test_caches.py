@@ -0,0 +1,19 @@
+from caches import normalize_query, LRUCache
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  FFT?? ") == "what is fft"
+    assert normalize_query("What is FFT") == normalize_query("what is fft!")
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2}
+    cache.clear()
+    assert cache.get("a") is None
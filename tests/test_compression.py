@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import compression
+from caches import LRUCache
+from compression import split_sentences, select_sentences, join_sentences, compress_passages
+
+
+# Sentences about "match" point to the first axis, all other sentences to the second one
+class FakeEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False):
+        self.encoded.extend(texts)
+        return np.array([[1.0, 0.0] if "match" in text else [0.0, 1.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def empty_sentence_cache(monkeypatch):
+    monkeypatch.setattr(compression, "sentence_cache", LRUCache(compression.SENTENCE_CACHE_SIZE))
+
+
+def test_split_sentences():
+    assert split_sentences(" One. Two?  Three! Four ") == ["One.", "Two?", "Three!", "Four"]
+    assert split_sentences("") == []
+
+
+def test_select_sentences_keeps_neighbours_of_the_top_sentences():
+    scores = np.array([0.1, 0.9, 0.2, 0.3, 0.1, 0.8])
+    assert select_sentences(scores, top_sentences=2, neighbours=1) == [0, 1, 2, 4, 5]
+    assert select_sentences(scores, top_sentences=1, neighbours=0) == [1]
+
+
+def test_join_sentences_marks_gaps():
+    sentences = ["A.", "B.", "C.", "D.", "E."]
+    assert join_sentences(sentences, [1, 2, 4]) == "... B. C. ... E."
+    assert join_sentences(sentences, [0, 1]) == "A. B. ..."
+    assert join_sentences(sentences, [0, 1, 2, 3, 4]) == "A. B. C. D. E."
+
+
+def test_compress_passages_keeps_the_sentences_about_the_query():
+    long_text = "One. Two. Three. The match. Five. Six. Seven."
+    docs = [{"text": long_text, "video": "video 1"}, {"text": "Short. Text.", "video": "video 2"}]
+    compressed = compress_passages([1.0, 0.0], docs, FakeEncoder(), top_sentences=1, neighbours=1)
+    assert compressed[0] == {"text": "... Three. The match. Five. ...", "video": "video 1"}
+    # Hits which are not longer than the selection are kept as they are
+    assert compressed[1] is docs[1]
+    assert docs[0]["text"] == long_text
+
+
+def test_sentence_vectors_are_reused_from_the_cache():
+    encoder = FakeEncoder()
+    docs = [{"text": "One. Two. The match. Four. Five."}]
+    compress_passages([1.0, 0.0], docs, encoder, top_sentences=1, neighbours=0)
+    compress_passages([1.0, 0.0], docs + [{"text": "One. Two. New. Four. Five."}], encoder, top_sentences=1, neighbours=0)
+    assert sorted(encoder.encoded) == sorted(["One.", "Two.", "The match.", "Four.", "Five.", "New."])
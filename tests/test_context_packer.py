@@ -0,0 +1,78 @@
+import pytest
+
+import context_packer
+from context_packer import ApproximateTokenizer, count_tokens, trim_to_tokens, pack_context, context_budget
+
+TEMPLATE = "Answer: {text}\nVideo Title: {video}\nYouTube Link: {youtube_link}"
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokenizer(monkeypatch):
+    # The tiktoken encoding is downloaded on the first use, the tests don't need the network
+    monkeypatch.setattr(context_packer, "tokenizer", ApproximateTokenizer())
+
+
+def doc(doc_id, text, video="v1", start=0):
+    return {"id": doc_id, "text": text, "video": f"Video {video}", "youtube_video_id": video,
+            "youtube_link": f"https://youtu.be/{video}", "start_time": str(start)}
+
+
+def test_trim_to_tokens_keeps_short_text():
+    assert trim_to_tokens("Short text.", 100) == "Short text."
+
+
+def test_trim_to_tokens_cuts_after_a_sentence():
+    text = "First sentence is here. Second sentence is a lot longer than the first one."
+    assert trim_to_tokens(text, 8) == "First sentence is here."
+
+
+def test_trim_to_tokens_cuts_at_a_word():
+    trimmed = trim_to_tokens("one two three four five six seven eight nine ten", 5)
+    # 5 approximate tokens are 20 characters, the word which is cut in the middle is dropped
+    assert trimmed == "one two three four ..."
+
+
+def test_pack_context_fits_everything_within_a_large_budget():
+    docs = [doc("a", "Alpha text."), doc("b", "Beta text.", video="v2", start=600)]
+    context, tokens = pack_context(docs, TEMPLATE, 1000)
+    assert context.index("Alpha text.") < context.index("Beta text.")
+    assert context.endswith("\n\n")
+    # Passages are counted separately, which never underestimates the tokens of the whole context
+    assert tokens >= count_tokens(context)
+
+
+def test_pack_context_removes_overlap_of_neighbour_windows():
+    words = [f"w{i}" for i in range(24)]
+    docs = [doc("a", " ".join(words[0:16])), doc("b", " ".join(words[8:24]), start=10)]
+    context, _ = pack_context(docs, TEMPLATE, 1000)
+    assert context.count("w12 ") == 1
+    assert " ".join(words) in context
+
+
+def test_pack_context_trims_the_last_passage_and_drops_the_rest():
+    docs = [doc("a", "Alpha " * 20, video="v1"), doc("b", "Beta sentence one. " * 20, video="v2"),
+            doc("c", "Gamma " * 20, video="v3")]
+    budget = 100
+    context, tokens = pack_context(docs, TEMPLATE, budget, min_passage_tokens=5)
+    assert tokens <= budget
+    assert "Alpha" in context and "Beta" in context and "Gamma" not in context
+    assert context.count("Beta sentence one.") < 20
+
+
+def test_pack_context_skips_a_passage_which_does_not_fit_the_minimum():
+    docs = [doc("a", "Alpha " * 20, video="v1"), doc("b", "Beta " * 20, video="v2")]
+    context, _ = pack_context(docs, TEMPLATE, 60, min_passage_tokens=50)
+    assert "Alpha" in context and "Beta" not in context
+
+
+def test_pack_context_applies_compression_to_passages():
+    docs = [doc("a", "Alpha text.")]
+    context, _ = pack_context(docs, TEMPLATE, 1000,
+                              compress=lambda passages: [{**passage, "text": "Compressed."} for passage in passages])
+    assert "Compressed." in context and "Alpha" not in context
+
+
+def test_context_budget_excludes_the_prompt_template():
+    template = "QUESTION: {question}\nCONTEXT: {context}"
+    assert context_budget(template, "question?", prompt_budget=100) == 100 - count_tokens(template.format(question="question?", context=""))
+    assert context_budget(template, "question?", prompt_budget=1) == 0
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import corpus
+from corpus import iter_json_array, iter_dataset
+
+ITEMS = [
+    {"id": "1", "text": "Hello, [world] with \"quotes\" and } braces", "start_time": 12.5},
+    {"id": "2", "text": "Ünïcödé text", "values": [1, 2, 3]},
+    42,
+    {"id": "3", "text": "x" * 100},
+]
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Tiny read blocks, so that items are split between blocks
+    monkeypatch.setattr(corpus, "READ_BLOCK_SIZE", 7)
+
+
+def write(path, content):
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_iter_json_array_matches_json_load(tmp_path, small_blocks):
+    path = write(tmp_path / "dataset.json", json.dumps(ITEMS, indent=2, ensure_ascii=False))
+    assert list(iter_json_array(path)) == ITEMS
+
+
+def test_iter_json_array_compact_and_empty(tmp_path, small_blocks):
+    assert list(iter_json_array(write(tmp_path / "compact.json", json.dumps(ITEMS)))) == ITEMS
+    assert list(iter_json_array(write(tmp_path / "empty.json", " [ ] "))) == []
+
+
+def test_iter_json_array_rejects_other_json(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path / "object.json", '{"id": 1}')))
+
+
+def test_iter_json_array_rejects_truncated_file(tmp_path, small_blocks):
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path / "truncated.json", json.dumps(ITEMS)[:-20])))
+
+
+def test_iter_dataset_reads_jsonl(tmp_path):
+    path = write(tmp_path / "dataset.jsonl", "\n".join(json.dumps(item) for item in ITEMS) + "\n\n")
+    assert list(iter_dataset(path)) == ITEMS
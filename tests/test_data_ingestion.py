@@ -0,0 +1,150 @@
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+import data_ingestion
+from data_ingestion import diff_hashes, swap_alias, es_create_and_indexing, es_incremental_indexing
+from config import ES_INDEX
+
+
+# Indices API of ElasticSearch in memory: concrete indexes with their _meta and aliases pointing to them
+class FakeIndices:
+    def __init__(self):
+        self.meta = {}
+        self.aliases = {}
+        self.alias_updates = []
+
+    def resolve(self, index):
+        return self.aliases.get(index, [index] if index in self.meta else [])
+
+    def exists(self, index):
+        return bool(self.resolve(index))
+
+    def exists_alias(self, name):
+        return name in self.aliases
+
+    def get_alias(self, name):
+        return {index: {"aliases": {name: {}}} for index in self.aliases[name]}
+
+    def get_mapping(self, index):
+        return {name: {"mappings": {"_meta": dict(self.meta[name])}} for name in self.resolve(index)}
+
+    def put_mapping(self, index, meta):
+        for name in self.resolve(index):
+            self.meta[name] = meta
+
+    def create(self, index, body):
+        self.meta[index] = body["mappings"]["_meta"]
+
+    def delete(self, index, ignore_unavailable=False):
+        self.meta.pop(index, None)
+
+    # All actions are applied together, as one request of ElasticSearch
+    def update_aliases(self, actions):
+        self.alias_updates.append(actions)
+        for action in actions:
+            if "remove_index" in action:
+                del self.meta[action["remove_index"]["index"]]
+            elif "remove" in action:
+                self.aliases[action["remove"]["alias"]].remove(action["remove"]["index"])
+            else:
+                self.aliases.setdefault(action["add"]["alias"], []).append(action["add"]["index"])
+
+
+class FakeElasticsearch:
+    def __init__(self):
+        self.indices = FakeIndices()
+
+
+@pytest.fixture
+def es_client(monkeypatch):
+    versions = iter(range(1, 100))
+    monkeypatch.setattr(data_ingestion, "versioned_index_name", lambda: f"{ES_INDEX}-v{next(versions)}")
+    monkeypatch.setattr(data_ingestion, "dataset_hashes", lambda: {"a": "1", "b": "2"})
+    monkeypatch.setattr(data_ingestion, "embedding_dims", lambda encoding_model: 3)
+    return FakeElasticsearch()
+
+
+def index_into(monkeypatch, failed=0):
+    indexed = []
+
+    def es_bulk_indexing(es_client, actions, index=ES_INDEX):
+        indexed.append(index)
+        return {"failed": failed}
+
+    monkeypatch.setattr(data_ingestion, "index_actions", lambda *args: iter([]))
+    monkeypatch.setattr(data_ingestion, "es_bulk_indexing", es_bulk_indexing)
+    return indexed
+
+
+def test_diff_hashes_finds_new_changed_and_deleted_chunks():
+    changed, deleted = diff_hashes({"a": "1", "b": "2", "c": "3"}, {"a": "1", "b": "old", "d": "4"})
+    assert changed == {"b": "2", "c": "3"}
+    assert deleted == ["d"]
+    assert diff_hashes({"a": "1"}, {"a": "1"}) == ({}, [])
+
+
+def test_rebuild_swaps_the_alias_and_deletes_the_previous_index(es_client, monkeypatch):
+    indexed = index_into(monkeypatch)
+    es_create_and_indexing(es_client, None, "f1")
+    es_create_and_indexing(es_client, None, "f2")
+
+    assert indexed == [f"{ES_INDEX}-v1", f"{ES_INDEX}-v2"]
+    assert es_client.indices.aliases == {ES_INDEX: [f"{ES_INDEX}-v2"]}
+    assert list(es_client.indices.meta) == [f"{ES_INDEX}-v2"]
+    # The alias is moved in one request, the app never sees the index missing
+    assert es_client.indices.alias_updates[-1] == [
+        {"remove": {"index": f"{ES_INDEX}-v1", "alias": ES_INDEX}},
+        {"add": {"index": f"{ES_INDEX}-v2", "alias": ES_INDEX}},
+    ]
+    meta = data_ingestion.index_meta(es_client)
+    assert meta["fingerprint"] == "f2"
+    assert meta["generation"] == 2
+
+
+def test_rebuild_replaces_an_index_created_before_the_aliases(es_client, monkeypatch):
+    index_into(monkeypatch)
+    es_client.indices.meta[ES_INDEX] = {"generation": 5}
+    es_create_and_indexing(es_client, None, "f1")
+
+    assert es_client.indices.alias_updates == [[
+        {"remove_index": {"index": ES_INDEX}},
+        {"add": {"index": f"{ES_INDEX}-v1", "alias": ES_INDEX}},
+    ]]
+    assert data_ingestion.index_meta(es_client)["generation"] == 6
+
+
+def test_incomplete_rebuild_keeps_the_previous_index(es_client, monkeypatch):
+    index_into(monkeypatch)
+    es_create_and_indexing(es_client, None, "f1")
+    index_into(monkeypatch, failed=1)
+    es_create_and_indexing(es_client, None, "f2")
+
+    assert es_client.indices.aliases == {ES_INDEX: [f"{ES_INDEX}-v1"]}
+    assert list(es_client.indices.meta) == [f"{ES_INDEX}-v1"]
+    assert data_ingestion.index_meta(es_client)["fingerprint"] == "f1"
+
+
+def test_changed_mappings_are_rebuilt_instead_of_updated(es_client, monkeypatch):
+    indexed = index_into(monkeypatch)
+    es_client.indices.meta[f"{ES_INDEX}-v0"] = {"mapping_version": 1, "generation": 1}
+    es_client.indices.aliases[ES_INDEX] = [f"{ES_INDEX}-v0"]
+    es_incremental_indexing(es_client, None, "f1")
+
+    assert indexed == [f"{ES_INDEX}-v1"]
+    assert es_client.indices.aliases == {ES_INDEX: [f"{ES_INDEX}-v1"]}
+
+
+def test_unchanged_dataset_is_not_ingested_again(es_client, monkeypatch):
+    es_client.indices.meta[ES_INDEX] = {"fingerprint": "f1"}
+    monkeypatch.setattr(data_ingestion, "INGESTION_MODE", "incremental")
+    monkeypatch.setattr(data_ingestion, "Elasticsearch", lambda hosts: es_client)
+    monkeypatch.setattr(data_ingestion, "dataset_fingerprint", lambda: "f1")
+    monkeypatch.setattr(data_ingestion, "build_keyword_index", lambda fingerprint: None)
+
+    # data_ingestion() logs errors instead of raising them, so the calls are recorded
+    calls = []
+    for name in ["load_encoder", "es_incremental_indexing", "es_create_and_indexing"]:
+        monkeypatch.setattr(data_ingestion, name, lambda *args, name=name: calls.append(name))
+    data_ingestion.data_ingestion()
+    assert calls == []
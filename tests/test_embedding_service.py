@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from embedding_service import MicroBatcher, EmbeddingServer, EmbeddingRequestHandler, RemoteEncoder
+
+DIMS = 4
+
+
+# Encoder which returns the length of every text as its vector and records the batches
+class FakeEncoder:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return DIMS
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False):
+        if self.fail:
+            raise ValueError("encoder failed")
+        self.batches.append((len(texts), batch_size))
+        return np.array([[len(text)] * DIMS for text in texts], dtype=np.float32).reshape(len(texts), DIMS)
+
+
+def expected(texts):
+    return np.array([[len(text)] * DIMS for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def service():
+    # The path of a unix socket is limited to about 100 characters, so it is not in the pytest tmp_path
+    directory = tempfile.mkdtemp(prefix="embedding-service-")
+    socket_path = os.path.join(directory, "service.sock")
+    encoder = FakeEncoder()
+    server = EmbeddingServer(socket_path, EmbeddingRequestHandler)
+    server.batcher = MicroBatcher(encoder, max_batch=8, max_wait_ms=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path, encoder
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(directory)
+
+
+def test_micro_batcher_splits_large_requests():
+    encoder = FakeEncoder()
+    batcher = MicroBatcher(encoder, max_batch=8, max_wait_ms=1)
+    texts = ["x" * i for i in range(20)]
+    assert np.array_equal(batcher.encode(texts), expected(texts))
+    assert all(size <= 8 and batch_size == 8 for size, batch_size in encoder.batches)
+
+
+def test_micro_batcher_merges_concurrent_requests():
+    encoder = FakeEncoder()
+    batcher = MicroBatcher(encoder, max_batch=64, max_wait_ms=200)
+    results = {}
+
+    def encode(i):
+        results[i] = batcher.encode(["y" * i])
+
+    threads = [threading.Thread(target=encode, args=(i,)) for i in range(1, 6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(np.array_equal(results[i], expected(["y" * i])) for i in range(1, 6))
+    assert len(encoder.batches) < 5
+
+
+def test_micro_batcher_returns_errors_to_every_request():
+    batcher = MicroBatcher(FakeEncoder(fail=True), max_batch=8, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.encode(["a", "b"])
+
+
+def test_remote_encoder_round_trip(service):
+    socket_path, encoder = service
+    remote = RemoteEncoder(socket_path)
+    assert remote.get_sentence_embedding_dimension() == DIMS
+
+    texts = ["a" * i for i in range(1, 30)]
+    assert np.array_equal(remote.encode(texts, batch_size=10), expected(texts))
+    assert np.array_equal(remote.encode("hello"), expected(["hello"])[0])
+    assert remote.encode([]).shape == (0, DIMS)
+    # Bulk calls are sent in requests of batch_size texts, the service splits them into max_batch chunks
+    assert max(size for size, _ in encoder.batches) <= 8
+
+
+def test_remote_encoder_reports_service_errors(service):
+    socket_path, encoder = service
+    remote = RemoteEncoder(socket_path)
+    encoder.fail = True
+    with pytest.raises(RuntimeError, match="encoder failed"):
+        remote.encode(["a"])
+    encoder.fail = False
+    assert np.array_equal(remote.encode(["abc"]), expected(["abc"]))
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+import embedding_store
+from embedding_store import EmbeddingStore, text_key, prune_stale_stores
+
+MODEL = "test-model"
+DIMS = 4
+
+
+def keys(*texts):
+    return [text_key(MODEL, text) for text in texts]
+
+
+def vectors(*values):
+    return np.array([[value] * DIMS for value in values], dtype=np.float32)
+
+
+def test_get_many_returns_stored_vectors_and_the_missing_mask(tmp_path):
+    store = EmbeddingStore(str(tmp_path), MODEL, DIMS, max_entries=10)
+    store.put_many(keys("a", "b"), vectors(1, 2))
+    found_vectors, found = store.get_many(keys("b", "c", "a"))
+    assert found.tolist() == [True, False, True]
+    assert found_vectors[[0, 2], 0].tolist() == [2, 1]
+    # The same text with other whitespace has the same key
+    assert store.get_many(keys(" a\n"))[1].tolist() == [True]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = EmbeddingStore(str(tmp_path), MODEL, DIMS, max_entries=2)
+    store.put_many(keys("a"), vectors(1))
+    time.sleep(0.01)
+    store.put_many(keys("b"), vectors(2))
+    time.sleep(0.01)
+    store.get_many(keys("a"))
+    time.sleep(0.01)
+    store.put_many(keys("c"), vectors(3))
+    assert store.get_many(keys("a", "b", "c"))[1].tolist() == [True, False, True]
+
+
+def test_existing_store_keeps_its_capacity(tmp_path):
+    EmbeddingStore(str(tmp_path), MODEL, DIMS, max_entries=3).put_many(keys("a"), vectors(1))
+    # Another process configured with another capacity opens the same files instead of re-creating them
+    store = EmbeddingStore(str(tmp_path), MODEL, DIMS, max_entries=100)
+    assert store.max_entries == 3
+    assert store.get_many(keys("a"))[1].tolist() == [True]
+    with open(tmp_path / "meta.json") as file:
+        assert json.load(file)["max_entries"] == 3
+
+
+def put_texts(path, prefix, count):
+    store = EmbeddingStore(path, MODEL, DIMS, max_entries=1000)
+    for i in range(count):
+        store.put_many(keys(f"{prefix} {i}"), vectors(i))
+
+
+def test_processes_writing_at_the_same_time_keep_all_entries(tmp_path):
+    EmbeddingStore(str(tmp_path), MODEL, DIMS, max_entries=1000)
+    context = mp.get_context("spawn")
+    processes = [context.Process(target=put_texts, args=(str(tmp_path), prefix, 200)) for prefix in ["x", "y"]]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0, 0]
+
+    store = EmbeddingStore(str(tmp_path), MODEL, DIMS, max_entries=1000)
+    found_vectors, found = store.get_many(keys(*[f"{prefix} {i}" for prefix in ["x", "y"] for i in range(200)]))
+    assert found.all()
+    assert found_vectors[:, 0].tolist() == list(range(200)) * 2
+
+
+def test_stale_stores_of_other_encoders_are_pruned(tmp_path):
+    current = tmp_path / "current"
+    EmbeddingStore(str(current), MODEL, DIMS, max_entries=10)
+    stale = tmp_path / "stale"
+    EmbeddingStore(str(stale), "old-model", DIMS, max_entries=10)
+    recent = tmp_path / "recent"
+    EmbeddingStore(str(recent), "other-model", DIMS, max_entries=10)
+    old_time = time.time() - 40 * 24 * 3600
+    for store_path in [current, stale]:
+        for name in os.listdir(store_path):
+            os.utime(store_path / name, (old_time, old_time))
+
+    prune_stale_stores(str(tmp_path), str(current), max_age_days=30)
+    assert sorted(os.listdir(tmp_path)) == ["current", "recent"]
+    prune_stale_stores(str(tmp_path), str(current), max_age_days=0)
+    assert sorted(os.listdir(tmp_path)) == ["current", "recent"]
+
+
+def test_get_embedding_store_returns_one_store_per_encoder(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "EMBEDDING_CACHE_PATH", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "stores", {})
+    monkeypatch.setattr(embedding_store, "embedding_store_path",
+                        lambda model_name, dims: os.path.join(str(tmp_path), f"{model_name}__{dims}d"))
+    store = embedding_store.get_embedding_store(MODEL, DIMS)
+    assert embedding_store.get_embedding_store(MODEL, DIMS) is store
+    assert embedding_store.get_embedding_store(MODEL, DIMS + 1) is not store
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+import es
+from es import rrf_fuse
+
+
+def hits(*ids):
+    return [{"_id": doc_id, "_source": {"id": doc_id}} for doc_id in ids]
+
+
+def test_rrf_fuse_prefers_documents_found_by_both_legs():
+    docs = rrf_fuse([hits("a", "b", "c"), hits("c", "d")], [1.0, 1.0], rank_constant=60, num_results=3)
+    assert [doc["id"] for doc in docs] == ["c", "a", "b"]
+
+
+def test_rrf_fuse_weights_and_limit():
+    docs = rrf_fuse([hits("a", "b"), hits("b", "a")], [1.0, 3.0], rank_constant=1, num_results=1)
+    assert [doc["id"] for doc in docs] == ["b"]
+    assert rrf_fuse([[], []], [1.0, 1.0]) == []
+
+
+def test_in_process_vector_search_runs_outside_the_event_loop(monkeypatch):
+    threads = []
+
+    def vector_search(query_vector, playlist, num_results=5):
+        threads.append(threading.get_ident())
+        return [{"id": "a"}]
+
+    monkeypatch.setattr(es, "VECTOR_SEARCH_BACKEND", "numpy")
+    monkeypatch.setattr(es, "vector_search", vector_search)
+    assert asyncio.run(es.async_vector_search([1.0], "playlist")) == [{"id": "a"}]
+    assert threads and threads[0] != threading.get_ident()
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import evaluation_queue
+from evaluation_queue import EvaluationQueue, EVALUATING_RELEVANCE
+from rag import PENDING_RELEVANCE
+
+
+# Conversations table of the database in memory, with the claim semantics of db.py
+class FakeConversations:
+    def __init__(self, **relevance):
+        self.lock = threading.Lock()
+        self.rows = {conversation_id: {"relevance": value, "question": f"q {conversation_id}",
+                                       "answer": f"a {conversation_id}"}
+                     for conversation_id, value in relevance.items()}
+        self.updates = []
+        self.evaluated = threading.Event()
+
+    def claim_conversation(self, conversation_id, pending, evaluating):
+        with self.lock:
+            if self.rows[conversation_id]["relevance"] != pending:
+                return False
+            self.rows[conversation_id]["relevance"] = evaluating
+            return True
+
+    def claim_pending_conversations(self, pending, evaluating, min_age_seconds, claim_timeout_seconds, limit):
+        with self.lock:
+            claimed = [conversation_id for conversation_id, row in self.rows.items()
+                       if row["relevance"] == pending][:limit]
+            for conversation_id in claimed:
+                self.rows[conversation_id]["relevance"] = evaluating
+            return [{"id": conversation_id, **self.rows[conversation_id]} for conversation_id in claimed]
+
+    def release_conversation(self, conversation_id, pending, evaluating):
+        with self.lock:
+            if self.rows[conversation_id]["relevance"] == evaluating:
+                self.rows[conversation_id]["relevance"] = pending
+
+    def update_conversation_evaluation(self, conversation_id, relevance, explanation, eval_tokens):
+        with self.lock:
+            self.rows[conversation_id]["relevance"] = relevance
+            self.updates.append((conversation_id, relevance, explanation))
+            if all(row["relevance"] not in (PENDING_RELEVANCE, EVALUATING_RELEVANCE) for row in self.rows.values()):
+                self.evaluated.set()
+
+
+# Worker threads of a test queue keep running, they must not requeue from the real database later
+def stop_requeue(evaluations):
+    with evaluations.requeue_lock:
+        evaluations.next_requeue = float("inf")
+
+
+@pytest.fixture
+def database(monkeypatch):
+    def install(**relevance):
+        conversations = FakeConversations(**relevance)
+        for name in ["claim_conversation", "claim_pending_conversations", "release_conversation",
+                     "update_conversation_evaluation"]:
+            monkeypatch.setattr(evaluation_queue, name, getattr(conversations, name))
+        monkeypatch.setattr(evaluation_queue, "rag_evaluation",
+                            lambda question, answer: ("RELEVANT", f"explained {question}", {"total_tokens": 1}))
+        return conversations
+    return install
+
+
+def test_pending_conversations_are_claimed_and_evaluated_on_start(database):
+    conversations = database(c1=PENDING_RELEVANCE, c2=PENDING_RELEVANCE, c3="RELEVANT")
+    evaluations = EvaluationQueue(workers=2, requeue_interval=0.05)
+    assert conversations.evaluated.wait(5)
+    stop_requeue(evaluations)
+    assert sorted(update[0] for update in conversations.updates) == ["c1", "c2"]
+
+
+def test_conversation_claimed_by_another_process_is_not_evaluated(database):
+    conversations = database(c1=EVALUATING_RELEVANCE)
+    evaluations = EvaluationQueue(workers=1, requeue_interval=60)
+    assert evaluations.submit("c1", "q", "a")
+    evaluations.jobs.join()
+    stop_requeue(evaluations)
+    assert conversations.updates == []
+
+
+def test_conversations_left_by_a_full_queue_are_requeued_periodically(database):
+    conversations = database(c1=PENDING_RELEVANCE, c2=PENDING_RELEVANCE, c3=PENDING_RELEVANCE)
+    evaluations = EvaluationQueue(workers=0, queue_size=1, requeue_interval=0.05)
+    evaluations.requeue_pending()
+    # Only one conversation fits into the queue, the others are not claimed
+    assert evaluations.jobs.qsize() == 1
+    assert sum(row["relevance"] == PENDING_RELEVANCE for row in conversations.rows.values()) == 2
+    # Workers take the queued conversation and claim the others in the next requeue runs
+    for _ in range(2):
+        threading.Thread(target=evaluations.worker, daemon=True).start()
+    assert conversations.evaluated.wait(5)
+    stop_requeue(evaluations)
+    assert sorted(update[0] for update in conversations.updates) == ["c1", "c2", "c3"]
+
+
+def test_failed_evaluation_is_retried(database, monkeypatch):
+    conversations = database(c1=PENDING_RELEVANCE)
+    results = iter([RuntimeError("rate limit"), ("UNKNOWN", "", {}), ("RELEVANT", "ok", {})])
+
+    def rag_evaluation(question, answer):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(evaluation_queue, "rag_evaluation", rag_evaluation)
+    evaluations = EvaluationQueue(workers=0, retry_backoff=0)
+    evaluations.evaluate("c1", "q", "a")
+    assert conversations.updates == [("c1", "RELEVANT", "ok")]
+
+
+def test_evaluation_is_saved_as_unknown_after_the_last_retry(database, monkeypatch):
+    conversations = database(c1=PENDING_RELEVANCE)
+
+    def rag_evaluation(question, answer):
+        raise RuntimeError("rate limit")
+
+    monkeypatch.setattr(evaluation_queue, "rag_evaluation", rag_evaluation)
+    evaluations = EvaluationQueue(workers=0, max_retries=2, retry_backoff=0)
+    evaluations.evaluate("c1", "q", "a")
+    assert conversations.updates == [("c1", "UNKNOWN", "Evaluation failed: rate limit")]
@@ -0,0 +1,14 @@
+import index_profiles
+from index_profiles import VECTOR_INDEX_PROFILES, vector_index_profile, profile_signature
+
+
+def test_overrides_apply_to_the_app_profile_only(monkeypatch):
+    monkeypatch.setattr(index_profiles, "VECTOR_HNSW_M", 32)
+    monkeypatch.setattr(index_profiles, "VECTOR_INDEXED_FIELDS", ["text_vector", "video_vector"])
+    assert vector_index_profile("text_int8_small")["m"] == 32
+    assert vector_index_profile("text_int8_small")["indexed_fields"] == ["text_vector", "video_vector"]
+
+    raw_profiles = [vector_index_profile(name, overrides=False) for name in VECTOR_INDEX_PROFILES]
+    assert [profile["m"] for profile in raw_profiles] == [16, 16, 16, 8]
+    # Every profile of the benchmark builds a different index
+    assert len({profile_signature(profile) for profile in raw_profiles}) == len(VECTOR_INDEX_PROFILES)
@@ -0,0 +1,108 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from elasticsearch import ApiError
+
+import indexing
+from indexing import bulk_batches, send_batch, bulk_index, disable_refresh_and_replicas, restore_refresh_and_replicas
+
+
+class FakeSerializer:
+    def dumps(self, data):
+        return json.dumps(data).encode()
+
+
+# Bulk API of ElasticSearch: every request is answered by the next function of the script with the ids
+# of its documents (the last function answers all later requests), requests are recorded
+class FakeElasticsearch:
+    def __init__(self, *script):
+        self.script = list(script)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.transport = SimpleNamespace(serializers=SimpleNamespace(get_serializer=lambda mimetype: FakeSerializer()))
+        self.settings = {"index.refresh_interval": "5s", "index.number_of_replicas": "1"}
+        self.indices = SimpleNamespace(
+            get_settings=lambda index, flat_settings: {f"{index}-v1": {"settings": dict(self.settings)}},
+            put_settings=self.put_settings,
+            refresh=lambda index: self.requests.append(("refresh", index)),
+        )
+
+    def bulk(self, operations):
+        ids = [json.loads(line)["index"]["_id"] for line in operations if b'"index"' in line]
+        with self.lock:
+            self.requests.append(ids)
+            respond = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        return respond(ids)
+
+    def put_settings(self, index, settings):
+        self.settings.update({f"index.{key}": value for key, value in settings["index"].items()})
+
+
+def statuses(**status_by_id):
+    return lambda ids: {"items": [{"index": {"_id": doc_id, "status": status_by_id.get(doc_id, 201)}} for doc_id in ids]}
+
+
+def too_many_requests(ids):
+    raise ApiError("rejected", SimpleNamespace(status=429), None)
+
+
+def server_error(ids):
+    raise ApiError("failed", SimpleNamespace(status=500), None)
+
+
+def actions(count):
+    return [({"index": {"_index": "test", "_id": str(i)}}, {"text": "x" * 10}) for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(indexing.time, "sleep", lambda seconds: None)
+
+
+def test_batches_are_limited_by_docs_and_bytes():
+    client = FakeElasticsearch(statuses())
+    assert [len(batch) for batch in bulk_batches(client, actions(5), max_docs=2, max_bytes=10**6)] == [2, 2, 1]
+    action_bytes = sum(len(line) + 1 for line in next(bulk_batches(client, actions(1)))[0])
+    assert [len(batch) for batch in bulk_batches(client, actions(5), max_docs=100, max_bytes=action_bytes * 3)] == [3, 2]
+
+
+def test_documents_rejected_with_429_are_retried():
+    client = FakeElasticsearch(statuses(**{"1": 429}), statuses())
+    stats = send_batch(client, next(bulk_batches(client, actions(3))), max_retries=2, initial_backoff=0)
+    assert stats == {"indexed": 3, "failed": 0, "retried": 1}
+    assert client.requests == [["0", "1", "2"], ["1"]]
+
+
+def test_whole_request_rejected_with_429_is_retried():
+    client = FakeElasticsearch(too_many_requests, statuses())
+    stats = send_batch(client, next(bulk_batches(client, actions(2))), max_retries=2, initial_backoff=0)
+    assert stats == {"indexed": 2, "failed": 0, "retried": 2}
+
+
+def test_documents_fail_after_the_last_retry():
+    client = FakeElasticsearch(statuses(**{"0": 429, "1": 400}))
+    stats = send_batch(client, next(bulk_batches(client, actions(2))), max_retries=2, initial_backoff=0)
+    assert stats == {"indexed": 0, "failed": 2, "retried": 2}
+    assert client.requests == [["0", "1"], ["0"], ["0"]]
+
+
+def test_bulk_index_counts_failed_requests_and_keeps_going():
+    client = FakeElasticsearch(statuses(), server_error, too_many_requests, statuses())
+    stats = bulk_index(client, actions(6), max_docs=2, max_in_flight=1)
+    # The second request fails (it is not retried), the third one is retried after 429
+    assert stats == {"indexed": 4, "failed": 2, "retried": 2}
+    assert client.requests == [["0", "1"], ["2", "3"], ["4", "5"], ["4", "5"]]
+
+
+def test_refresh_and_replicas_are_restored_after_loading():
+    client = FakeElasticsearch(statuses())
+    previous_settings = disable_refresh_and_replicas(client, "test")
+    assert client.settings == {"index.refresh_interval": "-1", "index.number_of_replicas": 0}
+    restore_refresh_and_replicas(client, "test", previous_settings)
+    assert client.settings == {"index.refresh_interval": "5s", "index.number_of_replicas": "1"}
+    assert client.requests == [("refresh", "test")]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import numpy_search
+from numpy_search import build_numpy_index
+
+SOURCE_FIELDS = ["id", "text", "playlist"]
+
+
+# Chunks of the pre-embedded corpus: the vector points to the direction of the chunk
+def corpus_chunk(chunk_id, playlist, vector):
+    return {"id": chunk_id, "text": f"text {chunk_id}", "playlist": playlist,
+            "text_vector": np.array(vector, dtype=np.float32)}
+
+
+@pytest.fixture
+def build_index(tmp_path, monkeypatch):
+    def build(chunks, **kwargs):
+        source_path = tmp_path / "vectors.npy"
+        source_path.write_bytes(b"")
+        monkeypatch.setattr(numpy_search, "corpus_is_available", lambda: True)
+        monkeypatch.setattr(numpy_search, "corpus_files", lambda path: (None, str(source_path), None))
+        monkeypatch.setattr(numpy_search, "iter_corpus", lambda path: iter(chunks))
+        return build_numpy_index(None, SOURCE_FIELDS, **kwargs)
+    return build
+
+
+CHUNKS = [
+    corpus_chunk("a1", "A", [1, 0, 0]),
+    corpus_chunk("b1", "B", [1, 0, 0]),
+    corpus_chunk("a2", "A", [1, 1, 0]),
+    corpus_chunk("a3", "A", [0, 0, 5]),
+    corpus_chunk("b2", "B", [0, 1, 0]),
+]
+
+
+def test_search_returns_top_k_of_the_playlist_by_cosine_similarity(build_index):
+    index = build_index(CHUNKS)
+    docs = index.search([2, 0, 0], "A", num_results=2)
+    assert [doc["id"] for doc in docs] == ["a1", "a2"]
+    assert docs[0] == {"id": "a1", "text": "text a1", "playlist": "A"}
+    # The vector length doesn't matter, only the direction
+    assert [doc["id"] for doc in index.search([0, 0, 1], "A", num_results=1)] == ["a3"]
+
+
+def test_search_never_returns_documents_of_other_playlists(build_index):
+    index = build_index(CHUNKS)
+    assert [doc["id"] for doc in index.search([1, 0, 0], "B", num_results=10)] == ["b1", "b2"]
+    assert index.search([1, 0, 0], "C") == []
+
+
+def test_duplicated_ids_keep_the_last_chunk(build_index):
+    index = build_index(CHUNKS + [corpus_chunk("a1", "B", [0, 1, 1])])
+    assert [doc["id"] for doc in index.search([1, 0, 0], "A", num_results=10)] == ["a2", "a3"]
+    assert [doc["id"] for doc in index.search([0, 1, 0], "B", num_results=2)] == ["b2", "a1"]
+
+
+def test_memory_mapped_index_gives_the_same_results(build_index, tmp_path):
+    index = build_index(CHUNKS, use_mmap=True, mmap_path=str(tmp_path / "index.npy"))
+    assert isinstance(index.matrix, np.memmap)
+    assert [doc["id"] for doc in index.search([1, 0.1, 0], "A", num_results=3)] == ["a1", "a2", "a3"]
+
+
+def test_empty_corpus_is_an_error(build_index):
+    with pytest.raises(ValueError):
+        build_index([])
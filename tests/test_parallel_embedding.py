@@ -0,0 +1,82 @@
+import os
+import time
+import itertools
+
+import numpy as np
+import pytest
+
+import parallel_embedding
+from parallel_embedding import EmbeddingWorkerPool, parallel_embed
+
+DIMS = 3
+
+
+# Encoder of the worker processes: the vector of a text is its length, the text "exit" kills the worker
+class FakeEncoder:
+    def get_sentence_embedding_dimension(self):
+        return DIMS
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False):
+        if "exit" in texts:
+            os._exit(3)
+        if "fail" in texts:
+            raise ValueError("encoder failed")
+        return np.array([[len(text)] * DIMS for text in texts], dtype=np.float32).reshape(len(texts), DIMS)
+
+
+# Called in the spawned workers instead of encoders.load_encoder (it is imported from this module by name)
+def load_fake_encoder(backend, model_name, threads):
+    return FakeEncoder()
+
+
+def chunk(i, text=None):
+    return {"id": str(i), "text": text or "x" * (i + 1), "video": f"video {i % 3}"}
+
+
+def batches(chunks, size):
+    return [chunks[i:i + size] for i in range(0, len(chunks), size)]
+
+
+@pytest.fixture(autouse=True)
+def fast_worker_checks(monkeypatch):
+    monkeypatch.setattr(parallel_embedding, "WORKER_CHECK_INTERVAL", 0.2)
+
+
+def test_every_chunk_is_embedded_once_with_its_own_vectors():
+    chunks = [chunk(i) for i in range(40)]
+    embedded = [doc for batch in parallel_embed(batches(chunks, 4), workers=2, use_cache=False,
+                                                encoder_loader=load_fake_encoder) for doc in batch]
+    # Batches come back in the order they are finished, not in the input order
+    assert sorted(doc["id"] for doc in embedded) == sorted(doc["id"] for doc in chunks)
+    for doc in embedded:
+        assert doc["text_vector"].tolist() == [len(doc["text"])] * DIMS
+        assert doc["video_vector"].tolist() == [len(doc["video"])] * DIMS
+        assert doc["text_video_vector"].tolist() == [len(doc["text"] + doc["video"])] * DIMS
+
+
+def test_pool_reports_the_vector_size_of_the_workers():
+    pool = EmbeddingWorkerPool(2, use_cache=False, encoder_loader=load_fake_encoder)
+    try:
+        assert pool.get_sentence_embedding_dimension() == DIMS
+    finally:
+        pool.close()
+    assert not any(process.is_alive() for process in pool.processes)
+
+
+def test_worker_error_stops_the_pool_and_the_feeder():
+    # An endless stream of batches: the feeder would wait forever for the stopped workers
+    endless = ([chunk(i, "fail" if i == 5 else None)] for i in itertools.count())
+    pool = EmbeddingWorkerPool(2, use_cache=False, encoder_loader=load_fake_encoder)
+    start_time = time.perf_counter()
+    with pytest.raises(RuntimeError, match="encoder failed"):
+        for _ in pool.embed(endless):
+            pass
+    assert time.perf_counter() - start_time < 30
+    assert not any(process.is_alive() for process in pool.processes)
+
+
+def test_dead_worker_is_reported():
+    chunks = [chunk(i, "exit" if i == 3 else None) for i in range(8)]
+    with pytest.raises(RuntimeError, match="died"):
+        for _ in parallel_embed(batches(chunks, 1), workers=2, use_cache=False, encoder_loader=load_fake_encoder):
+            pass
@@ -0,0 +1,52 @@
+from passages import merge_overlapping_text, collapse_passages
+
+WORDS = [f"w{i}" for i in range(30)]
+
+
+def window(doc_id, start, first_word, video="v1"):
+    return {
+        "id": doc_id,
+        "text": " ".join(WORDS[first_word:first_word + 12]),
+        "video": f"Video {video}",
+        "youtube_video_id": video,
+        "youtube_link": f"https://youtu.be/{video}?t={start}",
+        "start_time": str(start),
+    }
+
+
+def test_merge_overlapping_text_removes_the_overlap():
+    first, second = " ".join(WORDS[0:12]), " ".join(WORDS[4:16])
+    assert merge_overlapping_text(first, second) == " ".join(WORDS[0:16])
+
+
+def test_merge_overlapping_text_contained_and_disjoint():
+    assert merge_overlapping_text(" ".join(WORDS[0:20]), " ".join(WORDS[4:12])) == " ".join(WORDS[0:20])
+    assert merge_overlapping_text("a b c", "x y z") == "a b c ... x y z"
+    assert merge_overlapping_text("a b c", "") == "a b c"
+
+
+def test_collapse_merges_neighbour_windows_of_the_same_video():
+    docs = [window("b", 10, 4), window("a", 0, 0), window("c", 20, 8)]
+    passages = collapse_passages(docs, max_gap=15)
+    assert len(passages) == 1
+    passage = passages[0]
+    # The best ranked id is kept, the text and the time range cover all the windows
+    assert passage["id"] == "b"
+    assert passage["merged_ids"] == ["a", "b", "c"]
+    assert passage["text"] == " ".join(WORDS[0:20])
+    assert passage["time_range"] == [0.0, 20.0]
+    assert passage["youtube_link"].endswith("t=0")
+
+
+def test_collapse_keeps_distant_windows_and_other_videos_apart():
+    docs = [window("a", 0, 0), window("b", 500, 4), window("c", 5, 4, video="v2")]
+    passages = collapse_passages(docs, max_gap=60)
+    assert [passage["id"] for passage in passages] == ["a", "b", "c"]
+    assert all("merged_ids" not in passage for passage in passages)
+
+
+def test_collapse_joins_groups_bridged_by_a_later_hit():
+    docs = [window("a", 0, 0), window("c", 40, 8), window("b", 20, 4), window("x", 0, 0, video="v2")]
+    passages = collapse_passages(docs, max_gap=25, num_results=1)
+    assert len(passages) == 1
+    assert passages[0]["merged_ids"] == ["a", "b", "c"]
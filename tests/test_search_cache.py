@@ -0,0 +1,64 @@
+import time
+
+from search_cache import MemoryCacheStore, SQLiteCacheStore, GenerationWatcher
+
+
+def test_memory_store_evicts_by_size():
+    store = MemoryCacheStore(max_bytes=10)
+    store.put("a", "12345", 60)
+    store.put("b", "12345", 60)
+    assert store.get("a") == "12345"
+    store.put("c", "123", 60)
+    assert store.get("b") is None
+    assert store.get("a") == "12345" and store.get("c") == "123"
+    assert store.total_bytes == 8
+
+
+def test_memory_store_expires_entries(monkeypatch):
+    store = MemoryCacheStore(max_bytes=100)
+    store.put("a", "value", 10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert store.get("a") is None
+    assert store.total_bytes == 0
+
+
+def test_generation_watcher_calls_on_change():
+    generations = iter([1, 1, 2])
+    changes = []
+    watcher = GenerationWatcher(lambda: next(generations), changes.append, check_interval=0)
+    assert [watcher.generation() for _ in range(3)] == [1, 1, 2]
+    assert changes == [2]
+
+
+def test_generation_watcher_keeps_generation_on_errors():
+    def failing_generation():
+        raise ConnectionError("Elasticsearch is down")
+
+    watcher = GenerationWatcher(failing_generation, lambda generation: None, check_interval=0)
+    watcher.current_generation = 5
+    assert watcher.generation() == 5
+
+
+def test_sqlite_store_evicts_least_recently_used_every_interval(tmp_path, monkeypatch):
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite"), max_bytes=10, evict_interval=3)
+    now = time.time()
+    for i, key in enumerate(["a", "b"]):
+        monkeypatch.setattr(time, "time", lambda i=i: now + i)
+        store.put(key, "12345", 60)
+    monkeypatch.setattr(time, "time", lambda: now + 2)
+    assert store.get("a") == "12345"
+    # The third put goes over the size limit and triggers the eviction: "b" is the least recently used
+    monkeypatch.setattr(time, "time", lambda: now + 3)
+    store.put("c", "123", 60)
+    assert store.get("b") is None
+    assert store.get("a") == "12345" and store.get("c") == "123"
+
+
+def test_sqlite_store_keeps_entries_between_evictions(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite"), max_bytes=5, evict_interval=100)
+    store.put("a", "12345", 60)
+    store.put("b", "12345", 60)
+    assert store.get("a") == "12345" and store.get("b") == "12345"
+    store.evict(time.time())
+    assert [store.get("a"), store.get("b")].count(None) == 1